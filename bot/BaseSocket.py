@@ -22,96 +22,184 @@
 #* The author can be reached at admin@atrinik.org                        *
 #*************************************************************************
 
+
 ## @file
 ## Base socket class other socket-using classes inherit from.
 
-import time, socket, threading
+import errno, time, socket
+from CommandScheduler import *
+
+## Errors that mean a non-blocking socket operation has to be retried later.
+_RETRY_ERRNOS = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINPROGRESS, errno.EINTR)
 
 ## The base socket class; implements generic socket code.
+##
+## The socket is non-blocking and driven by an EventLoop: incoming data is
+## handled by handle_data() as soon as it arrives, and outgoing data is
+## buffered until the socket can take it.
 class BaseSocket:
     ## Initializes the base socket.
-    def __init__(self):
-        ts = time.time()
-        self._reconnect = 0
-        self._command_queue = []
-        self._command_queue_stamp = ts
-        self._command_queue_lock = threading.RLock()
+    ## @param loop EventLoop instance to run the socket in.
+    def __init__(self, loop):
+        self.loop = loop
+        self.socket = None
+        self._connected = False
+        self._writebuf = bytearray()
+        self._reconnect_timer = None
+        self._command_queue = CommandScheduler(self.config.getfloat("General", "queue_target_rate"), self.config.getint("General", "queue_target_burst"))
+        self._command_queue_timer = None
         self._connect()
 
-    ## Connect to a server.
+    ## Connect to a server. The connection is completed in
+    ## ::_handle_connect once the socket becomes writable.
     def _connect(self):
+        self._reconnect_timer = None
         # Create the socket.
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setblocking(False)
 
         # Try to connect.
         try:
-            self.socket.connect((self.host, self.port))
+            err = self.socket.connect_ex((self.host, self.port))
+        except socket.error as e:
+            err = e.args[0]
+
         # Failed, try to reconnect later.
-        except socket.error:
-            self.disconnect()
-            print("{0}@{1}:{2} could not connect, marking for reconnect.".format(self.name, self.host, self.port))
-            self._reconnect = time.time() + self.config.getfloat(self.section, "reconnect_timeout")
+        if err and err not in _RETRY_ERRNOS:
+            self._connect_failed()
             return False
 
+        self.loop.add_writer(self.socket, self._handle_connect)
+        return True
+
+    ## Called when the socket becomes writable after ::_connect.
+    def _handle_connect(self):
+        self.loop.remove_writer(self.socket)
+
+        if self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR):
+            self._connect_failed()
+            return
+
+        self._connected = True
+        self.loop.add_reader(self.socket, self.handle_data)
+
         # Do custom post-connect code.
         self._post_connect()
+        # Send any commands that were queued while disconnected.
+        self._command_queue_schedule()
 
-        return True
+    ## Connecting failed, try to reconnect later.
+    def _connect_failed(self):
+        self.disconnect()
+        print("{0}@{1}:{2} could not connect, marking for reconnect.".format(self.name, self.host, self.port))
+        self._schedule_reconnect()
+
+    ## Schedule a reconnection attempt.
+    def _schedule_reconnect(self):
+        self._reconnect_timer = self.loop.call_later(self.config.getfloat(self.section, "reconnect_timeout"), self._connect)
 
     ## Post-connect function, called after a connection has been established
-    ## successfully in ::_connect.
+    ## successfully in ::_handle_connect.
     def _post_connect(self):
         pass
 
+    ## Check whether the socket is connected.
+    ## @return True if connected, False otherwise.
+    def is_connected(self):
+        return self._connected
+
     ## Disconnects the socket.
     def disconnect(self):
+        if self.socket is None:
+            return
+
+        self.loop.remove_reader(self.socket)
+        self.loop.remove_writer(self.socket)
         self.socket.close()
+        self.socket = None
+        self._connected = False
+        del self._writebuf[:]
 
     ## Closes the class. Should be called eventually.
     def close(self):
+        if self._reconnect_timer:
+            self.loop.cancel(self._reconnect_timer)
+            self._reconnect_timer = None
+
+        if self._command_queue_timer:
+            self.loop.cancel(self._command_queue_timer)
+            self._command_queue_timer = None
+
         self.disconnect()
 
     ## Mark this socket for reconnection.
     def _mark_reconnect(self):
         self.disconnect()
         print("{0}@{1}:{2} has been disconnected from server, marking for reconnect.".format(self.name, self.host, self.port))
-        self._reconnect = time.time() + self.config.getfloat(self.section, "reconnect_timeout")
-
-    ## Handles reconnection, if possible.
-    ## @return True if we are (re-)connected to a server and can do data
-    ## receiving/sending/handling/etc, False otherwise.
-    def handle_reconnect(self):
-        if self._reconnect:
-            if time.time() >= self._reconnect:
-                self._reconnect = 0
-
-                if not self._connect():
-                    return False
+        self._schedule_reconnect()
+
+    ## Queue data to be sent to the server, and send as much of it as the
+    ## socket will take right away.
+    ## @param data The data.
+    def write(self, data):
+        if not self._connected:
+            return
+
+        self._writebuf += data
+
+        if len(self._writebuf) == len(data):
+            self._handle_write()
+
+    ## Send buffered data to the server.
+    def _handle_write(self):
+        try:
+            sent = self.socket.send(self._writebuf)
+        except socket.error as e:
+            if e.args[0] in _RETRY_ERRNOS:
+                sent = 0
             else:
-                return False
+                self._mark_reconnect()
+                return
 
-        return True
+        del self._writebuf[:sent]
+
+        if self._writebuf:
+            self.loop.add_writer(self.socket, self._handle_write)
+        else:
+            self.loop.remove_writer(self.socket)
+
+    ## Schedule handling of the command queue for when the next command may
+    ## be sent, if there is anything in it.
+    def _command_queue_schedule(self):
+        if not self._connected:
+            return
 
-    ## Handle the command queue. The queue is a list that has items added to
-    ## the end, and when the time comes (in this function), the first element
-    ## is removed from the list and sent to the server.
+        when = self._command_queue.next_time(time.time())
+
+        if when is None:
+            return
+
+        # Already scheduled early enough.
+        if self._command_queue_timer:
+            if self._command_queue_timer[0] <= when:
+                return
+
+            self.loop.cancel(self._command_queue_timer)
+
+        self._command_queue_timer = self.loop.call_at(when, self._command_queue_handle)
+
+    ## Handle the command queue: send the command the scheduler picks, if
+    ## any may be sent yet.
     def _command_queue_handle(self):
-        ts = time.time()
+        self._command_queue_timer = None
 
-        # Acquire lock.
-        self._command_queue_lock.acquire()
+        if self._connected:
+            cmd = self._command_queue.pop(time.time())
 
-        # Anything in the queue, and has enough time passed yet?
-        if self._command_queue and ts >= self._command_queue_stamp:
-            # Remove the first element.
-            (cmd, delay) = self._command_queue.pop(0)
-            # Handle the command.
-            self._command_queue_handler(cmd)
-            # Update the time that must pass until we can send another
-            # command in this queue.
-            self._command_queue_stamp = ts + delay
+            if cmd is not None:
+                self._command_queue_handler(cmd)
 
-        self._command_queue_lock.release()
+        self._command_queue_schedule()
 
     ## Queue command handler. By default, the command is sent to the server
     ## as-is.
@@ -120,21 +208,27 @@ class BaseSocket:
         if type(cmd) != type(bytes()):
             cmd = cmd.encode()
 
-        self.socket.send(cmd)
+        self.write(cmd)
 
-    ## Add a command to the command queue.
+    ## Add a command to the command queue. May be called from any thread.
     ## @param cmd The command to add.
     ## @param delay Integer or float delay that must pass before the next
     ## added command may be executed.
-    def command_queue_add(self, cmd, delay):
-        self._command_queue_lock.acquire()
-        self._command_queue.append((cmd, delay))
-        self._command_queue_lock.release()
-
-    ## Handle socket data.
+    ## @param priority Priority of the command, one of the PRIORITY_xxx
+    ## constants from CommandScheduler.
+    ## @param target Target of the command, used to limit the rate of
+    ## commands sent to the same target; None for no limit.
+    ## @param coalesce If True, the command is dropped if the same command
+    ## is still in the queue.
+    def command_queue_add(self, cmd, delay, priority = PRIORITY_NORMAL, target = None, coalesce = False):
+        if self._command_queue.add(cmd, delay, time.time(), priority, target, coalesce):
+            self.loop.call_soon_threadsafe(self._command_queue_schedule)
+
+    ## Get the metrics of the command queue.
+    ## @return Dictionary of the metrics, see CommandScheduler::metrics.
+    def command_queue_metrics(self):
+        return self._command_queue.metrics()
+
+    ## Handle socket data; called when the socket becomes readable.
     def handle_data(self):
         pass
-
-    ## Extra handling after data handling is done.
-    def handle_extra(self):
-        self._command_queue_handle()
@@ -25,10 +25,13 @@
 ## @file
 ## The game-bot handling.
 
-import shelve, re, struct, time, zlib
+import errno, shelve, re, socket, struct, time
 from BaseSocket import *
 from CommandHandler import *
+from CommandRouter import *
 from Commands import *
+from EventLog import *
+from FrameDecoder import *
 from KillsLog import *
 from PlayerInfo import *
 
@@ -39,12 +42,14 @@ class Bot(BaseSocket):
     ## @param bots List of bots.
     ## @param config ConfigParser instance.
     ## @param section Section in the config with the settings for this bot.
-    def __init__(self, data, bots, config, section):
+    ## @param loop EventLoop instance to run the bot in.
+    def __init__(self, data, bots, config, section, loop):
         (self.host, self.port, self.name, self.pswd) = data
-        self._handle_data_reset()
 
-        # Open the database for this bot.
-        self.db = shelve.open("{0}@{1}.db".format(self.name, self.host).replace(".", "-").replace("/", "-"), writeback = True)
+        # Open the database and the event log for this bot.
+        db_name = "{0}@{1}".format(self.name, self.host).replace(".", "-").replace("/", "-")
+        self.db = shelve.open(db_name + ".db", writeback = True)
+        self.events = EventLog(db_name + ".events")
 
         # Store the list of bots.
         self._bots = bots
@@ -56,11 +61,19 @@ class Bot(BaseSocket):
         self.pi = PlayerInfo(self)
         self.kl = KillsLog(self)
         self.cmds = Commands(self)
-        BaseSocket.__init__(self)
+        self._decoder = FrameDecoder(self.ch.handle_command, self.ch.handles)
+
+        # Record the data received from the server, for replaying it in
+        # benchmarks.
+        self._capture = None
+
+        if self.config.has_option(section, "capture"):
+            self._capture = open(self.config.get(section, "capture"), "ab")
+
+        BaseSocket.__init__(self, loop)
         self.commands_load()
 
-        ts = time.time()
-        self.who_stamp = ts + self.config.getint("General", "who_delay")
+        self._who_timer = self.loop.call_later(self.config.getint("General", "who_delay"), self._who)
 
     ## Load the possible commands.
     def commands_load(self):
@@ -85,22 +98,36 @@ class Bot(BaseSocket):
             ("^chat (.+)$", self.cmds.player_command_chat),
             ("^(?:how much is )?(\d+) (\w+)(?: coin(?:s)?)? in (\w+)(?: coin(?:s)?)?(?:\?)?$", self.cmds.player_command_currency),
             ("^shut(?: )?down$", self.cmds.player_command_quit),
+            ("^queue (?:stats|status)$", self.cmds.player_command_queue),
         ]
 
         # Is there a commands section?
-        if not self.config.has_section("Commands"):
-            return
+        if self.config.has_section("Commands"):
+            for (name, value) in self.config.items("Commands"):
+                (regex, s) = re.match("\"(.+)\" (.+)", value).groups()
+                self.commands.append((regex, s))
+
+        # Compile the commands' regexes.
+        self.router = CommandRouter(self.commands)
 
-        for (name, value) in self.config.items("Commands"):
-            (regex, s) = re.match("\"(.+)\" (.+)", value).groups()
-            self.commands.append((regex, s))
 
     ## Closes the bot.
     def close(self):
+        self.loop.cancel(self._who_timer)
         self.db.close()
-        self.disconnect()
+        self.events.close()
+
+        if self._capture:
+            self._capture.close()
+
+        BaseSocket.close(self)
         self._bots.remove(self)
 
+    ## Disconnects the bot, discarding any partially received data.
+    def disconnect(self):
+        BaseSocket.disconnect(self)
+        self._decoder.reset()
+
     ## Sends connect data to the game server.
     def _post_connect(self):
         self.send(b"version 1055 1055 Atrinikbot")
@@ -117,119 +144,50 @@ class Bot(BaseSocket):
             s = s.encode()
 
         l = len(s)
-        s = struct.pack("BB", (l >> 8 & 0xFF), l & 0xFF) + s
-        l += 2
-        sent = 0
-
-        while sent < l:
-            sent += self.socket.send(s[sent:])
+        self.write(struct.pack("BB", (l >> 8 & 0xFF), l & 0xFF) + s)
 
     ## Send game command to the server.
     ## @param s The command to send.
     def send_command(self, s):
         self.send("cm {0}".format(s))
 
-    ## Reset internal data used when reading data from socket.
-    def _handle_data_reset(self):
-        self._readbuf = b""
-        self._readbuf_len = 0
-        self._header_len = 0
-        self._cmd_len = -1
-
-    ## Handle reading data from socket.
+    ## Handle reading data from socket; called by the event loop whenever
+    ## the socket becomes readable.
     def handle_data(self):
-        starttime = time.time()
-
-        while True:
-            if time.time() - starttime > 0.5:
-                break
-
-            # Less than 2 bytes read (possibly 0 so far), choose how much to read.
-            if self._readbuf_len < 2:
-                # If we read something already, check for bit marker and read more
-                # if applicable, as this is as 3-byte header.
-                if self._readbuf_len > 0 and struct.unpack("B", self._readbuf[:1])[0] & 0x80:
-                    toread = 3 - self._readbuf_len
-                # Standard 2-byte header.
-                else:
-                    toread = 2 - self._readbuf_len
-            # Exactly 2 bytes read; if the bit marker is set, read 1 more, as this
-            # a 3-byte header instead of the standard 2-byte one.
-            elif self._readbuf_len == 2 and struct.unpack("B", self._readbuf[:1])[0] & 0x80:
-                toread = 1
-            else:
-                # We got the header data, try to parse it.
-                if self._readbuf_len <= 3:
-                    # Figure out the header length.
-                    self._header_len = 3 if struct.unpack("B", self._readbuf[:1])[0] & 0x80 else 2
-                    self._cmd_len = 0
-
-                    # Unpack the header.
-                    unpacked = struct.unpack("{0}B".format(self._header_len), self._readbuf[:self._header_len])
-                    i = 0
-
-                    # 3-byte header.
-                    if self._header_len == 3:
-                        self._cmd_len += (unpacked[i] & 0x7f) << 16
-                        i += 1
-
-                    # 2-byte header or continuation of the above 3-byte one.
-                    self._cmd_len += unpacked[i] << 8
-                    i += 1
-                    self._cmd_len += unpacked[i]
-
-                # Now we know exactly how much data to read to complete the
-                # command.
-                toread = self._cmd_len + self._header_len - self._readbuf_len
-
+        # Read until the socket runs out of data, but give the other bots a
+        # chance after a while if the server floods us.
+        for i in range(16):
             try:
-                # Try to read the data.
-                data = self.socket.recv(toread)
-            except socket.error:
+                data = self.socket.recv(65536)
+            except socket.error as e:
+                # No more data for now.
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    return
+
+                self._mark_reconnect()
                 return
 
             # Failed; reset connection.
             if not data:
-                self._handle_data_reset()
                 self._mark_reconnect()
                 return
 
-            # Store the data and update the data's total length.
-            self._readbuf += data
-            self._readbuf_len += len(data)
-
-            # Have we completed reading the data for the command yet?
-            if self._readbuf_len == self._cmd_len + self._header_len:
-                # Strip off the header bytes.
-                self._readbuf = self._readbuf[self._header_len:]
-                # Get the command ID.
-                (cmd_id,) = struct.unpack("B", self._readbuf[:1])
-
-                # Command #0 marks compressed data.
-                if cmd_id == 0:
-                    # Figure out the uncompressed length.
-                    ucomp_len = struct.unpack("I", self._readbuf[1:5][::-1])
-                    # Uncompress the data.
-                    self._readbuf = zlib.decompress(self._readbuf[5:])
-                    # Get the actual command ID now.
-                    (cmd_id,) = struct.unpack("B", self._readbuf[:1])
-
-                # Handle the command.
-                self.ch.handle_command(cmd_id, self._readbuf[1:])
-                # Reset the internal pointers.
-                self._handle_data_reset()
-
-    ## Handle anything extra.
-    def handle_extra(self):
-        ts = time.time()
-
-        # Check if it's time to send a /who command yet.
-        if ts >= self.who_stamp:
-            self.who_stamp = ts + self.config.getint("General", "who_delay")
-            self.send_command("/who")
-
-        # Handle command queue.
-        self._command_queue_handle()
+            if self._capture:
+                self._capture.write(data)
+
+            # Handle all the commands completed by the data.
+            self._decoder.feed(data)
+
+            # The bot may have been disconnected by one of the commands.
+            if not self.is_connected():
+                return
+
+    ## Send a /who command to the server, to update player information.
+    ## Called periodically by the event loop.
+    def _who(self):
+        self._who_timer = self.loop.call_later(self.config.getint("General", "who_delay"), self._who)
+
+        self.command_queue_add("/who", 0, PRIORITY_PERIODIC, "who", coalesce = True)
 
     ## Handle chat.
     ## @param name Player that activated the chat.
@@ -241,19 +199,16 @@ class Bot(BaseSocket):
         # Remove extraneous spaces between words.
         msg = " ".join(msg.split())
 
-        # Try to parse the commands.
-        for (regex, cmd) in self.commands:
-            match = re.match(regex, msg, re.I)
+        # Find the command to run.
+        (match, cmd) = self.router.route(msg)
 
-            if match:
-                if type(cmd) == type(str()):
-                    ret = cmd.format(name)
-                else:
-                    ret = cmd(name, match.groups())
-
-                break
+        if match:
+            if type(cmd) == type(str()):
+                ret = cmd.format(name)
+            else:
+                ret = cmd(name, match.groups())
 
         if chat == "tell":
-            self.send_command("/tell {0} {1}".format(name, ret))
+            self.command_queue_add("/tell {0} {1}".format(name, ret), 0, PRIORITY_TELL, name)
         elif chat == "say":
-            self.send_command("/say {0}".format(ret))
+            self.command_queue_add("/say {0}".format(ret), 0, PRIORITY_SAY, "say")
@@ -28,12 +28,23 @@
 import struct, re
 from misc import NDI
 
+## Matches tells to the bot.
+_RE_TELL = re.compile("([a-zA-Z0-9_-]+) tells you: (.+)")
+## Matches players entering the game.
+_RE_ENTERED = re.compile("([a-zA-Z0-9_-]+)(?: has)? entered the game\.")
+## Matches /who responses.
+_RE_WHO = re.compile("([a-zA-Z0-9_-]+) the (\w+) (\w+)(?: (\w+))? \(lvl (\d+)\)(?: (.+))?")
+## Matches kill messages.
+_RE_KILL = re.compile("(.+) killed ([a-zA-Z0-9_-]+)(?: with (.[^\(]+))?( \(duel\))?\.")
+
 ## The command handler class.
 class CommandHandler:
     ## Initialize the command handler.
     ## @param bot The associated bot.
     def __init__(self, bot):
         self._bot = bot
+        # Matches messages said to the bot; depends on the bot's name.
+        self._re_say = re.compile("([a-zA-Z0-9_-]+) says: {0}, (.+)".format(re.escape(bot.name)))
         # The various commands.
         self._commands = [
             # Handled specially - marks compressed data.
@@ -75,6 +86,12 @@ class CommandHandler:
             ("Region map", None),
         ]
 
+    ## Check whether commands with the given ID are handled.
+    ## @param cmd_id The command ID.
+    ## @return True if the command is handled, False otherwise.
+    def handles(self, cmd_id):
+        return cmd_id < len(self._commands) and self._commands[cmd_id][1] is not None
+
     ## Handle a single command.
     ## @param cmd_id The command ID.
     ## @param data Command data.
@@ -124,13 +141,13 @@ class CommandHandler:
 
         # Tell? Handle bot chat.
         if flags & NDI.TELL:
-            match = re.match("([a-zA-Z0-9_-]+) tells you: (.+)", data)
+            match = _RE_TELL.match(data)
 
             if match:
                 (name, msg) = match.groups()
                 self._bot.handle_chat(name, msg, "tell")
         elif flags & NDI.SAY:
-            match = re.match("([a-zA-Z0-9_-]+) says: {0}, (.+)".format(self._bot.name), data)
+            match = self._re_say.match(data)
 
             if match:
                 (name, msg) = match.groups()
@@ -139,7 +156,7 @@ class CommandHandler:
         elif color == NDI.DK_ORANGE:
             # Entered the game, update timestamp.
             if data.find("entered the game.") != -1:
-                match = re.match("([a-zA-Z0-9_-]+)(?: has)? entered the game\.", data)
+                match = _RE_ENTERED.match(data)
 
                 if match:
                     self._bot.pi.update_seen(match.groups()[0])
@@ -147,16 +164,17 @@ class CommandHandler:
         elif color == NDI.WHITE:
             # /who response.
             if data.find(" (lvl ") != -1:
-                match = re.match("([a-zA-Z0-9_-]+) the (\w+) (\w+)(?: (\w+))? \(lvl (\d+)\)(?: (.+))?", data)
+                match = _RE_WHO.match(data)
 
                 if match:
                     self._bot.pi.update_data(match.groups())
             # Player was killed - update logs.
             elif data.find(" killed ") != -1:
-                match = re.match("(.+) killed ([a-zA-Z0-9_-]+)(?: with (.[^\(]+))?( \(duel\))?\.", data)
+                match = _RE_KILL.match(data)
 
                 if match:
                     (killer, victim, how, pvp) = match.groups()
+                    self._bot.events.append(killer, victim, how, pvp)
                     self._bot.kl.kill_log(killer, victim, how, pvp)
                     self._bot.pi.death_log(victim, killer, how, pvp)
 
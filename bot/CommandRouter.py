@@ -0,0 +1,248 @@
+#*************************************************************************
+#*            Atrinik, a Multiplayer Online Role Playing Game            *
+#*                                                                       *
+#*    Copyright (C) 2009-2014 Alex Tokar and Atrinik Development Team    *
+#*                                                                       *
+#* Fork from Crossfire (Multiplayer game for X-windows).                 *
+#*                                                                       *
+#* This program is free software; you can redistribute it and/or modify  *
+#* it under the terms of the GNU General Public License as published by  *
+#* the Free Software Foundation; either version 2 of the License, or     *
+#* (at your option) any later version.                                   *
+#*                                                                       *
+#* This program is distributed in the hope that it will be useful,       *
+#* but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#* MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#* GNU General Public License for more details.                          *
+#*                                                                       *
+#* You should have received a copy of the GNU General Public License     *
+#* along with this program; if not, write to the Free Software           *
+#* Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.             *
+#*                                                                       *
+#* The author can be reached at admin@atrinik.org                        *
+#*************************************************************************
+
+
+## @file
+## Routes chat messages to the first command whose regex matches them.
+
+import re, string
+
+## Regex of a {m,n} quantifier.
+_RE_QUANTIFIER = re.compile(r"\{(\d*)(?:,(\d*))?\}")
+
+## Find the characters a regex alternation may start with.
+## @param regex The regex.
+## @param i Index in the regex where the alternation starts.
+## @return Tuple of the set of characters (None if any character is
+## possible, or the regex is too complex to tell), whether the alternation
+## can match the empty string, and the index where the alternation ends.
+## @throws ValueError If the regex uses a construct that is not understood.
+def _first_chars_alternation(regex, i):
+    chars = set()
+    nullable = False
+
+    while True:
+        (branch_chars, branch_nullable, i) = _first_chars_sequence(regex, i)
+
+        if chars is None or branch_chars is None:
+            chars = None
+        else:
+            chars |= branch_chars
+
+        nullable = nullable or branch_nullable
+
+        if regex[i:i + 1] != "|":
+            return (chars, nullable, i)
+
+        i += 1
+
+## Find the characters a sequence of regex items may start with.
+## @param regex The regex.
+## @param i Index in the regex where the sequence starts.
+## @return Same as _first_chars_alternation().
+def _first_chars_sequence(regex, i):
+    chars = set()
+    nullable = True
+
+    while i < len(regex) and regex[i] not in "|)":
+        (item_chars, item_nullable, i) = _first_chars_item(regex, i)
+
+        # Once an item can't match the empty string, the items after it
+        # don't affect the first character; they are only skipped over.
+        if nullable:
+            if chars is None or item_chars is None:
+                chars = None
+            else:
+                chars |= item_chars
+
+            nullable = item_nullable
+
+    return (chars, nullable, i)
+
+## Find the characters a single regex item (with its quantifier) may start
+## with.
+## @param regex The regex.
+## @param i Index in the regex where the item starts.
+## @return Same as _first_chars_alternation().
+def _first_chars_item(regex, i):
+    c = regex[i]
+
+    if c in "^$":
+        return (set(), True, i + 1)
+    elif c == "(":
+        if regex.startswith("(?:", i):
+            i += 3
+        elif regex.startswith("(?", i):
+            # Lookarounds, flags, named groups...
+            raise ValueError("unsupported group")
+        else:
+            i += 1
+
+        (chars, nullable, i) = _first_chars_alternation(regex, i)
+
+        if regex[i:i + 1] != ")":
+            raise ValueError("unbalanced parenthesis")
+
+        i += 1
+    elif c == "[":
+        # Character set; skip over it.
+        j = i + 1
+
+        if regex[j:j + 1] == "^":
+            j += 1
+
+        if regex[j:j + 1] == "]":
+            j += 1
+
+        while j < len(regex) and regex[j] != "]":
+            if regex[j] == "\\":
+                j += 1
+
+            j += 1
+
+        if j >= len(regex):
+            raise ValueError("unterminated character set")
+
+        (chars, nullable, i) = (None, False, j + 1)
+    elif c == "\\":
+        if i + 1 >= len(regex):
+            raise ValueError("trailing backslash")
+
+        escape = regex[i + 1]
+
+        if escape == "d":
+            chars = set(string.digits)
+        elif escape.isalnum():
+            # Other character classes, backreferences, anchors...
+            chars = None
+        else:
+            chars = set([escape])
+
+        (nullable, i) = (False, i + 2)
+    elif c == ".":
+        (chars, nullable, i) = (None, False, i + 1)
+    elif c in "*+?{}":
+        raise ValueError("nothing to repeat")
+    else:
+        # Leave case folding of non-ASCII characters to the regex.
+        (chars, nullable, i) = (set([c]) if ord(c) <= 127 else None, False, i + 1)
+
+    # Check for a quantifier.
+    if regex[i:i + 1] in ("*", "?"):
+        (nullable, i) = (True, i + 1)
+    elif regex[i:i + 1] == "+":
+        i += 1
+    elif regex[i:i + 1] == "{":
+        match = _RE_QUANTIFIER.match(regex, i)
+
+        if not match:
+            raise ValueError("invalid quantifier")
+
+        if not match.group(1) or int(match.group(1)) == 0:
+            nullable = True
+
+        i = match.end()
+    else:
+        return (chars, nullable, i)
+
+    # Non-greedy or possessive quantifier.
+    if regex[i:i + 1] in ("?", "+"):
+        i += 1
+
+    return (chars, nullable, i)
+
+## Find the characters a regex may start with.
+##
+## Only the regex source is looked at. Anything that is not understood
+## makes the regex a candidate for any message.
+## @param regex The regex.
+## @return Tuple of the set of characters (None if any character is
+## possible, or the regex is too complex to tell), and whether the regex
+## can match the empty string.
+def _first_chars(regex):
+    try:
+        (chars, nullable, i) = _first_chars_alternation(regex, 0)
+    except ValueError:
+        return (None, False)
+
+    if i != len(regex):
+        return (None, False)
+
+    return (chars, nullable)
+
+## Routes chat messages to commands.
+##
+## The regexes are compiled once, and keyed by the characters they can
+## start with, so a message is only matched against the regexes that may
+## match it, no matter how many commands there are. Regexes are tried in
+## the order they were given in, so the first one that matches wins.
+class CommandRouter:
+    ## Initialize the router.
+    ## @param commands List of tuples of regexes and their commands.
+    def __init__(self, commands):
+        compiled = []
+
+        for (regex, cmd) in commands:
+            (chars, nullable) = _first_chars(regex)
+
+            # Can match an empty message, so try it for any message.
+            if nullable:
+                chars = None
+            elif chars is not None:
+                chars = set(c.lower() for c in chars)
+
+            compiled.append((re.compile(regex, re.I), cmd, chars))
+
+        ## Commands to try for messages starting with a character that no
+        ## regex starts with explicitly.
+        self._default = [(regex, cmd) for (regex, cmd, chars) in compiled if chars is None]
+        ## All the commands, for messages starting with a non-ASCII
+        ## character, which may case fold or count as a digit in ways the
+        ## buckets don't account for.
+        self._all = [(regex, cmd) for (regex, cmd, chars) in compiled]
+        ## Maps lowercase first characters to the commands to try.
+        self._buckets = {}
+
+        for c in set().union(*[chars for (regex, cmd, chars) in compiled if chars is not None]):
+            self._buckets[c] = [(regex, cmd) for (regex, cmd, chars) in compiled if chars is None or c in chars]
+
+    ## Find the command for a message.
+    ## @param msg The message.
+    ## @return Tuple of the match object and the command, (None, None) if no
+    ## regex matches.
+    def route(self, msg):
+        first = msg[:1]
+
+        if first and ord(first) > 127:
+            commands = self._all
+        else:
+            commands = self._buckets.get(first.lower(), self._default)
+
+        for (regex, cmd) in commands:
+            match = regex.match(msg)
+
+            if match:
+                return (match, cmd)
+
+        return (None, None)
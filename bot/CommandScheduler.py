@@ -0,0 +1,229 @@
+#*************************************************************************
+#*            Atrinik, a Multiplayer Online Role Playing Game            *
+#*                                                                       *
+#*    Copyright (C) 2009-2014 Alex Tokar and Atrinik Development Team    *
+#*                                                                       *
+#* Fork from Crossfire (Multiplayer game for X-windows).                 *
+#*                                                                       *
+#* This program is free software; you can redistribute it and/or modify  *
+#* it under the terms of the GNU General Public License as published by  *
+#* the Free Software Foundation; either version 2 of the License, or     *
+#* (at your option) any later version.                                   *
+#*                                                                       *
+#* This program is distributed in the hope that it will be useful,       *
+#* but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#* MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#* GNU General Public License for more details.                          *
+#*                                                                       *
+#* You should have received a copy of the GNU General Public License     *
+#* along with this program; if not, write to the Free Software           *
+#* Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.             *
+#*                                                                       *
+#* The author can be reached at admin@atrinik.org                        *
+#*************************************************************************
+
+
+## @file
+## Scheduler for the commands sent to a server.
+
+import collections, heapq, itertools, threading
+
+## Priorities of the commands; lower values are sent first.
+PRIORITY_TELL = 0
+PRIORITY_SAY = 1
+PRIORITY_NORMAL = 2
+PRIORITY_PERIODIC = 3
+
+## Number of recent send latencies to keep for the metrics.
+_LATENCY_SAMPLES = 1000
+
+## Decides which queued command to send next.
+##
+## Commands are sent highest priority first, and in the order they were
+## added within the same priority. Two limits apply:
+##
+## - After a command is sent, no other command is sent until its delay
+##   has passed.
+## - Commands may have a target (for example the player a tell is sent
+##   to), and each target has a token bucket, so that one target cannot
+##   use up all the bandwidth. Commands for a target that is out of
+##   tokens are skipped in favour of commands for other targets.
+##
+## All methods are thread-safe.
+class CommandScheduler:
+    ## Initialize the scheduler.
+    ## @param rate Number of commands per second each target may be sent
+    ## on average.
+    ## @param burst Maximum number of commands that may be sent to a target
+    ## at once.
+    def __init__(self, rate, burst):
+        self._rate = rate
+        self._burst = burst
+        self._lock = threading.Lock()
+        ## Heap of the queued commands.
+        self._queue = []
+        self._seq = itertools.count()
+        ## Time before which no command may be sent.
+        self._stamp = 0.0
+        ## Maps targets to lists of the number of tokens and the time the
+        ## tokens were last updated.
+        self._buckets = {}
+        ## Commands added with coalescing, that are still in the queue.
+        self._coalesced = set()
+
+        # Metrics.
+        self._depth = collections.Counter()
+        self._max_depth = 0
+        self._sent = 0
+        self._coalesced_count = 0
+        self._latencies = collections.deque(maxlen = _LATENCY_SAMPLES)
+
+    ## Add a command.
+    ## @param cmd The command.
+    ## @param delay Delay that must pass after sending the command before
+    ## another command may be sent.
+    ## @param now The current time.
+    ## @param priority Priority of the command, one of the PRIORITY_xxx
+    ## constants.
+    ## @param target Target of the command, None if it has no target.
+    ## @param coalesce If True, the command is not added if the same command
+    ## is already queued; meant for periodic commands.
+    ## @return True if the command was added, False if it was coalesced.
+    def add(self, cmd, delay, now, priority = PRIORITY_NORMAL, target = None, coalesce = False):
+        with self._lock:
+            if coalesce:
+                if cmd in self._coalesced:
+                    self._coalesced_count += 1
+                    return False
+
+                self._coalesced.add(cmd)
+
+            heapq.heappush(self._queue, (priority, next(self._seq), cmd, delay, target, now, coalesce))
+            self._depth[priority] += 1
+            self._max_depth = max(self._max_depth, len(self._queue))
+            return True
+
+    ## Refill the token bucket of a target.
+    ## @param target The target.
+    ## @param now The current time.
+    ## @return The bucket.
+    def _bucket(self, target, now):
+        bucket = self._buckets.get(target)
+
+        if bucket is None:
+            # Forget targets that have been idle long enough to have a full
+            # bucket again, so that the buckets don't pile up.
+            if len(self._buckets) >= 1000:
+                for (key, (tokens, stamp)) in list(self._buckets.items()):
+                    if tokens + (now - stamp) * self._rate >= self._burst:
+                        del self._buckets[key]
+
+            bucket = self._buckets[target] = [float(self._burst), now]
+        else:
+            bucket[0] = min(self._burst, bucket[0] + (now - bucket[1]) * self._rate)
+            bucket[1] = now
+
+        return bucket
+
+    ## Remove the command to send next from the queue.
+    ## @param now The current time.
+    ## @return The command, None if no command may be sent yet.
+    def pop(self, now):
+        with self._lock:
+            if now < self._stamp or not self._queue:
+                return None
+
+            skipped = []
+            entry = None
+
+            while self._queue:
+                entry = heapq.heappop(self._queue)
+                target = entry[4]
+
+                if target is None:
+                    break
+
+                bucket = self._bucket(target, now)
+
+                if bucket[0] >= 1.0:
+                    bucket[0] -= 1.0
+                    break
+
+                skipped.append(entry)
+                entry = None
+
+            for skipped_entry in skipped:
+                heapq.heappush(self._queue, skipped_entry)
+
+            if entry is None:
+                return None
+
+            (priority, seq, cmd, delay, target, added, coalesce) = entry
+            self._stamp = now + delay
+            self._depth[priority] -= 1
+            self._sent += 1
+            self._latencies.append(now - added)
+
+            if coalesce:
+                self._coalesced.discard(cmd)
+
+            return cmd
+
+    ## Figure out when the next command may be sent.
+    ## @param now The current time.
+    ## @return The time, None if the queue is empty.
+    def next_time(self, now):
+        with self._lock:
+            if not self._queue:
+                return None
+
+            when = None
+
+            for entry in self._queue:
+                target = entry[4]
+
+                if target is None:
+                    when = now
+                    break
+
+                (tokens, stamp) = self._buckets.get(target, (self._burst, now))
+                tokens = min(self._burst, tokens + (now - stamp) * self._rate)
+                ready = now if tokens >= 1.0 else now + (1.0 - tokens) / self._rate
+
+                if when is None or ready < when:
+                    when = ready
+
+                    if ready == now:
+                        break
+
+            return max(when, self._stamp)
+
+    ## Get the number of queued commands.
+    def __len__(self):
+        return len(self._queue)
+
+    ## Get the metrics of the queue.
+    ## @return Dictionary with the current queue depth in total and by
+    ## priority, the maximum queue depth seen, the number of commands sent
+    ## and coalesced, and the average, 95th percentile and maximum latency
+    ## in seconds of the recently sent commands.
+    def metrics(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            ret = {
+                "depth": len(self._queue),
+                "depth_by_priority": dict((priority, depth) for (priority, depth) in self._depth.items() if depth),
+                "max_depth": self._max_depth,
+                "sent": self._sent,
+                "coalesced": self._coalesced_count,
+                "latency_avg": 0.0,
+                "latency_95": 0.0,
+                "latency_max": 0.0,
+            }
+
+            if latencies:
+                ret["latency_avg"] = sum(latencies) / len(latencies)
+                ret["latency_95"] = latencies[int(len(latencies) * 0.95)]
+                ret["latency_max"] = latencies[-1]
+
+            return ret
@@ -106,21 +106,17 @@ class Commands:
     ## @param groups Data from regex that triggered this.
     def player_command_died(self, name, groups):
         (multiple, pvp) = groups
-        entry = "deaths_arena" if pvp else "deaths"
-
-        # Sort the players by the number of highest deaths - highest first.
-        l = sorted(self._bot.db["players"], key = lambda key: len(self._bot.db["players"][key][entry]), reverse = True)
+        # Top #x or just the first one.
+        l = self._bot.pi.get_top_deaths(self._bot.config.getint("General", "max_kill_top") if multiple else 1, pvp)
 
         # No deaths...
-        if not l or not self._bot.db["players"][l[0]][entry]:
+        if not l:
             return "No player has ever died{0}.".format(" in the arena" if pvp else "")
 
-        # Show top #x.
         if multiple:
-            return "Players with most deaths{0}: {1}".format(" in the arena" if pvp else "", ", ".join(list(map(lambda player: "{0} ({1})".format(player, len(self._bot.db["players"][player][entry])), [player for player in l[:min(self._bot.config.getint("General", "max_kill_top"), len(l))] if self._bot.db["players"][player][entry]]))))
-        # Just the first one.
+            return "Players with most deaths{0}: {1}".format(" in the arena" if pvp else "", ", ".join("{0} ({1})".format(player, num) for (player, num) in l))
         else:
-            return "{0} has been killed most often{1}, with {2} deaths.".format(l[0], " in the arena" if pvp else "", len(self._bot.db["players"][l[0]][entry]))
+            return "{0} has been killed most often{1}, with {2} deaths.".format(l[0][0], " in the arena" if pvp else "", l[0][1])
 
     ## Ask the bot how many times a player has died.
     ## @param name The player's name.
@@ -133,7 +129,7 @@ class Commands:
         if not player in self._bot.db["players"]:
             return "I don't know anything about {0}.".format(player)
 
-        num = len(self._bot.db["players"][player][entry])
+        num = self._bot.db["players"][player][entry]
 
         if not num:
             return "{0} has never ever died{1}.".format(player, " in the arena" if pvp else "")
@@ -145,71 +141,63 @@ class Commands:
     ## @param groups Data from regex that triggered this.
     def player_command_lethal(self, name, groups):
         (multiple,) = groups
-        # Sort the kills log, by highest number of kills.
-        l = sorted(self._bot.db["kills"], key = lambda key: len(self._bot.db["kills"][key]["normal"]), reverse = True)
+        # Top #x killers or just the first one.
+        l = self._bot.kl.get_top(self._bot.config.getint("General", "max_kill_top") if multiple else 1, False)
 
         # No kills yet.
-        if not l or not self._bot.db["kills"][l[0]]["normal"]:
+        if not l:
             return "Nothing has ever killed anyone."
 
-        # Top #x killers.
         if multiple:
-            return "Most dangerous killers: {0}".format(", ".join(list(map(lambda key: "{0} ({1})".format(self._bot.db["kills"][key]["name"], len(self._bot.db["kills"][key]["normal"])), [key for key in l[:min(self._bot.config.getint("General", "max_kill_top"), len(l))] if self._bot.db["kills"][key]["normal"]]))))
-        # Just the first one.
+            return "Most dangerous killers: {0}".format(", ".join("{0} ({1})".format(killer, num) for (killer, num) in l))
         else:
-            return "{0} is the most dangerous, with {1} kills.".format(self._bot.db["kills"][l[0]]["name"], len(self._bot.db["kills"][l[0]]["normal"]))
+            return "{0} is the most dangerous, with {1} kills.".format(l[0][0], l[0][1])
 
     ## Ask which player(s) killed the most in the arena.
     ## @param name The player's name.
     ## @param groups Data from regex that triggered this.
     def player_command_arena(self, name, groups):
         (multiple,) = groups
-        # Sort kills in the arena, highest first.
-        l = sorted(self._bot.db["kills"], key = lambda key: len(self._bot.db["kills"][key]["arena"]), reverse = True)
+        # Top #x arena killers or just the first one.
+        l = self._bot.kl.get_top(self._bot.config.getint("General", "max_kill_top") if multiple else 1, True)
 
         # No arena kills.
-        if not l or not self._bot.db["kills"][l[0]]["arena"]:
+        if not l:
             return "No player has ever killed anyone in the arena."
 
-        # Show top #x arena killers.
         if multiple:
-            return "Players with most kills in the arena: {0}".format(", ".join(list(map(lambda key: "{0} ({1})".format(self._bot.db["kills"][key]["name"], len(self._bot.db["kills"][key]["arena"])), [key for key in l[:min(self._bot.config.getint("General", "max_kill_top"), len(l))] if self._bot.db["kills"][key]["arena"]]))))
-        # Just the first one.
+            return "Players with most kills in the arena: {0}".format(", ".join("{0} ({1})".format(killer, num) for (killer, num) in l))
         else:
-            print("{0} has killed the most players in the arena, with {1} kills.".format(self._bot.db["kills"][l[0]]["name"], len(self._bot.db["kills"][l[0]]["arena"])))
-            return "{0} has killed the most players in the arena, with {1} kills.".format(self._bot.db["kills"][l[0]]["name"], len(self._bot.db["kills"][l[0]]["arena"]))
+            return "{0} has killed the most players in the arena, with {1} kills.".format(l[0][0], l[0][1])
 
     ## Ask the bot how many times something has killed.
     ## @param name The player's name.
     ## @param groups Data from regex that triggered this.
     def player_command_killed_count(self, name, groups):
         (killer, pvp) = groups
-        killer = killer.lower()
-        entry = "arena" if pvp else "normal"
+        num = self._bot.kl.get_kills(killer, pvp)
 
-        if not killer in self._bot.db["kills"] or not self._bot.db["kills"][killer][entry]:
-            return "{0} has never ever killed{1}.".format(killer, " in the arena" if pvp else "")
+        if not num:
+            return "{0} has never ever killed{1}.".format(killer.lower(), " in the arena" if pvp else "")
 
-        return "{0} has killed {1} times{2}.".format(self._bot.db["kills"][killer]["name"], len(self._bot.db["kills"][killer][entry]), " in the arena" if pvp else "")
+        return "{0} has killed {1} times{2}.".format(self._bot.db["kills"][killer.lower()]["name"], num, " in the arena" if pvp else "")
 
     ## Ask the bot how many times something/someone has killed a particular player.
     ## @param name The player's name.
     ## @param groups Data from regex that triggered this.
     def player_command_killed_player(self, name, groups):
         (killer, victim, pvp) = groups
-        killer = killer.lower()
-        victim = victim.lower()
-        entry = "arena" if pvp else "normal"
 
-        if not killer in self._bot.db["kills"] or not self._bot.db["kills"][killer][entry]:
-            return "{0} has never ever killed{1}.".format(killer, " in the arena" if pvp else "")
+        if not self._bot.kl.get_kills(killer, pvp):
+            return "{0} has never ever killed{1}.".format(killer.lower(), " in the arena" if pvp else "")
 
-        l = [t for t in self._bot.db["kills"][killer][entry] if t[0].lower() == victim]
+        killer_name = self._bot.db["kills"][killer.lower()]["name"]
+        kills = self._bot.kl.get_victim_kills(killer, victim, pvp)
 
-        if not l:
-            return "{0} has never ever killed {1}{2}.".format(self._bot.db["kills"][killer]["name"], victim, " in the arena" if pvp else "")
+        if not kills:
+            return "{0} has never ever killed {1}{2}.".format(killer_name, victim.lower(), " in the arena" if pvp else "")
 
-        return "{0} has killed {1} {2} times{3}.".format(self._bot.db["kills"][killer]["name"], l[0][0], len(l), " in the arena" if pvp else "")
+        return "{0} has killed {1} {2} times{3}.".format(killer_name, kills[0], kills[1], " in the arena" if pvp else "")
 
     ## Privileged command: reload the configuration file, and the defined
     ## commands it has.
@@ -250,6 +238,16 @@ class Commands:
 
         return "Gee... I can't answer that..."
 
+    ## Privileged command: show the command queue's metrics.
+    ## @param name The player's name.
+    ## @param groups Data from regex that triggered this.
+    def player_command_queue(self, name, groups):
+        if not name in self._bot.config.get(self._bot.section, "admins").split(","):
+            return "I don't really want to..."
+
+        metrics = self._bot.command_queue_metrics()
+        return "Queue: {depth} commands (max {max_depth}), {sent} sent, {coalesced} coalesced; latency avg {0:.2f}s, 95% {1:.2f}s, max {2:.2f}s.".format(metrics["latency_avg"], metrics["latency_95"], metrics["latency_max"], **metrics)
+
     ## Exits the bot.
     ## @param name The player's name.
     ## @param groups Data from regex that triggered this.
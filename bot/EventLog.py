@@ -0,0 +1,90 @@
+#*************************************************************************
+#*            Atrinik, a Multiplayer Online Role Playing Game            *
+#*                                                                       *
+#*    Copyright (C) 2009-2014 Alex Tokar and Atrinik Development Team    *
+#*                                                                       *
+#* Fork from Crossfire (Multiplayer game for X-windows).                 *
+#*                                                                       *
+#* This program is free software; you can redistribute it and/or modify  *
+#* it under the terms of the GNU General Public License as published by  *
+#* the Free Software Foundation; either version 2 of the License, or     *
+#* (at your option) any later version.                                   *
+#*                                                                       *
+#* This program is distributed in the hope that it will be useful,       *
+#* but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#* MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#* GNU General Public License for more details.                          *
+#*                                                                       *
+#* You should have received a copy of the GNU General Public License     *
+#* along with this program; if not, write to the Free Software           *
+#* Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.             *
+#*                                                                       *
+#* The author can be reached at admin@atrinik.org                        *
+#*************************************************************************
+
+## @file
+## Append-only log of kill events.
+
+import struct, time
+
+## Append-only log of kill events.
+##
+## Each event is stored as a compact binary record: a header with the
+## timestamp, flags and the lengths of the strings, followed by the UTF-8
+## encoded killer, victim and how the victim was killed.
+class EventLog:
+    ## Record header; timestamp, flags and the lengths of the killer,
+    ## victim and how strings.
+    _header = struct.Struct("<IBHHH")
+    ## The event was a PvP kill.
+    FLAG_PVP = 1
+
+    ## Initialize the class.
+    ## @param path Path to the log file.
+    def __init__(self, path):
+        self.path = path
+        self._fp = open(path, "ab")
+
+    ## Append an event to the log.
+    ## @param killer The killer.
+    ## @param victim The victim.
+    ## @param how How the victim was killed; can be None.
+    ## @param pvp If not None, this was a PvP kill.
+    ## @param timestamp When the event happened; defaults to now.
+    def append(self, killer, victim, how, pvp, timestamp = None):
+        if timestamp is None:
+            timestamp = int(time.time())
+
+        strings = [s.encode("utf-8")[:0xffff]
+                   for s in (killer, victim, how or "")]
+        self._fp.write(self._header.pack(timestamp,
+                                         self.FLAG_PVP if pvp else 0,
+                                         *map(len, strings)))
+
+        for s in strings:
+            self._fp.write(s)
+
+        self._fp.flush()
+
+    ## Iterate over the logged events.
+    ## @return Generator of tuples of the timestamp, killer, victim, how
+    ## (None if unknown) and whether it was a PvP kill.
+    def __iter__(self):
+        with open(self.path, "rb") as fp:
+            while True:
+                header = fp.read(self._header.size)
+
+                if len(header) < self._header.size:
+                    break
+
+                values = self._header.unpack(header)
+                (timestamp, flags) = values[:2]
+                strings = [fp.read(length).decode("utf-8")
+                           for length in values[2:]]
+
+                yield (timestamp, strings[0], strings[1], strings[2] or None,
+                       bool(flags & self.FLAG_PVP))
+
+    ## Close the log.
+    def close(self):
+        self._fp.close()
@@ -0,0 +1,187 @@
+#*************************************************************************
+#*            Atrinik, a Multiplayer Online Role Playing Game            *
+#*                                                                       *
+#*    Copyright (C) 2009-2014 Alex Tokar and Atrinik Development Team    *
+#*                                                                       *
+#* Fork from Crossfire (Multiplayer game for X-windows).                 *
+#*                                                                       *
+#* This program is free software; you can redistribute it and/or modify  *
+#* it under the terms of the GNU General Public License as published by  *
+#* the Free Software Foundation; either version 2 of the License, or     *
+#* (at your option) any later version.                                   *
+#*                                                                       *
+#* This program is distributed in the hope that it will be useful,       *
+#* but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#* MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#* GNU General Public License for more details.                          *
+#*                                                                       *
+#* You should have received a copy of the GNU General Public License     *
+#* along with this program; if not, write to the Free Software           *
+#* Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.             *
+#*                                                                       *
+#* The author can be reached at admin@atrinik.org                        *
+#*************************************************************************
+
+
+## @file
+## Event loop driving the sockets and timers of the bot.
+
+import errno, fcntl, heapq, os, select, threading, time
+
+## Runs callbacks when sockets become readable or writable, and when
+## timers expire.
+##
+## All callbacks are run from the thread calling run(); other threads may
+## only use call_soon_threadsafe().
+class EventLoop:
+    ## Initialize the event loop.
+    def __init__(self):
+        ## Maps file descriptors to (socket, callback) tuples.
+        self._readers = {}
+        ## Maps file descriptors to (socket, callback) tuples.
+        self._writers = {}
+        ## Heap of the scheduled timers.
+        self._timers = []
+        ## Sequence number of the next timer, keeps timers due at the same
+        ## time in the order they were scheduled in.
+        self._timer_seq = 0
+        ## Callbacks added by other threads.
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._running = False
+
+        # Pipe used by other threads to wake up the loop.
+        (self._wakeup_read, self._wakeup_write) = os.pipe()
+
+        for fd in (self._wakeup_read, self._wakeup_write):
+            fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+    ## Call a function when a socket becomes readable.
+    ## @param sock The socket.
+    ## @param callback Function to call.
+    def add_reader(self, sock, callback):
+        self._readers[sock.fileno()] = (sock, callback)
+
+    ## Stop watching a socket for readability.
+    ## @param sock The socket.
+    def remove_reader(self, sock):
+        self._readers.pop(sock.fileno(), None)
+
+    ## Call a function when a socket becomes writable.
+    ## @param sock The socket.
+    ## @param callback Function to call.
+    def add_writer(self, sock, callback):
+        self._writers[sock.fileno()] = (sock, callback)
+
+    ## Stop watching a socket for writability.
+    ## @param sock The socket.
+    def remove_writer(self, sock):
+        self._writers.pop(sock.fileno(), None)
+
+    ## Call a function at the specified time.
+    ## @param when Time as returned by time.time().
+    ## @param func Function to call.
+    ## @param args Arguments to call the function with.
+    ## @return The timer, which can be passed to cancel().
+    def call_at(self, when, func, *args):
+        timer = [when, self._timer_seq, func, args, False]
+        self._timer_seq += 1
+        heapq.heappush(self._timers, timer)
+        return timer
+
+    ## Call a function after the specified delay.
+    ## @param delay Delay in seconds.
+    ## @param func Function to call.
+    ## @param args Arguments to call the function with.
+    ## @return The timer, which can be passed to cancel().
+    def call_later(self, delay, func, *args):
+        return self.call_at(time.time() + delay, func, *args)
+
+    ## Cancel a timer.
+    ## @param timer The timer.
+    def cancel(self, timer):
+        timer[4] = True
+
+    ## Call a function from the loop as soon as possible. May be used from
+    ## any thread.
+    ## @param func Function to call.
+    ## @param args Arguments to call the function with.
+    def call_soon_threadsafe(self, func, *args):
+        with self._pending_lock:
+            self._pending.append((func, args))
+
+        try:
+            os.write(self._wakeup_write, b"\0")
+        except OSError as e:
+            # The pipe is full, so the loop will wake up anyway.
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+
+    ## Stop the loop once the current iteration is done.
+    def stop(self):
+        self._running = False
+
+    ## Run the loop.
+    ## @param done Function returning True when the loop should stop, called
+    ## after every iteration.
+    def run(self, done = None):
+        self._running = True
+
+        while self._running and not (done and done()):
+            self.run_once()
+
+    ## Wait for an event and run the callbacks of everything that is ready.
+    def run_once(self):
+        # Drop cancelled timers, and figure out how long we may sleep.
+        while self._timers and self._timers[0][4]:
+            heapq.heappop(self._timers)
+
+        timeout = None
+
+        if self._timers:
+            timeout = max(0.0, self._timers[0][0] - time.time())
+
+        readers = list(self._readers.keys()) + [self._wakeup_read]
+
+        try:
+            (readable, writable, _) = select.select(readers, list(self._writers.keys()), [], timeout)
+        except (select.error, OSError) as e:
+            if e.args[0] == errno.EINTR:
+                return
+
+            raise
+
+        for fd in readable:
+            if fd == self._wakeup_read:
+                self._handle_wakeup()
+            # The callback of an earlier socket may have removed this one.
+            elif fd in self._readers:
+                self._readers[fd][1]()
+
+        for fd in writable:
+            if fd in self._writers:
+                self._writers[fd][1]()
+
+        # Run the timers that are due.
+        now = time.time()
+
+        while self._timers and self._timers[0][0] <= now:
+            timer = heapq.heappop(self._timers)
+
+            if not timer[4]:
+                timer[2](*timer[3])
+
+    ## Run the callbacks added by other threads.
+    def _handle_wakeup(self):
+        try:
+            while os.read(self._wakeup_read, 4096):
+                pass
+        except OSError as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+
+        with self._pending_lock:
+            (pending, self._pending) = (self._pending, [])
+
+        for (func, args) in pending:
+            func(*args)
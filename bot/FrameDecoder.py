@@ -0,0 +1,131 @@
+#*************************************************************************
+#*            Atrinik, a Multiplayer Online Role Playing Game            *
+#*                                                                       *
+#*    Copyright (C) 2009-2014 Alex Tokar and Atrinik Development Team    *
+#*                                                                       *
+#* Fork from Crossfire (Multiplayer game for X-windows).                 *
+#*                                                                       *
+#* This program is free software; you can redistribute it and/or modify  *
+#* it under the terms of the GNU General Public License as published by  *
+#* the Free Software Foundation; either version 2 of the License, or     *
+#* (at your option) any later version.                                   *
+#*                                                                       *
+#* This program is distributed in the hope that it will be useful,       *
+#* but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#* MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#* GNU General Public License for more details.                          *
+#*                                                                       *
+#* You should have received a copy of the GNU General Public License     *
+#* along with this program; if not, write to the Free Software           *
+#* Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.             *
+#*                                                                       *
+#* The author can be reached at admin@atrinik.org                        *
+#*************************************************************************
+
+
+## @file
+## Decoder for the packets sent by the game server.
+
+import zlib
+
+try:
+    # Python 2: zlib does not accept memoryviews, but buffer objects are
+    # zero-copy views as well.
+    _view = buffer
+except NameError:
+    ## Create a zero-copy view of part of a buffer.
+    def _view(data, offset, size):
+        return memoryview(data)[offset:offset + size]
+
+## Splits the data stream received from the game server into commands.
+##
+## Each command is prefixed by a header with its length: 2 bytes, or 3 if
+## the highest bit of the first byte is set. The first byte of the command
+## is the command ID; command #0 marks zlib-compressed data, which starts
+## with the uncompressed length (4 bytes) followed by the compressed command.
+class FrameDecoder:
+    ## Initialize the decoder.
+    ## @param handler Function called with the command ID and data (bytes)
+    ## of every command.
+    ## @param handles Function that returns whether commands with the given
+    ## ID need to be handled; the data of other commands is never copied or
+    ## uncompressed.
+    def __init__(self, handler, handles = None):
+        self._handler = handler
+        self._handles = handles or (lambda cmd_id: True)
+        self.reset()
+
+    ## Discard any partially received data. May be called by the handler, to
+    ## stop handling the rest of the data passed to feed().
+    def reset(self):
+        self._buf = bytearray()
+        ## Number of commands decoded so far.
+        self.commands = 0
+
+    ## Add received data, and handle all the commands it completes.
+    ## @param data The data.
+    def feed(self, data):
+        buf = self._buf
+        buf += data
+        end = len(buf)
+        pos = 0
+
+        while end - pos >= 2:
+            # Parse the header.
+            if buf[pos] & 0x80:
+                if end - pos < 3:
+                    break
+
+                header_len = 3
+                cmd_len = ((buf[pos] & 0x7f) << 16) + (buf[pos + 1] << 8) + buf[pos + 2]
+            else:
+                header_len = 2
+                cmd_len = (buf[pos] << 8) + buf[pos + 1]
+
+            # Command not complete yet.
+            if end - pos < header_len + cmd_len:
+                break
+
+            start = pos + header_len
+            pos = start + cmd_len
+
+            if cmd_len == 0:
+                continue
+
+            self.commands += 1
+            cmd_id = buf[start]
+
+            # Command #0 marks compressed data.
+            if cmd_id == 0:
+                self._handle_compressed(_view(buf, start + 5, cmd_len - 5))
+            elif self._handles(cmd_id):
+                self._handler(cmd_id, bytes(_view(buf, start + 1, cmd_len - 1)))
+
+            # The handler reset the decoder, discard the rest of the data.
+            if self._buf is not buf:
+                return
+
+        # Drop the handled commands. Nothing may hold a view of the buffer
+        # by now, so that it can be resized.
+        if pos:
+            del buf[:pos]
+
+    ## Handle a compressed command.
+    ## @param data View of the compressed data.
+    def _handle_compressed(self, data):
+        # Only uncompress the command ID first, to skip uncompressing
+        # commands that aren't handled.
+        decompressor = zlib.decompressobj()
+        head = decompressor.decompress(data, 1)
+
+        if not head:
+            return
+
+        cmd_id = bytearray(head)[0]
+
+        if not self._handles(cmd_id):
+            return
+
+        # Uncompress the rest of the command.
+        rest = decompressor.decompress(decompressor.unconsumed_tail) + decompressor.flush()
+        self._handler(cmd_id, rest)
@@ -25,7 +25,13 @@
 ## @file
 ## Handles kills log.
 
+from Leaderboard import Leaderboard
+
 ## Kills logging.
+##
+## Only the number of kills of each killer, and the number of times they
+## have killed each victim, are kept in the database. The individual kills
+## are recorded in the bot's EventLog.
 class KillsLog:
     ## Initialize the class.
     ## @param bot The associated bot.
@@ -36,6 +42,49 @@ class KillsLog:
         if not "kills" in self._bot.db:
             self._bot.db["kills"] = {}
 
+        ## Leaderboards of the killers, by the kind of the kills ("normal"
+        ## or "arena").
+        self.leaderboards = {
+            "normal": Leaderboard(),
+            "arena": Leaderboard(),
+        }
+
+        for (key, killer) in self._bot.db["kills"].items():
+            self._upgrade_killer(killer)
+
+            for (entry, leaderboard) in self.leaderboards.items():
+                leaderboard.set(key, killer[entry])
+
+    ## Convert a killer from the old format, which had lists of all the
+    ## kills, to counters, moving the kills to the event log.
+    ## @param killer The killer's dictionary.
+    def _upgrade_killer(self, killer):
+        if "victims" in killer:
+            return
+
+        killer["victims"] = {"normal": {}, "arena": {}}
+
+        for entry in ("normal", "arena"):
+            for (victim, how) in killer[entry]:
+                self._bot.events.append(killer["name"], victim, how,
+                                        entry == "arena", 0)
+                self._count_victim(killer, entry, victim)
+
+            killer[entry] = len(killer[entry])
+
+    ## Increase the number of times a killer has killed a victim.
+    ## @param killer The killer's dictionary.
+    ## @param entry Kind of the kill, "normal" or "arena".
+    ## @param victim The victim.
+    def _count_victim(self, killer, entry, victim):
+        victims = killer["victims"][entry]
+        key = victim.lower()
+
+        if key in victims:
+            victims[key][1] += 1
+        else:
+            victims[key] = [victim, 1]
+
     ## Initialize a new killer in the dictionary.
     ##
     ## If the killer already exists, it will not be re-initialized.
@@ -49,8 +98,9 @@ class KillsLog:
         # lowercased when used as a key, for easier searching.
         self._bot.db["kills"][name.lower()] = {
             "name": name,
-            "normal": [],
-            "arena": [],
+            "normal": 0,
+            "arena": 0,
+            "victims": {"normal": {}, "arena": {}},
         }
 
     ## Log a kill.
@@ -61,10 +111,43 @@ class KillsLog:
     def kill_log(self, name, victim, how, pvp):
         self._init_killer(name)
         name = name.lower()
+        entry = "arena" if pvp else "normal"
+        killer = self._bot.db["kills"][name]
 
-        if pvp:
-            where = self._bot.db["kills"][name]["arena"]
-        else:
-            where = self._bot.db["kills"][name]["normal"]
+        killer[entry] += 1
+        self._count_victim(killer, entry, victim)
+        self.leaderboards[entry].set(name, killer[entry])
+
+    ## Get the number of kills of a killer.
+    ## @param name Killer's name.
+    ## @param pvp If True, get the number of PvP kills.
+    ## @return The number of kills.
+    def get_kills(self, name, pvp):
+        return self.leaderboards["arena" if pvp else "normal"].get(
+            name.lower())
+
+    ## Get the number of times a killer has killed a victim.
+    ## @param name Killer's name.
+    ## @param victim The victim.
+    ## @param pvp If True, get the number of PvP kills.
+    ## @return Tuple of the victim's name and the number of kills, None if
+    ## the killer has never killed the victim.
+    def get_victim_kills(self, name, victim, pvp):
+        try:
+            killer = self._bot.db["kills"][name.lower()]
+        except KeyError:
+            return None
+
+        victim = killer["victims"]["arena" if pvp else "normal"].get(
+            victim.lower())
+        return tuple(victim) if victim else None
 
-        where.append((victim, how))
+    ## Get the killers with the most kills.
+    ## @param num Maximum number of killers to return.
+    ## @param pvp If True, get the killers with the most PvP kills.
+    ## @return List of tuples of the killers' names and number of kills,
+    ## most kills first.
+    def get_top(self, num, pvp):
+        kills = self._bot.db["kills"]
+        return [(kills[key]["name"], count) for (key, count) in
+                self.leaderboards["arena" if pvp else "normal"].top(num)]
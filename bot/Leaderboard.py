@@ -0,0 +1,76 @@
+#*************************************************************************
+#*            Atrinik, a Multiplayer Online Role Playing Game            *
+#*                                                                       *
+#*    Copyright (C) 2009-2014 Alex Tokar and Atrinik Development Team    *
+#*                                                                       *
+#* Fork from Crossfire (Multiplayer game for X-windows).                 *
+#*                                                                       *
+#* This program is free software; you can redistribute it and/or modify  *
+#* it under the terms of the GNU General Public License as published by  *
+#* the Free Software Foundation; either version 2 of the License, or     *
+#* (at your option) any later version.                                   *
+#*                                                                       *
+#* This program is distributed in the hope that it will be useful,       *
+#* but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#* MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#* GNU General Public License for more details.                          *
+#*                                                                       *
+#* You should have received a copy of the GNU General Public License     *
+#* along with this program; if not, write to the Free Software           *
+#* Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.             *
+#*                                                                       *
+#* The author can be reached at admin@atrinik.org                        *
+#*************************************************************************
+
+## @file
+## Incrementally maintained leaderboards.
+
+import bisect
+
+## Keeps keys sorted by their counts, highest first.
+##
+## Counts are expected to change a little at a time, so updating a count
+## moves a single entry, and getting the top entries is only as expensive
+## as the number of entries returned.
+class Leaderboard:
+    ## Initialize the class.
+    def __init__(self):
+        ## Sorted list of tuples of the negated counts and the keys.
+        self._entries = []
+        ## Maps keys to their counts.
+        self._counts = {}
+
+    ## Set the count of a key.
+    ## @param key The key.
+    ## @param count The new count.
+    def set(self, key, count):
+        old = self._counts.get(key)
+
+        if old == count:
+            return
+
+        if old is not None:
+            del self._entries[bisect.bisect_left(self._entries, (-old, key))]
+
+        self._counts[key] = count
+
+        if count > 0:
+            bisect.insort(self._entries, (-count, key))
+        else:
+            del self._counts[key]
+
+    ## Get the count of a key.
+    ## @param key The key.
+    ## @return The count, 0 if the key is not in the leaderboard.
+    def get(self, key):
+        return self._counts.get(key, 0)
+
+    ## Get the keys with the highest counts.
+    ## @param num Maximum number of keys to return.
+    ## @return List of tuples of the keys and their counts, highest count
+    ## first.
+    def top(self, num):
+        return [(key, -count) for (count, key) in self._entries[:num]]
+
+    def __len__(self):
+        return len(self._entries)
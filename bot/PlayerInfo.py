@@ -26,6 +26,7 @@
 ## Player info storage.
 
 import time
+from Leaderboard import Leaderboard
 
 ## Player info storage class.
 class PlayerInfo:
@@ -38,6 +39,22 @@ class PlayerInfo:
         if not "players" in self._bot.db:
             self._bot.db["players"] = {}
 
+        ## Leaderboards of the players, by the kind of the deaths ("deaths"
+        ## or "deaths_arena").
+        self.leaderboards = {
+            "deaths": Leaderboard(),
+            "deaths_arena": Leaderboard(),
+        }
+
+        for (name, player) in self._bot.db["players"].items():
+            for (entry, leaderboard) in self.leaderboards.items():
+                # Deaths used to be stored as lists of all the deaths; the
+                # deaths themselves are in the kills log.
+                if isinstance(player[entry], list):
+                    player[entry] = len(player[entry])
+
+                leaderboard.set(name, player[entry])
+
     ## Initialize a new player in the database.
     ##
     ## If the player is already in the database, their dictionary will not
@@ -55,8 +72,8 @@ class PlayerInfo:
             "race": None,
             "class": None,
             "extra": None,
-            "deaths": [],
-            "deaths_arena": [],
+            "deaths": 0,
+            "deaths_arena": 0,
         }
 
     ## Update player's last seen timestamp.
@@ -84,10 +101,16 @@ class PlayerInfo:
     ## @param pvp If not None, the player was killed in PvP.
     def death_log(self, name, killer, how, pvp):
         self.init_player(name)
+        entry = "deaths_arena" if pvp else "deaths"
+        player = self._bot.db["players"][name]
 
-        if pvp:
-            where = self._bot.db["players"][name]["deaths_arena"]
-        else:
-            where = self._bot.db["players"][name]["deaths"]
+        player[entry] += 1
+        self.leaderboards[entry].set(name, player[entry])
 
-        where.append((killer, how))
+    ## Get the players with the most deaths.
+    ## @param num Maximum number of players to return.
+    ## @param pvp If True, get the players with the most PvP deaths.
+    ## @return List of tuples of the players' names and number of deaths,
+    ## most deaths first.
+    def get_top_deaths(self, num, pvp):
+        return self.leaderboards["deaths_arena" if pvp else "deaths"].top(num)
@@ -30,6 +30,7 @@ import CommitChecker, time, threading, shelve
 from misc import *
 from Bot import *
 from CIA import *
+from EventLoop import *
 from howie import Howie
 
 try:
@@ -44,6 +45,8 @@ db_lock = threading.RLock()
 db = shelve.open("bot.db", writeback = True)
 bots = []
 cia = None
+## The event loop driving all the bots.
+loop = EventLoop()
 
 ## The main function.
 def main():
@@ -62,60 +65,33 @@ def main():
             if not chatbot:
                 chatbot = Howie.Howie()
 
-            bot = Bot((config.get(section, "host"), config.getint(section, "port"), config.get(section, "name"), config.get(section, "pswd")), bots, config, section)
+            bot = Bot((config.get(section, "host"), config.getint(section, "port"), config.get(section, "name"), config.get(section, "pswd")), bots, config, section, loop)
             bot.howie = chatbot
             bots.append(bot)
 
     # If commits checker is enabled, do some work.
     if CommitChecker.enabled:
-        commits_check = time.time() + config.getfloat("General", "commits_check_delay")
-
         if not "branches" in db:
             db["branches"] = {}
 
-    # The main infinite loop.
-    while True:
-        # No bots left, bail out.
-        if not bots and not cia:
-            print("No bots running left, bailing out.")
-            break
-
-        # Get the current time.
-        t1 = time.time()
-
-        # If commits checker is enabled and enough time has elapsed since
-        # last time we checked for new commits, try to check for new commits
-        # again.
-        if CommitChecker.enabled and t1 >= commits_check:
+        ## Check for new commits, and schedule the next check.
+        def commits_check():
             # Create the commits checker thread and start it.
             thread = CommitChecker.CommitChecker(config, db, db_lock, bots, cia)
             thread.start()
-            # Update time of next check.
-            commits_check = t1 + config.getfloat("General", "commits_check_delay")
-
-        # Handle all active connections.
-        for connection in bots:
-            if not connection.handle_reconnect():
-                continue
-
-            connection.handle_data()
-            connection.handle_extra()
+            loop.call_later(config.getfloat("General", "commits_check_delay"), commits_check)
 
-        # Get the current time again.
-        t2 = time.time()
-        # Figure out how long to sleep for.
-        sleep_time = config.getfloat("General", "sleep_time") - (t2 - t1)
+        loop.call_later(config.getfloat("General", "commits_check_delay"), commits_check)
 
-        # Sleep for so much time if possible (do not try sleeping for
-        # negative amounts of time).
-        if sleep_time > 0.0:
-            time.sleep(sleep_time)
+    # Run the event loop until there are no bots left.
+    loop.run(lambda: not bots and not cia)
+    print("No bots running left, bailing out.")
 
 try:
     main()
 finally:
     # Close all connections.
-    for connection in bots:
+    for connection in bots[:]:
         connection.close()
 
     # Close the database.
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+#*************************************************************************
+#*            Atrinik, a Multiplayer Online Role Playing Game            *
+#*                                                                       *
+#*    Copyright (C) 2009-2014 Alex Tokar and Atrinik Development Team    *
+#*                                                                       *
+#* Fork from Crossfire (Multiplayer game for X-windows).                 *
+#*                                                                       *
+#* This program is free software; you can redistribute it and/or modify  *
+#* it under the terms of the GNU General Public License as published by  *
+#* the Free Software Foundation; either version 2 of the License, or     *
+#* (at your option) any later version.                                   *
+#*                                                                       *
+#* This program is distributed in the hope that it will be useful,       *
+#* but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#* MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#* GNU General Public License for more details.                          *
+#*                                                                       *
+#* You should have received a copy of the GNU General Public License     *
+#* along with this program; if not, write to the Free Software           *
+#* Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.             *
+#*                                                                       *
+#* The author can be reached at admin@atrinik.org                        *
+#*************************************************************************
+
+
+## @file
+## Benchmark for the game server packet decoder.
+##
+## Replays data captured by a bot (see the capture option of the game
+## sections in config.cfg) through the decoder, in chunks of the size the
+## socket would return, and reports how fast it was decoded. Synthetic
+## traffic can be generated with --generate if no capture is at hand.
+
+import argparse, random, struct, time, zlib
+from CommandHandler import CommandHandler
+from FrameDecoder import FrameDecoder
+from misc import NDI
+
+## Frame a command the way the server does.
+## @param cmd_id The command ID.
+## @param data The command's data.
+## @param compress Whether to compress the command.
+## @return The framed command.
+def frame(cmd_id, data, compress = False):
+    data = struct.pack("B", cmd_id) + data
+
+    if compress:
+        data = struct.pack(">BI", 0, len(data)) + zlib.compress(data)
+
+    l = len(data)
+
+    if l > 0x7fff:
+        return struct.pack(">BH", 0x80 | (l >> 16), l & 0xffff) + data
+
+    return struct.pack(">H", l) + data
+
+## Generate synthetic server traffic: mostly compressed map updates, with
+## chat and /who messages in between.
+## @param path File to write the traffic to.
+## @param size Approximate size of the traffic in bytes.
+def generate(path, size):
+    rnd = random.Random(0)
+    written = 0
+
+    with open(path, "wb") as f:
+        while written < size:
+            r = rnd.random()
+
+            if r < 0.4:
+                data = frame(2, bytes(bytearray(rnd.randrange(64) for i in range(rnd.randrange(200, 4000)))), True)
+            elif r < 0.7:
+                data = frame(8, bytes(bytearray(rnd.randrange(256) for i in range(rnd.randrange(20, 200)))))
+            elif r < 0.9:
+                msg = "Player{0} the human fighter (lvl {1})".format(rnd.randrange(100), rnd.randrange(1, 110))
+                data = frame(4, struct.pack(">H", 0) + NDI.WHITE.encode() + b"\0" + msg.encode() + b"\0")
+            else:
+                msg = "Player{0} tells you: hello".format(rnd.randrange(100))
+                data = frame(4, struct.pack(">H", NDI.TELL) + NDI.WHITE.encode() + b"\0" + msg.encode() + b"\0", rnd.random() < 0.5)
+
+            f.write(data)
+            written += len(data)
+
+## Stands in for the bot the command handler belongs to.
+class BenchmarkBot:
+    name = "Benchmark"
+
+def main():
+    parser = argparse.ArgumentParser(description = "Replay captured server traffic through the packet decoder.")
+    parser.add_argument("capture", help = "File with the captured traffic.")
+    parser.add_argument("-c", "--chunk", type = int, default = 65536, help = "Number of bytes to feed to the decoder at once.")
+    parser.add_argument("-r", "--repeat", type = int, default = 10, help = "Number of times to replay the traffic.")
+    parser.add_argument("-g", "--generate", type = int, metavar = "SIZE", help = "Generate SIZE bytes of synthetic traffic into the capture file first.")
+    args = parser.parse_args()
+
+    if args.generate:
+        generate(args.capture, args.generate)
+
+    with open(args.capture, "rb") as f:
+        data = f.read()
+
+    chunks = [data[i:i + args.chunk] for i in range(0, len(data), args.chunk)]
+    # The bot's command handler decides which commands are decoded; the
+    # commands themselves are only counted, so the handler only needs a
+    # bot with a name.
+    ch = CommandHandler(BenchmarkBot())
+    handled = [0]
+
+    def handler(cmd_id, data):
+        handled[0] += 1
+
+    decoder = FrameDecoder(handler, ch.handles)
+    start = time.time()
+
+    for i in range(args.repeat):
+        for chunk in chunks:
+            decoder.feed(chunk)
+
+    elapsed = time.time() - start
+
+    print("Data:      {0} bytes in {1} chunks, replayed {2} times".format(len(data), len(chunks), args.repeat))
+    print("Commands:  {0} ({1} handled)".format(decoder.commands, handled[0]))
+    print("Time:      {0:.3f} seconds".format(elapsed))
+    print("Rate:      {0:.1f} MB/s, {1:.0f} commands/s".format(len(data) * args.repeat / elapsed / 1024 / 1024, decoder.commands / elapsed))
+
+if __name__ == "__main__":
+    main()
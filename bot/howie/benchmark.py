@@ -0,0 +1,133 @@
+#!/usr/bin/python
+"""Benchmark for the AIML pattern matcher.
+
+Loads the brain, then replays a corpus of chat lines (one per line) against
+it and reports how long matching took. Usage:
+
+    ./benchmark.py [options] corpus.txt
+
+"""
+
+import glob
+import optparse
+import os
+import Queue
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "howie"))
+
+import aiml
+
+def load_kernel(options):
+    """Create a Kernel and load the brain into it."""
+    kernel = aiml.Kernel()
+    kernel.verbose(False)
+
+    start = time.time()
+
+    if options.brain:
+        kernel.loadBrain(options.brain)
+    else:
+        for path in sorted(glob.glob(options.aiml)):
+            kernel.learn(path)
+
+    print("Loaded %d categories in %.2f seconds" % (kernel.numCategories(), time.time() - start))
+    return kernel
+
+def replay(kernel, lines, match_only):
+    """Replay the lines, returning a list of (seconds, line) tuples."""
+    timings = []
+    brain = kernel._brain
+
+    for line in lines:
+        start = time.time()
+
+        if match_only:
+            brain.matchObject(line, "", "")
+        else:
+            kernel.respond(line, "benchmark")
+
+        timings.append((time.time() - start, line))
+
+    return timings
+
+def replay_sessions(kernel, lines, sessions, threads):
+    """Replay the lines from several concurrent sessions, spread over
+    a pool of threads, returning a list of (seconds, line) tuples."""
+    timings = []
+    queue = Queue.Queue()
+
+    for session in range(sessions):
+        queue.put(("benchmark-%d" % session, lines[session::sessions]))
+
+    def worker():
+        while True:
+            try:
+                session, session_lines = queue.get_nowait()
+            except Queue.Empty:
+                return
+
+            for line in session_lines:
+                start = time.time()
+                kernel.respond(line, session)
+                timings.append((time.time() - start, line))
+
+    workers = [threading.Thread(target = worker) for i in range(threads)]
+
+    for thread in workers:
+        thread.start()
+
+    for thread in workers:
+        thread.join()
+
+    return timings
+
+def main():
+    parser = optparse.OptionParser(usage = "%prog [options] corpus.txt")
+    parser.add_option("-a", "--aiml", default = os.path.join(os.path.dirname(os.path.abspath(__file__)), "standard", "*.aiml"), help = "AIML files to load (glob pattern).")
+    parser.add_option("-b", "--brain", help = "Load this brain file instead of the AIML files.")
+    parser.add_option("-r", "--repeat", type = "int", default = 1, help = "Number of times to replay the corpus.")
+    parser.add_option("-m", "--match-only", action = "store_true", help = "Only time the pattern matching, not the full response.")
+    parser.add_option("-n", "--sessions", type = "int", default = 1, help = "Number of sessions to spread the corpus over.")
+    parser.add_option("-t", "--threads", type = "int", default = 1, help = "Number of threads responding to the sessions concurrently.")
+    parser.add_option("-s", "--slowest", type = "int", default = 5, help = "Number of slowest lines to show.")
+    options, args = parser.parse_args()
+
+    if len(args) != 1:
+        parser.error("no corpus given")
+
+    fp = open(args[0], "r")
+    lines = [line.strip().decode("utf-8", "replace") for line in fp]
+    lines = [line for line in lines if line]
+    fp.close()
+
+    kernel = load_kernel(options)
+    timings = []
+
+    start = time.time()
+
+    for i in range(options.repeat):
+        if options.sessions > 1 or options.threads > 1:
+            timings += replay_sessions(kernel, lines, options.sessions, options.threads)
+        else:
+            timings += replay(kernel, lines, options.match_only)
+
+    elapsed = time.time() - start
+
+    print("Lines:      %d" % len(timings))
+    print("Time:       %.3f seconds" % elapsed)
+    print("Lines/sec:  %.1f" % (len(timings) / elapsed))
+    print("Average:    %.3f ms" % (elapsed / len(timings) * 1000))
+
+    if not options.match_only:
+        print("Cache hits: %d" % kernel._responseCacheHits)
+
+    timings.sort(reverse = True)
+
+    for seconds, line in timings[:options.slowest]:
+        print("%10.3f ms  %s" % (seconds * 1000, line.encode("utf-8")))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""This module implements the compiled brain format, a flattened form of the
+PatternMgr node tree that can be memory-mapped and used for matching
+without loading it first.
+
+File layout (all integers are little-endian):
+ - header: magic, counts and section offsets, followed by the bot name.
+ - word table: offsets of the words, then the UTF-8 encoded words, sorted.
+ - node table: one record per node.  A record holds a slot for each of the
+   PatternMgr special keys (the index of the child node, or of the template
+   for the template key; -1 if there is none), followed by the index and
+   number of the node's word edges.  Node 0 is the root.
+ - edge table: (word index, child node index) pairs, sorted by word index
+   for each node.
+ - template table: offsets of the templates, then the marshalled templates.
+
+Nodes and templates are only read from the file when the matcher first
+visits them.
+
+"""
+
+import marshal
+import mmap
+import os
+import struct
+
+MAGIC = "PYAIMLB1"
+
+# Special dictionary keys of the PatternMgr are the integers from 0 to
+# NUM_SLOTS-1; everything else is a word.
+NUM_SLOTS = 6
+
+_header = struct.Struct("<8sIIIIIIIIII")
+_node = struct.Struct("<%diII" % NUM_SLOTS)
+_edge = struct.Struct("<II")
+_offset = struct.Struct("<I")
+
+def isCompiledBrain(filename):
+    """Return True if filename is a compiled brain."""
+    try:
+        f = open(filename, "rb")
+    except IOError:
+        return False
+    try:
+        return f.read(len(MAGIC)) == MAGIC
+    finally:
+        f.close()
+
+def _encodeWord(word):
+    if isinstance(word, unicode):
+        return word.encode("utf-8")
+    return word
+
+def write(filename, root, templateCount, botName, templateKey):
+    """Compile the node tree starting at root into filename."""
+    # Number the nodes breadth-first, so that the nodes near the root, which
+    # are visited the most, end up close together in the file.
+    nodes = [root]
+    words = set()
+    i = 0
+    while i < len(nodes):
+        for key, child in nodes[i].iteritems():
+            if type(key) is int:
+                if key != templateKey:
+                    nodes.append(child)
+            else:
+                words.add(_encodeWord(key))
+                nodes.append(child)
+        i += 1
+
+    words = sorted(words)
+    wordIds = dict((word, index) for index, word in enumerate(words))
+
+    # Child node indices follow from the breadth-first order above.
+    nodeRecords = []
+    edges = []
+    templates = []
+    nextNode = 1
+    for node in nodes:
+        slots = [-1] * NUM_SLOTS
+        nodeEdges = []
+        for key, child in node.iteritems():
+            if type(key) is int:
+                if key == templateKey:
+                    slots[key] = len(templates)
+                    templates.append(marshal.dumps(child))
+                else:
+                    slots[key] = nextNode
+                    nextNode += 1
+            else:
+                nodeEdges.append((wordIds[_encodeWord(key)], nextNode))
+                nextNode += 1
+        nodeEdges.sort()
+        nodeRecords.append(_node.pack(*(slots + [len(edges), len(nodeEdges)])))
+        edges.extend(nodeEdges)
+
+    botName = _encodeWord(botName)
+    wordsOffset = _header.size + len(botName)
+    wordBlobSize = sum(len(word) for word in words)
+    nodesOffset = wordsOffset + (len(words) + 1) * _offset.size + wordBlobSize
+    edgesOffset = nodesOffset + len(nodes) * _node.size
+    templatesOffset = edgesOffset + len(edges) * _edge.size
+
+    tmpName = filename + ".tmp"
+    f = open(tmpName, "wb")
+    try:
+        f.write(_header.pack(MAGIC, templateCount, len(botName), len(words), len(nodes), len(edges), len(templates), wordsOffset, nodesOffset, edgesOffset, templatesOffset))
+        f.write(botName)
+
+        offset = (len(words) + 1) * _offset.size
+        for word in words:
+            f.write(_offset.pack(offset))
+            offset += len(word)
+        f.write(_offset.pack(offset))
+        f.write("".join(words))
+
+        f.write("".join(nodeRecords))
+        f.write("".join(_edge.pack(*edge) for edge in edges))
+
+        offset = (len(templates) + 1) * _offset.size
+        for template in templates:
+            f.write(_offset.pack(offset))
+            offset += len(template)
+        f.write(_offset.pack(offset))
+        f.write("".join(templates))
+    finally:
+        f.close()
+    os.rename(tmpName, filename)
+
+class CompiledNode(object):
+    """A node of a compiled brain.
+
+    Supports the parts of the dictionary interface the matcher uses.  Node
+    objects are cached by the brain, so the same node is always represented
+    by the same object.  The word edges of a node are only read the first
+    time a word is looked up in it.
+
+    """
+    __slots__ = ("_brain", "_slots", "_firstEdge", "_numEdges", "_edges", "_template")
+
+    def __init__(self, brain, record):
+        self._brain = brain
+        self._slots = record[:NUM_SLOTS]
+        self._firstEdge = record[NUM_SLOTS]
+        self._numEdges = record[NUM_SLOTS + 1]
+        self._edges = None
+        self._template = None
+
+    def get(self, key, default = None):
+        if type(key) is int:
+            index = self._slots[key]
+            if index == -1:
+                return default
+            brain = self._brain
+            if key == brain.templateKey:
+                if self._template is None:
+                    self._template = brain.template(index)
+                return self._template
+            return brain.node(index)
+
+        if self._numEdges == 0:
+            return default
+        edges = self._edges
+        if edges is None:
+            edges = self._edges = self._brain.edges(self._firstEdge, self._numEdges)
+        index = edges.get(self._brain.wordId(key))
+        if index is None:
+            return default
+        return self._brain.node(index)
+
+    def has_key(self, key):
+        return self.get(key) is not None
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError, key
+        return value
+
+    def iteritems(self):
+        """Iterate over the (key, child) pairs of this node, in the form
+        used by the PatternMgr node tree."""
+        brain = self._brain
+        for key, index in enumerate(self._slots):
+            if index != -1:
+                yield key, self.get(key)
+        edges = brain.edges(self._firstEdge, self._numEdges)
+        for wordId in sorted(edges):
+            yield brain.word(wordId).decode("utf-8"), brain.node(edges[wordId])
+
+class CompiledBrain(object):
+    """A memory-mapped compiled brain file."""
+    # Maximum number of word lookups to remember.
+    _maxWordCache = 10000
+
+    def __init__(self, filename, templateKey):
+        f = open(filename, "rb")
+        try:
+            self.mm = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        finally:
+            f.close()
+
+        (magic, self.templateCount, botNameLength, self.numWords, self.numNodes, self.numEdges, self.numTemplates,
+            self.wordsOffset, self.nodesOffset, self.edgesOffset, self.templatesOffset) = _header.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError, "%s is not a compiled brain" % filename
+        self.botName = self.mm[_header.size:_header.size + botNameLength].decode("utf-8")
+        self.templateKey = templateKey
+        self._nodes = {}
+        self._words = {}
+
+    def close(self):
+        self.mm.close()
+
+    def root(self):
+        return self.node(0)
+
+    def node(self, index):
+        """Return the node with the specified index."""
+        try:
+            return self._nodes[index]
+        except KeyError:
+            node = CompiledNode(self, _node.unpack_from(self.mm, self.nodesOffset + index * _node.size))
+            # setdefault() is atomic, so that threads matching concurrently
+            # always share the same object for a node.
+            return self._nodes.setdefault(index, node)
+
+    def edges(self, first, num):
+        """Read num edges starting at the edge with index first into a
+        dictionary mapping word indices to child node indices."""
+        values = struct.unpack_from("<%dI" % (num * 2), self.mm, self.edgesOffset + first * _edge.size)
+        return dict(zip(values[::2], values[1::2]))
+
+    def template(self, index):
+        """Load the template with the specified index."""
+        start, end = struct.unpack_from("<II", self.mm, self.templatesOffset + index * _offset.size)
+        return marshal.loads(self.mm[self.templatesOffset + start:self.templatesOffset + end])
+
+    def word(self, wordId):
+        """Return the UTF-8 encoded word with the specified index."""
+        start, end = struct.unpack_from("<II", self.mm, self.wordsOffset + wordId * _offset.size)
+        return self.mm[self.wordsOffset + start:self.wordsOffset + end]
+
+    def wordId(self, word):
+        """Return the index of word in the word table, None if the word
+        does not appear in any pattern."""
+        try:
+            return self._words[word]
+        except KeyError:
+            pass
+
+        encoded = _encodeWord(word)
+        result = None
+        lo = 0
+        hi = self.numWords
+        while lo < hi:
+            mid = (lo + hi) // 2
+            midWord = self.word(mid)
+            if midWord < encoded:
+                lo = mid + 1
+            elif midWord > encoded:
+                hi = mid
+            else:
+                result = mid
+                break
+
+        if len(self._words) >= self._maxWordCache:
+            self._words.clear()
+        self._words[word] = result
+        return result
@@ -1,12 +1,14 @@
 # -*- coding: latin-1 -*-
 """This file contains the public interface to the aiml module."""
 import AimlParser
+import CompiledBrain
 import DefaultSubs
 import Utils
 from PatternMgr import PatternMgr
 from WordSub import WordSub
 
 from ConfigParser import ConfigParser
+from collections import OrderedDict
 import copy
 import glob
 import os
@@ -24,22 +26,39 @@ class Kernel:
     _globalSessionID = "_global" # key of the global session (duh)
     _maxHistorySize = 10 # maximum length of the _inputs and _responses lists
     _maxRecursionDepth = 100 # maximum number of recursive <srai>/<sr> tags before the response is aborted.
+    _maxResponseCacheSize = 1000 # maximum number of responses to deterministic templates to remember
+    # elements whose result depends on more than the matched input, or which have side effects;
+    # responses to templates containing any of them are never cached.
+    _volatileElements = frozenset([
+        "condition", "date", "get", "gossip", "id", "input", "javascript",
+        "learn", "random", "set", "size", "system", "that",
+    ])
     # special predicate keys
     _inputHistory = "_inputHistory"     # keys to a queue (list) of recent user input
     _outputHistory = "_outputHistory"   # keys to a queue (list) of recent responses.
     _inputStack = "_inputStack"         # Should always be empty in between calls to respond()
+    _matchStack = "_matchStack"         # Match objects of the inputs in the input stack
+    _subbedCache = "_subbedCache"       # 'that' and 'topic' as last passed through the 'normal' subber
+    _volatile = "_volatile"             # Whether the response being built can't be cached
 
     def __init__(self):
         self._verboseMode = True
         self._version = "PyAIML 0.8.4"
         self._brain = PatternMgr()
-        self._respondLock = threading.RLock()
         self._textEncoding = "utf-8"
 
-        # set up the sessions        
+        # set up the sessions; each session has its own lock, so that
+        # different sessions can be responded to concurrently.
         self._sessions = {}
+        self._sessionLocks = {}
+        self._sessionsLock = threading.Lock()
         self._addSession(self._globalSessionID)
 
+        # set up the cache of responses to deterministic templates
+        self._responseCache = OrderedDict()
+        self._responseCacheLock = threading.Lock()
+        self._responseCacheHits = 0
+
         # Set up the bot predicates
         self._botPredicates = {}
         self.setBotPredicate("name", "Nameless")
@@ -149,12 +168,19 @@ class Kernel:
         """Attempt to load a previously-saved 'brain' from the
         specified filename.
 
+        The brain may either be saved by saveBrain() or compiled by
+        compileBrain().
+
         NOTE: the current contents of the 'brain' will be discarded!
 
         """
         if self._verboseMode: print "Loading brain from %s..." % filename,
         start = time.clock()
-        self._brain.restore(filename)
+        if CompiledBrain.isCompiledBrain(filename):
+            self._brain.load(filename)
+        else:
+            self._brain.restore(filename)
+        self.clearResponseCache()
         if self._verboseMode:
             end = time.clock() - start
             print "done (%d categories in %.2f seconds)" % (self._brain.numTemplates(), end)
@@ -167,6 +193,22 @@ class Kernel:
         if self._verboseMode:
             print "done (%.2f seconds)" % (time.clock() - start)
 
+    def compileBrain(self, filename):
+        """Write the contents of the bot's brain to a file on disk in the
+        compiled brain format.
+
+        A compiled brain is memory-mapped by loadBrain() instead of being
+        read into memory, so it loads almost instantly and takes up much
+        less memory.  It is read-only: learning new categories after
+        loading it reads the whole brain into memory first.
+
+        """
+        if self._verboseMode: print "Compiling brain to %s..." % filename,
+        start = time.clock()
+        self._brain.compile(filename)
+        if self._verboseMode:
+            print "done (%.2f seconds)" % (time.clock() - start)
+
     def getPredicate(self, name, sessionID = _globalSessionID):
         """Retrieve the current value of the predicate 'name' from the
         specified session.
@@ -206,6 +248,7 @@ class Kernel:
 
         """
         self._botPredicates[name] = value
+        self.clearResponseCache()
         # Clumsy hack: if updating the bot name, we must update the
         # name in the brain as well
         if name == "name":
@@ -237,23 +280,59 @@ class Kernel:
             # iterate over the key,value pairs and add them to the subber
             for k,v in parser.items(s):
                 self._subbers[s][k] = v
+        self.clearResponseCache()
 
     def _addSession(self, sessionID):
-        """Create a new session with the specified ID string."""
-        if self._sessions.has_key(sessionID):
-            return
-        # Create the session.
-        self._sessions[sessionID] = {
-            # Initialize the special reserved predicates
-            self._inputHistory: [],
-            self._outputHistory: [],
-            self._inputStack: []
-        }
+        """Create a new session with the specified ID string, if it
+        doesn't already exist.
+
+        Returns the lock of the session.
+
+        """
+        self._sessionsLock.acquire()
+        try:
+            if self._sessions.has_key(sessionID):
+                return self._sessionLocks[sessionID]
+            # Create the session.
+            sessionLock = threading.RLock()
+            self._sessionLocks[sessionID] = sessionLock
+            self._sessions[sessionID] = {
+                # Initialize the special reserved predicates
+                self._inputHistory: [],
+                self._outputHistory: [],
+                self._inputStack: [],
+                self._matchStack: [],
+                self._subbedCache: {},
+                self._volatile: False
+            }
+            return sessionLock
+        finally:
+            self._sessionsLock.release()
         
     def _deleteSession(self, sessionID):
-        """Delete the specified session."""
-        if self._sessions.has_key(sessionID):
-            _sessions.pop(sessionID)
+        """Delete the specified session.
+
+        Waits for any response to the session in progress to finish.
+
+        """
+        self._sessionsLock.acquire()
+        try: sessionLock = self._sessionLocks.get(sessionID)
+        finally: self._sessionsLock.release()
+        if sessionLock is None:
+            return
+        # The session lock is taken before the sessions lock, in the same
+        # order as respond() takes them when it sets predicates.
+        sessionLock.acquire()
+        try:
+            self._sessionsLock.acquire()
+            try:
+                if self._sessionLocks.get(sessionID) is sessionLock:
+                    self._sessions.pop(sessionID)
+                    self._sessionLocks.pop(sessionID)
+            finally:
+                self._sessionsLock.release()
+        finally:
+            sessionLock.release()
 
     def getSessionData(self, sessionID = None):
         """Return a copy of the session data dictionary for the
@@ -293,6 +372,7 @@ class Kernel:
             # store the pattern/template pairs in the PatternMgr.
             for key,tem in handler.categories.items():
                 self._brain.add(key,tem)
+            self.clearResponseCache()
             # Parsing was successful.
             if self._verboseMode:
                 print "done (%.2f seconds)" % (time.clock() - start)
@@ -306,12 +386,27 @@ class Kernel:
         try: input = input.decode(self._textEncoding, 'replace')
         except UnicodeEncodeError: pass
         
-        # prevent other threads from stomping all over us.
-        self._respondLock.acquire()
+        while True:
+            # Add the session, if it doesn't already exist
+            sessionLock = self._addSession(sessionID)
 
-        # Add the session, if it doesn't already exist
-        self._addSession(sessionID)
+            # prevent other threads from stomping all over this session.
+            # Other sessions can be responded to in the meantime.
+            sessionLock.acquire()
+            try:
+                # The session may have been deleted while we were waiting
+                # for its lock; start over with a new one.
+                if self._sessionLocks.get(sessionID) is not sessionLock:
+                    continue
+                return self._respondSentences(input, sessionID)
+            finally:
+                sessionLock.release()
+
+    def _respondSentences(self, input, sessionID):
+        """Respond to each sentence of the input in turn, updating the
+        input and output histories.
 
+        """
         # split the input into discrete sentences
         sentences = Utils.sentences(input)
         finalResponse = ""
@@ -340,10 +435,52 @@ class Kernel:
 
         assert(len(self.getPredicate(self._inputStack, sessionID)) == 0)
         
-        # release the lock and return
-        self._respondLock.release()
         return finalResponse.encode(self._textEncoding)
 
+    def clearResponseCache(self):
+        """Forget all cached responses.
+
+        Responses to templates that only depend on the matched input
+        are cached; the cache is cleared whenever the brain, the bot
+        predicates or the substitutions change.
+
+        """
+        self._responseCacheLock.acquire()
+        try:
+            self._responseCache.clear()
+        finally:
+            self._responseCacheLock.release()
+
+    def _isDeterministic(self, elem):
+        """Return True if the response to the AIML element only depends
+        on the matched input and has no side effects.
+
+        """
+        if elem[0] in self._volatileElements:
+            return False
+        for e in elem[2:]:
+            if type(e) is list and not self._isDeterministic(e):
+                return False
+        return True
+
+    def _subbedPredicate(self, name, value, sessionID):
+        """Return value run through the 'normal' subber.
+
+        The result is cached per session, as 'that' and 'topic' rarely
+        change between sentences.
+
+        """
+        cache = self.getPredicate(self._subbedCache, sessionID)
+        try:
+            cachedValue, subbed = cache[name]
+            if cachedValue == value:
+                return subbed
+        except KeyError:
+            pass
+        subbed = self._subbers['normal'].sub(value)
+        cache[name] = (value, subbed)
+        return subbed
+
     # This version of _respond() just fetches the response for some input.
     # It does not mess with the input and output histories.  Recursive calls
     # to respond() spawned from tags like <srai> should call this function
@@ -374,24 +511,57 @@ class Kernel:
         outputHistory = self.getPredicate(self._outputHistory, sessionID)
         try: that = outputHistory[-1]
         except IndexError: that = ""
-        subbedThat = self._subbers['normal'].sub(that)
+        subbedThat = self._subbedPredicate("that", that, sessionID)
 
         # fetch the current topic
         topic = self.getPredicate("topic", sessionID)
-        subbedTopic = self._subbers['normal'].sub(topic)
+        subbedTopic = self._subbedPredicate("topic", topic, sessionID)
 
         # Determine the final response.
-        response = ""
-        elem = self._brain.match(subbedInput, subbedThat, subbedTopic)
-        if elem is None:
-            if self._verboseMode:
-                err = "WARNING: No match found for input: %s\n" % input.encode(self._textEncoding)
-                sys.stderr.write(err)
-        else:
-            # Process the element into a response string.
-            response += self._processElement(elem, sessionID).strip()
-            response += " "
-        response = response.strip()
+        cacheKey = (subbedInput, subbedThat, subbedTopic)
+        self._responseCacheLock.acquire()
+        try:
+            response = self._responseCache.pop(cacheKey, None)
+            if response is not None:
+                # move it to the end, as the most recently used response
+                self._responseCache[cacheKey] = response
+                self._responseCacheHits += 1
+        finally:
+            self._responseCacheLock.release()
+
+        if response is None:
+            response = ""
+            match = self._brain.matchObject(subbedInput, subbedThat, subbedTopic)
+            if match is None:
+                if self._verboseMode:
+                    err = "WARNING: No match found for input: %s\n" % input.encode(self._textEncoding)
+                    sys.stderr.write(err)
+            else:
+                # Process the element into a response string.  The match is
+                # kept on the stack for the star elements in the template.
+                # The response can only be cached if neither this template
+                # nor any template reached through <srai> is volatile.
+                session = self._sessions[sessionID]
+                outerVolatile = session[self._volatile]
+                session[self._volatile] = not self._isDeterministic(match.template)
+                matchStack = session[self._matchStack]
+                matchStack.append(match)
+                try:
+                    response += self._processElement(match.template, sessionID).strip()
+                finally:
+                    matchStack.pop()
+                    volatile = session[self._volatile]
+                    session[self._volatile] = outerVolatile or volatile
+                response = response.strip()
+
+                if not volatile:
+                    self._responseCacheLock.acquire()
+                    try:
+                        self._responseCache[cacheKey] = response
+                        while len(self._responseCache) > self._maxResponseCacheSize:
+                            self._responseCache.popitem(last = False)
+                    finally:
+                        self._responseCacheLock.release()
 
         # pop the top entry off the input stack.
         inputStack = self.getPredicate(self._inputStack, sessionID)
@@ -858,16 +1028,11 @@ class Kernel:
         """
         try: index = int(elem[1]['index'])
         except KeyError: index = 1
-        # fetch the user's last input
-        inputStack = self.getPredicate(self._inputStack, sessionID)
-        input = self._subbers['normal'].sub(inputStack[-1])
-        # fetch the Kernel's last response (for 'that' context)
-        outputHistory = self.getPredicate(self._outputHistory, sessionID)
-        try: that = self._subbers['normal'].sub(outputHistory[-1])
-        except: that = "" # there might not be any output yet
-        topic = self.getPredicate("topic", sessionID)
-        response = self._brain.star("star", input, that, topic, index)
-        return response
+        # use the match of the input currently being responded to
+        matchStack = self.getPredicate(self._matchStack, sessionID)
+        try: match = matchStack[-1]
+        except IndexError: return ""
+        return match.star("star", index)
     
     # <system>
     def _processSystem(self,elem, sessionID):
@@ -986,16 +1151,11 @@ class Kernel:
         """
         try: index = int(elem[1]['index'])
         except KeyError: index = 1
-        # fetch the user's last input
-        inputStack = self.getPredicate(self._inputStack, sessionID)
-        input = self._subbers['normal'].sub(inputStack[-1])
-        # fetch the Kernel's last response (for 'that' context)
-        outputHistory = self.getPredicate(self._outputHistory, sessionID)
-        try: that = self._subbers['normal'].sub(outputHistory[-1])
-        except: that = "" # there might not be any output yet
-        topic = self.getPredicate("topic", sessionID)
-        response = self._brain.star("thatstar", input, that, topic, index)
-        return response
+        # use the match of the input currently being responded to
+        matchStack = self.getPredicate(self._matchStack, sessionID)
+        try: match = matchStack[-1]
+        except IndexError: return ""
+        return match.star("thatstar", index)
 
     # <think>
     def _processThink(self,elem, sessionID):
@@ -1027,16 +1187,11 @@ class Kernel:
         """
         try: index = int(elem[1]['index'])
         except KeyError: index = 1
-        # fetch the user's last input
-        inputStack = self.getPredicate(self._inputStack, sessionID)
-        input = self._subbers['normal'].sub(inputStack[-1])
-        # fetch the Kernel's last response (for 'that' context)
-        outputHistory = self.getPredicate(self._outputHistory, sessionID)
-        try: that = self._subbers['normal'].sub(outputHistory[-1])
-        except: that = "" # there might not be any output yet
-        topic = self.getPredicate("topic", sessionID)
-        response = self._brain.star("topicstar", input, that, topic, index)
-        return response
+        # use the match of the input currently being responded to
+        matchStack = self.getPredicate(self._matchStack, sessionID)
+        try: match = matchStack[-1]
+        except IndexError: return ""
+        return match.star("topicstar", index)
 
     # <uppercase>
     def _processUppercase(self,elem, sessionID):
@@ -1139,6 +1294,8 @@ if __name__ == "__main__":
     _testTag(k, 'star test #1', 'You should test star begin', ['Begin star matched: You should']) 
     _testTag(k, 'star test #2', 'test star creamy goodness middle', ['Middle star matched: creamy goodness'])
     _testTag(k, 'star test #3', 'test star end the credits roll', ['End star matched: the credits roll'])
+    _testTag(k, 'star test #5', 'test star end - the credits roll', ['End star matched: - the credits roll'])
+    _testTag(k, 'star test #6', 'test star creamy - goodness middle', ['Middle star matched: creamy - goodness'])
     _testTag(k, 'star test #4', 'test star having multiple stars in a pattern makes me extremely happy',
              ['Multiple stars matched: having, stars in a pattern, extremely happy'])
     _testTag(k, 'system', "test system", ["The system says hello!"])
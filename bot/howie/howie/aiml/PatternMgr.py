@@ -2,12 +2,70 @@
 # by Dr. Richard Wallace at the following site:
 # http://www.alicebot.org/documentation/matching.html
 
+import CompiledBrain
+
 import marshal
 import pprint
 import re
 import string
 import sys
 
+class Match:
+    """The result of matching an input against the patterns.
+
+    Records the words bound by each wildcard of the matched pattern, so that
+    <star/>, <thatstar/> and <topicstar/> elements in the template can be
+    processed without matching the input again.
+
+    """
+    def __init__(self, template, words, indices, spans):
+        self.template = template
+        # Maps the star types to the unmutilated input, 'that' and 'topic',
+        # split into words.
+        self._words = words
+        # Maps the star types to lists of the indices of the unmutilated
+        # words that are left after removing punctuation, that is, the
+        # indices of the matched words in the unmutilated words.
+        self._indices = indices
+        # Maps the star types to lists of (start, end) indices of the
+        # matched words bound by each wildcard.
+        self._spans = spans
+
+    def star(self, starType, index):
+        """Returns a string, the portion of the input that was matched by
+        the index'th (starting at 1) wildcard.
+
+        The 'starType' parameter specifies which type of star to find.
+        Legal values are:
+         - 'star': matches a star in the main pattern.
+         - 'thatstar': matches a star in the that pattern.
+         - 'topicstar': matches a star in the topic pattern.
+
+        """
+        try:
+            spans = self._spans[starType]
+        except KeyError:
+            raise ValueError, "starType must be in ['star', 'thatstar', 'topicstar']"
+        if index < 1 or index > len(spans):
+            return ""
+        start, end = spans[index - 1]
+        words = self._words[starType]
+        indices = self._indices[starType]
+        if end > len(indices):
+            # The wildcard matched the dummy word of an empty 'that' or
+            # 'topic'.
+            return ""
+        # Words that consisted only of punctuation were not matched; they
+        # belong to the wildcard they follow, and a wildcard at the end
+        # gets the rest of the words.
+        if start > 0:
+            start = indices[start - 1] + 1
+        if end == len(indices):
+            end = len(words)
+        else:
+            end = indices[end - 1] + 1
+        return string.join(words[start:end])
+
 class PatternMgr:
     # special dictionary keys
     _UNDERSCORE = 0
@@ -39,6 +97,7 @@ class PatternMgr:
 
     def dump(self):
         """Print all learned patterns, for debugging purposes."""
+        self._thaw()
         pprint.pprint(self._root)
 
     def save(self, filename):
@@ -46,6 +105,7 @@ class PatternMgr:
         restore later, use restore().
 
         """
+        self._thaw()
         try:
             outFile = open(filename, "wb")
             marshal.dump(self._templateCount, outFile)
@@ -68,11 +128,57 @@ class PatternMgr:
             print "Error restoring PatternMgr from file %s:" % filename
             raise Exception, e
 
+    def compile(self, filename):
+        """Write the current patterns to the file specified by filename
+        in the compiled brain format.  To load them later, use load().
+
+        """
+        try:
+            CompiledBrain.write(filename, self._root, self._templateCount, self._botName, self._TEMPLATE)
+        except Exception, e:
+            print "Error compiling PatternMgr to file %s:" % filename
+            raise Exception, e
+
+    def load(self, filename):
+        """Load a previously compile()d collection of patterns.
+
+        The file is memory-mapped rather than read: its nodes and
+        templates are only read when matching first needs them.
+
+        """
+        try:
+            brain = CompiledBrain.CompiledBrain(filename, self._TEMPLATE)
+        except Exception, e:
+            print "Error loading PatternMgr from file %s:" % filename
+            raise Exception, e
+        self._templateCount = brain.templateCount
+        self._botName = brain.botName
+        self._root = brain.root()
+
+    def _thaw(self):
+        """Convert load()ed patterns into a tree of dictionaries, so that
+        they can be modified.
+
+        """
+        def thaw(node):
+            result = {}
+            for key, child in node.iteritems():
+                if key == self._TEMPLATE:
+                    result[key] = child
+                else:
+                    result[key] = thaw(child)
+            return result
+
+        if isinstance(self._root, CompiledBrain.CompiledNode):
+            self._root = thaw(self._root)
+
     def add(self, (pattern,that,topic), template):
         """Add a [pattern/that/topic] tuple and its corresponding template
         to the node tree.
 
         """
+        self._thaw()
+
         # TODO: make sure words contains only legal characters
         # (alphanumerics,*,_)
 
@@ -127,18 +233,11 @@ class PatternMgr:
             self._templateCount += 1    
         node[self._TEMPLATE] = template
 
-    def match(self, pattern, that, topic):
-        """Return the template which is the closest match to pattern. The
-        'that' parameter contains the bot's previous response. The 'topic'
-        parameter contains the current topic of conversation.
+    def _mutilate(self, pattern, that, topic):
+        """Prepare the input, 'that' and 'topic' for matching: remove all
+        punctuation and convert the text to all caps.
 
-        Returns None if no template is found.
-        
         """
-        if len(pattern) == 0:
-            return None
-        # Mutilate the input.  Remove all punctuation and convert the
-        # text to all caps.
         input = string.upper(pattern)
         input = re.sub(self._puncStripRE, "", input)
         if that.strip() == u"": that = u"ULTRABOGUSDUMMYTHAT" # 'that' must never be empty
@@ -148,10 +247,67 @@ class PatternMgr:
         if topic.strip() == u"": topic = u"ULTRABOGUSDUMMYTOPIC" # 'topic' must never be empty
         topicInput = string.upper(topic)
         topicInput = re.sub(self._puncStripRE, "", topicInput)
-        
+        return input, thatInput, topicInput
+
+    def matchObject(self, pattern, that, topic):
+        """Return a Match object for the template which is the closest
+        match to pattern. The 'that' parameter contains the bot's previous
+        response. The 'topic' parameter contains the current topic of
+        conversation.
+
+        Returns None if no template is found.
+
+        """
+        if len(pattern) == 0:
+            return None
+        input, thatInput, topicInput = self._mutilate(pattern, that, topic)
+
         # Pass the input off to the recursive call
         patMatch, template = self._match(input.split(), thatInput.split(), topicInput.split(), self._root)
-        return template
+        if template is None:
+            return None
+
+        words = {
+            'star': pattern.split(),
+            'thatstar': that.split(),
+            'topicstar': topic.split(),
+        }
+        indices = {}
+        for starType, typeWords in words.iteritems():
+            indices[starType] = [i for i, word in enumerate(typeWords) if re.sub(self._puncStripRE, "", word)]
+
+        # Walk the matched pattern to find the words bound by each
+        # wildcard.  Wildcards are recorded in the pattern as tuples of
+        # the wildcard and the number of words it consumed.
+        spans = {'star': [], 'thatstar': [], 'topicstar': []}
+        current = spans['star']
+        i = 0
+        for key in patMatch:
+            if key == self._THAT:
+                current = spans['thatstar']
+                i = 0
+            elif key == self._TOPIC:
+                current = spans['topicstar']
+                i = 0
+            elif type(key) is tuple:
+                current.append((i, i + key[1]))
+                i += key[1]
+            else:
+                i += 1
+        return Match(template, words, indices, spans)
+
+    def match(self, pattern, that, topic):
+        """Return the template which is the closest match to pattern. The
+        'that' parameter contains the bot's previous response. The 'topic'
+        parameter contains the current topic of conversation.
+
+        Returns None if no template is found.
+        
+        """
+        match = self.matchObject(pattern, that, topic)
+        if match is None:
+            return None
+        return match.template
 
     def star(self, starType, pattern, that, topic, index):
         """Returns a string, the portion of pattern that was matched by a *.
@@ -162,168 +318,101 @@ class PatternMgr:
          - 'thatstar': matches a star in the that pattern.
          - 'topicstar': matches a star in the topic pattern.
 
-        """
-        # Mutilate the input.  Remove all punctuation and convert the
-        # text to all caps.
-        input = string.upper(pattern)
-        input = re.sub(self._puncStripRE, "", input)
-        if that.strip() == u"": that = u"ULTRABOGUSDUMMYTHAT" # 'that' must never be empty
-        thatInput = string.upper(that)
-        thatInput = re.sub(self._whitespaceRE, " ", thatInput)
-        thatInput = re.sub(self._puncStripRE, "", thatInput)
-        if topic.strip() == u"": topic = u"ULTRABOGUSDUMMYTOPIC" # 'topic' must never be empty
-        topicInput = string.upper(topic)
-        topicInput = re.sub(self._puncStripRE, "", topicInput)
+        This matches the input again; use the Match object returned by
+        matchObject() to get several stars of the same input.
 
-        # Pass the input off to the recursive pattern-matcher
-        patMatch, template = self._match(input.split(), thatInput.split(), topicInput.split(), self._root)
-        if template == None:
+        """
+        match = self.matchObject(pattern, that, topic)
+        if match is None:
             return ""
-
-        # Extract the appropriate portion of the pattern, based on the
-        # starType argument.
-        words = None
-        if starType == 'star':
-            patMatch = patMatch[:patMatch.index(self._THAT)]
-            words = input.split()
-        elif starType == 'thatstar':
-            patMatch = patMatch[patMatch.index(self._THAT)+1 : patMatch.index(self._TOPIC)]
-            words = thatInput.split()
-        elif starType == 'topicstar':
-            patMatch = patMatch[patMatch.index(self._TOPIC)+1 :]
-            words = topicInput.split()
-        else:
-            # unknown value
-            raise ValueError, "starType must be in ['star', 'thatstar', 'topicstar']"
-        
-        # compare the input string to the matched pattern, word by word.
-        # At the end of this loop, if foundTheRightStar is true, start and
-        # end will contain the start and end indices (in "words") of
-        # the substring that the desired star matched.
-        foundTheRightStar = False
-        start = end = j = numStars = k = 0
-        for i in range(len(words)):
-            # This condition is true after processing a star
-            # that ISN'T the one we're looking for.
-            if i < k:
-                continue
-            # If we're reached the end of the pattern, we're done.
-            if j == len(patMatch):
-                break
-            if not foundTheRightStar:
-                if patMatch[j] in [self._STAR, self._UNDERSCORE]: #we got a star
-                    numStars += 1
-                    if numStars == index:
-                        # This is the star we care about.
-                        foundTheRightStar = True
-                    start = i
-                    # Iterate through the rest of the string.
-                    for k in range (i, len(words)):
-                        # If the star is at the end of the pattern,
-                        # we know exactly where it ends.
-                        if j+1  == len (patMatch):
-                            end = len (words)
-                            break
-                        # If the words have started matching the
-                        # pattern again, the star has ended.
-                        if patMatch[j+1] == words[k]:
-                            end = k - 1
-                            i = k
-                            break
-                # If we just finished processing the star we cared
-                # about, we exit the loop early.
-                if foundTheRightStar:
-                    break
-            # Move to the next element of the pattern.
-            j += 1
-            
-        # extract the star words from the original, unmutilated input.
-        if foundTheRightStar:
-            #print string.join(pattern.split()[start:end+1])
-            if starType == 'star': return string.join(pattern.split()[start:end+1])
-            elif starType == 'thatstar': return string.join(that.split()[start:end+1])
-            elif starType == 'topicstar': return string.join(topic.split()[start:end+1])
-        else: return ""
+        return match.star(starType, index)
 
     def _match(self, words, thatWords, topicWords, root):
         """Return a tuple (pat, tem) where pat is a list of nodes, starting
         at the root and leading to the matching pattern, and tem is the
-        matched template.
-
-        """ 
-        # base-case: if the word list is empty, return the current node's
-        # template.
-        if len(words) == 0:
-            # we're out of words.
-            pattern = []
-            template = None
-            if len(thatWords) > 0:
-                # If thatWords isn't empty, recursively
-                # pattern-match on the _THAT node with thatWords as words.
-                try:
-                    pattern, template = self._match(thatWords, [], topicWords, root[self._THAT])
-                    if pattern != None:
-                        pattern = [self._THAT] + pattern
-                except KeyError:
-                    pattern = []
-                    template = None
-            elif len(topicWords) > 0:
-                # If thatWords is empty and topicWords isn't, recursively pattern
-                # on the _TOPIC node with topicWords as words.
-                try:
-                    pattern, template = self._match(topicWords, [], [], root[self._TOPIC])
-                    if pattern != None:
-                        pattern = [self._TOPIC] + pattern
-                except KeyError:
-                    pattern = []
-                    template = None
-            if template == None:
-                # we're totally out of input.  Grab the template at this node.
-                pattern = []
-                try: template = root[self._TEMPLATE]
-                except KeyError: template = None
-            return (pattern, template)
-
-        first = words[0]
-        suffix = words[1:]
-        
-        # Check underscore.
-        # Note: this is causing problems in the standard AIML set, and is
-        # currently disabled.
-        if root.has_key(self._UNDERSCORE):
-            # Must include the case where suf is [] in order to handle the case
-            # where a * or _ is at the end of the pattern.
-            for j in range(len(suffix)+1):
-                suf = suffix[j:]
-                pattern, template = self._match(suf, thatWords, topicWords, root[self._UNDERSCORE])
+        matched template.  Wildcard nodes are recorded in pat as tuples of
+        the wildcard and the number of words it matched.
+
+        The words are never copied: the matcher walks the three segments
+        (input, 'that' and 'topic') by index.  A node can only be reached
+        at the same word index again by backtracking over wildcards, so
+        the wildcard subtrees that failed to match at an index are
+        remembered and never tried again.
+
+        """
+        segments = (words, thatWords, topicWords)
+        failed = set()
+        UNDERSCORE, STAR, TEMPLATE = self._UNDERSCORE, self._STAR, self._TEMPLATE
+        THAT, TOPIC, BOT_NAME = self._THAT, self._TOPIC, self._BOT_NAME
+        botName = self._botName
+
+        def matchWildcard(wildcard, child, segment, i, numWords):
+            # Try to match the wildcard against one or more words,
+            # consuming as few words as possible first.  Must include the
+            # case where no words are left after the wildcard in order to
+            # handle the case where a * or _ is at the end of the pattern.
+            childId = id(child)
+            for j in xrange(i+1, numWords+1):
+                key = (childId, segment, j)
+                if key in failed:
+                    continue
+                pattern, template = match(child, segment, j)
                 if template is not None:
-                    newPattern = [self._UNDERSCORE] + pattern
-                    return (newPattern, template)
-
-        # Check first
-        if root.has_key(first):
-            pattern, template = self._match(suffix, thatWords, topicWords, root[first])
-            if template is not None:
-                newPattern = [first] + pattern
-                return (newPattern, template)
-
-        # check bot name
-        if root.has_key(self._BOT_NAME) and first == self._botName:
-            pattern, template = self._match(suffix, thatWords, topicWords, root[self._BOT_NAME])
-            if template is not None:
-                newPattern = [first] + pattern
-                return (newPattern, template)
-        
-        # check star
-        if root.has_key(self._STAR):
-            # Must include the case where suf is [] in order to handle the case
-            # where a * or _ is at the end of the pattern.
-            for j in range(len(suffix)+1):
-                suf = suffix[j:]
-                pattern, template = self._match(suf, thatWords, topicWords, root[self._STAR])
+                    return ([(wildcard, j-i)] + pattern, template)
+                failed.add(key)
+            return (None, None)
+
+        def match(node, segment, i):
+            segWords = segments[segment]
+            numWords = len(segWords)
+            if i == numWords:
+                # We're out of words in this segment.  Continue in the
+                # _THAT or _TOPIC subtree if there are any words left for
+                # it, otherwise grab the template at this node.
+                if segment == 0 and len(thatWords) > 0:
+                    child = node.get(THAT)
+                    if child is not None:
+                        pattern, template = match(child, 1, 0)
+                        if template is not None:
+                            return ([THAT] + pattern, template)
+                elif segment < 2 and len(topicWords) > 0:
+                    child = node.get(TOPIC)
+                    if child is not None:
+                        pattern, template = match(child, 2, 0)
+                        if template is not None:
+                            return ([TOPIC] + pattern, template)
+                return ([], node.get(TEMPLATE))
+
+            first = segWords[i]
+
+            # Check underscore.
+            child = node.get(UNDERSCORE)
+            if child is not None:
+                pattern, template = matchWildcard(UNDERSCORE, child, segment, i, numWords)
+                if template is not None:
+                    return (pattern, template)
+
+            # Check first
+            child = node.get(first)
+            if child is not None:
+                pattern, template = match(child, segment, i+1)
                 if template is not None:
-                    newPattern = [self._STAR] + pattern
-                    return (newPattern, template)
+                    return ([first] + pattern, template)
+
+            # check bot name
+            if first == botName:
+                child = node.get(BOT_NAME)
+                if child is not None:
+                    pattern, template = match(child, segment, i+1)
+                    if template is not None:
+                        return ([first] + pattern, template)
+
+            # check star
+            child = node.get(STAR)
+            if child is not None:
+                return matchWildcard(STAR, child, segment, i, numWords)
+
+            # No matches were found.
+            return (None, None)
 
-        # No matches were found.
-        return (None, None)            
\ No newline at end of file
+        return match(root, 0, 0)
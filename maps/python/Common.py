@@ -1,7 +1,33 @@
 ## @file
 ## This file holds common code used across Atrinik Python scripts.
 
+import functools
+import json
 import re
+import types
+
+## Recursively convert a parsed JSON value into an immutable one, so that it
+## can be safely shared between callers.
+def _json_freeze(val):
+    if isinstance(val, list):
+        return tuple(_json_freeze(x) for x in val)
+    elif isinstance(val, dict):
+        return types.MappingProxyType({k: _json_freeze(v) for k, v in val.items()})
+
+    return val
+
+## Parse a JSON string, such as an event's message, caching the result.
+##
+## Scripts attached to busy NPCs parse the same event message on every line
+## the player says; with this, identical text is only parsed once, and a
+## changed text is simply a different cache key.
+## @param s The JSON string.
+## @return The parsed value. Lists are returned as tuples and dictionaries
+## as read-only mappings, as the value is shared; callers that need to
+## modify it must copy it first.
+@functools.lru_cache(maxsize=256)
+def json_loads_cached(s):
+    return _json_freeze(json.loads(s))
 
 ## Calculate the diagonal distance between two X and Y coordinates.
 def diagonal_distance(x1, y1, x2, y2):
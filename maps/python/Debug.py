@@ -24,3 +24,32 @@ def objs_get_diff(*args):
                     results.append(attr)
 
     return list(set(results))
+
+## Create a report of the script profiling data collected by the Python
+## plugin, suitable for printing from the /console command:
+##
+## @code
+## from Debug import script_profile_report
+## print(script_profile_report())
+## @endcode
+## @param sort Profiling data key to sort the scripts by (highest first), eg,
+## "total_time", "max_time", "calls" or "cache_misses".
+## @param limit Maximum number of scripts to show.
+## @param reset Whether to clear the profiling data afterwards.
+## @return The report.
+def script_profile_report(sort = "total_time", limit = 20, reset = False):
+    import Atrinik
+
+    profile = Atrinik.GetScriptProfile(reset)
+    lines = ["{:>8} {:>10} {:>10} {:>10} {:>6} {:>6}  {}".format(
+        "calls", "total ms", "avg ms", "max ms", "hits", "misses", "script")]
+
+    for path, data in sorted(profile.items(), key = lambda item: item[1][sort],
+                             reverse = True)[:limit]:
+        avg = data["total_time"] / data["timed"] if data["timed"] else 0.0
+        lines.append("{:>8} {:>10.2f} {:>10.3f} {:>10.3f} {:>6} {:>6}  {}".format(
+            data["calls"], data["total_time"] * 1000.0, avg * 1000.0,
+            data["max_time"] * 1000.0, data["cache_hits"],
+            data["cache_misses"], path))
+
+    return "\n".join(lines)
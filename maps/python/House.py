@@ -4,6 +4,8 @@
 import json
 import time
 
+from Common import json_loads_cached
+
 ## The House class, used for luxury houses.
 class House:
     ## The available houses.
@@ -119,7 +121,8 @@ class House:
                 self._player_info.name = self._pinfo_tag
                 self._player_info.msg = json.dumps(self._player_houses)
         else:
-            self._player_houses = json.loads(self._player_info.msg)
+            self._player_houses = [list(house) for house in
+                    json_loads_cached(self._player_info.msg)]
 
     def _save_player_info(self):
         self._player_info.msg = json.dumps(self._player_houses)
@@ -9,6 +9,12 @@ import Language
 
 DEBUG = True
 
+# Markup that surrounds icons added with Interface.add_msg_icon() and
+# Interface.add_msg_icon_object().
+_ICON_START = "\n\n[bar=#000000 52 52][border=#606060 52 52][x=1][y=1]"
+_ICON_DESC = "[x=-1][y=-1][padding=60][hcenter=50]"
+_ICON_END = "[/hcenter][/padding]"
+
 
 class Interface:
     """
@@ -26,7 +32,7 @@ class Interface:
         :type npc: :class:`Atrinik.Object.Object` or None
         """
 
-        self._msg = ""
+        self._msg = []
         self._title = ""
         self._links = []
         self._text_input = None
@@ -73,16 +79,15 @@ class Interface:
         """
 
         if newline and self._msg:
-            self._msg += "\n\n"
-
-        if color:
-            self._msg += "[c=#" + color + "]"
+            self._msg.append("\n\n")
 
-        self._msg += msg.format(activator=self._activator, npc=self._npc,
-                                self=self, **keywds)
+        msg = msg.format(activator=self._activator, npc=self._npc, self=self,
+                         **keywds)
 
         if color:
-            self._msg += "[/c]"
+            self._msg += ("[c=#", color, "]", msg, "[/c]")
+        elif msg:
+            self._msg.append(msg)
 
     def add_msg_icon(self, icon, desc="", fit=False):
         """
@@ -96,18 +101,9 @@ class Interface:
         :type fit: bool
         """
 
-        self._msg += "\n\n"
-        self._msg += "[bar=#000000 52 52][border=#606060 52 52][x=1][y=1][icon="
-        self._msg += icon
-        self._msg += " 50 50"
-
-        if fit:
-            self._msg += " 1"
-
-        self._msg += "][x=-1][y=-1]"
-        self._msg += "[padding=60][hcenter=50]"
-        self._msg += desc
-        self._msg += "[/hcenter][/padding]"
+        self._msg += (_ICON_START, "[icon=", icon,
+                      " 50 50 1]" if fit else " 50 50]", _ICON_DESC, desc,
+                      _ICON_END)
 
     def add_msg_icon_object(self, obj, desc=None):
         """
@@ -131,13 +127,9 @@ class Interface:
                                Atrinik.UPD_FACE | Atrinik.UPD_NROF |
                                Atrinik.UPD_GLOW | Atrinik.UPD_DIRECTION)
         self._objects.append(packet)
-        self._msg += "\n\n"
-        self._msg += "[bar=#000000 52 52][border=#606060 52 52][x=1][y=1]"
-        self._msg += "[obj={} 50 50 {}]".format(obj.count, int(fit))
-        self._msg += "[x=-1][y=-1]"
-        self._msg += "[padding=60][hcenter=50]"
-        self._msg += desc or obj.GetName()
-        self._msg += "[/hcenter][/padding]"
+        self._msg += (_ICON_START, "[obj=", str(obj.count),
+                      " 50 50 1]" if fit else " 50 50 0]", _ICON_DESC,
+                      desc or obj.GetName(), _ICON_END)
 
     def _get_dest(self, dest, npc=None):
         """
@@ -345,76 +337,122 @@ class Interface:
         if not self._msg and not self._restore:
             return
 
+        msg = "".join(self._msg)
+
         if self._npc:
-            Atrinik.SetReturnValue(-1 if self._restore else len(self._msg))
+            Atrinik.SetReturnValue(-1 if self._restore else len(msg))
 
         if not self._restore:
             # Construct the base data packet; contains the interface message,
             # the icon and the title.
-            fmt = "BsBs"
-            data = [0, self._msg, 3, self._title]
+            fmt = ["BsBs"]
+            data = [0, msg, 3, self._title]
 
             if self._icon is not None:
-                fmt += "Bs"
+                fmt.append("Bs")
                 data += [2, self._icon]
             elif self._anim is not None:
-                fmt += "BHBB"
+                fmt.append("BHBB")
                 data += [13, self._anim, self._anim_speed, self._direction]
         else:
-            fmt = "B"
+            fmt = ["B"]
             data = [11]
 
         if self._append_text:
-            fmt += "Bs"
+            fmt.append("Bs")
             data += [12, self._append_text]
 
         # Add links to the data packet, if any.
         for link in self._links:
-            fmt += "Bs"
+            fmt.append("Bs")
             data += [1, link]
 
         # Add the text input, if any.
         if self._text_input is not None:
-            fmt += "Bs"
+            fmt.append("Bs")
             data += [4, self._text_input]
 
             if self._text_input_prepend:
-                fmt += "Bs"
+                fmt.append("Bs")
                 data += [5, self._text_input_prepend]
 
             if self._allow_tab:
-                fmt += "B"
+                fmt.append("B")
                 data += [6]
 
             if not self._cleanup_text:
-                fmt += "B"
+                fmt.append("B")
                 data += [7]
 
             if self._allow_empty:
-                fmt += "B"
+                fmt.append("B")
                 data += [8]
 
             if self._scroll_bottom:
-                fmt += "B"
+                fmt.append("B")
                 data += [9]
 
             if self._autocomplete:
-                fmt += "Bs"
+                fmt.append("Bs")
                 data += [10, self._autocomplete]
 
         for obj in self._objects:
             obj_fmt, obj_data = obj
-            fmt += "B" + obj_fmt
+            fmt += ("B", obj_fmt)
             data += [14] + obj_data
 
         # Send the data.
         pl = self._activator.Controller()
-        pl.SendPacket(26, fmt, *data)
+        pl.SendPacket(26, "".join(fmt), *data)
 
 
 IB_CHECKS_STATE1 = frozenset(["need_complete_before_start", "need_start",
                               "need_finish"])
 IB_CHECKS_STATE2 = frozenset(["need_complete"])
+IB_CHECKS = IB_CHECKS_STATE1 | IB_CHECKS_STATE2
+
+
+# Matches numbered or named back-references, which cannot be merged into a
+# combined dialog matcher expression.
+_RE_BACKREF = re.compile(r"\\\d|\(\?P=")
+# Cache of compiled dialog matchers, keyed by the matcher expressions. Generated
+# NPC scripts re-create their dialog classes each time they are run, so the
+# compiled expressions are shared between the class generations.
+_matchers_cache = {}
+
+
+def _compile_matchers(exprs):
+    """
+    Compile the regex expressions of dialog matchers into a single
+    case-insensitive expression, preserving the first-match semantics.
+
+    :param exprs: The expressions.
+    :type exprs: tuple
+    :return: Tuple containing the compiled combined expression (or None if
+             the expressions could not be combined) and a list of individually
+             compiled expressions.
+    :rtype: tuple
+    """
+
+    try:
+        return _matchers_cache[exprs]
+    except KeyError:
+        pass
+
+    compiled = [re.compile(expr, re.I) for expr in exprs]
+    combined = None
+
+    if not any(_RE_BACKREF.search(expr) for expr in exprs):
+        try:
+            combined = re.compile("|".join(
+                "(?P<_ib_m{}>(?:{}))".format(i, expr)
+                for i, expr in enumerate(exprs)
+            ), re.I)
+        except re.error:
+            combined = None
+
+    _matchers_cache[exprs] = combined, compiled
+    return combined, compiled
 
 
 class InterfaceBuilder(Interface):
@@ -529,13 +567,98 @@ class InterfaceBuilder(Interface):
         self.dialog_name = None
         self.preconds = None
         self.locals = None
+        self.variants = None
+
+    @classmethod
+    def _get_dispatch(cls):
+        """
+        Acquire the dialog dispatch table of the class. The table is built the
+        first time a message is routed through the class and cached on the
+        class itself.
+
+        :return: Tuple containing the combined matcher expression (or None),
+                 list of individually compiled matchers with their callbacks
+                 and a dictionary of dialog_xxx method names, keyed by the
+                 message that triggers them.
+        :rtype: tuple
+        """
+
+        dispatch = cls.__dict__.get("_dispatch")
+        if dispatch is not None:
+            return dispatch
+
+        combined, compiled = _compile_matchers(
+            tuple(expr for expr, callback in cls.matchers)
+        )
+        matchers = [(expr, callback) for expr, (_, callback) in
+                    zip(compiled, cls.matchers)]
+        handlers = {name[7:]: name for name in dir(cls)
+                    if name.startswith("dialog_")}
+
+        cls._dispatch = combined, matchers, handlers
+        return cls._dispatch
+
+    def _match(self, msg):
+        """
+        Find the regex dialog matcher callback that handles the specified
+        message.
+
+        :param msg: Message to handle.
+        :type msg: str
+        :return: The callback, None if there is no match.
+        :rtype: collections.Callable or None
+        """
+
+        combined, matchers, handlers = self._get_dispatch()
+        if not matchers:
+            return None
+
+        if combined is not None:
+            match = combined.match(msg)
+            if match is None:
+                return None
+
+            return matchers[int(match.lastgroup[5:])][1]
+
+        for expr, callback in matchers:
+            if expr.match(msg):
+                return callback
+
+        return None
+
+    def _get_variants(self):
+        """
+        Index the quest-state dialog variants (eg, InterfaceDialog_completed
+        or InterfaceDialog_need_start_part1) of the current dialog name that
+        exist in the locals dictionary.
+
+        :return: Dictionary of the variant class names, keyed by the state
+                 name, or a tuple of the check name and the quest part UID.
+        :rtype: dict
+        """
+
+        prefix = self.dialog_name + "_"
+        variants = {}
+
+        for name in self.locals:
+            if not name.startswith(prefix):
+                continue
+
+            state = name[len(prefix):]
+            variants[state] = name
+
+            for check in IB_CHECKS:
+                if state.startswith(check + "_"):
+                    variants[(check, state[len(check) + 1:])] = name
+
+        return variants
 
     def _part_dialog(self, part, checks):
         for check in checks:
             self.dbg("Checking state {} for part {}", check, " -> ".join(part))
-            name = "_".join((self.dialog_name, check, part[-1:][0]))
+            name = self.variants.get((check, part[-1]))
 
-            if name not in self.locals:
+            if name is None:
                 continue
 
             if getattr(self.qm, check)(part):
@@ -560,7 +683,7 @@ class InterfaceBuilder(Interface):
             if self._part_dialog(l, checks=IB_CHECKS_STATE1):
                 return True
 
-            if self.qm.started(l) and "parts" in parts[part]:
+            if "parts" in parts[part] and self.qm.started(l):
                 if self._check_parts(parts[part]["parts"], l):
                     return True
 
@@ -666,8 +789,37 @@ class InterfaceBuilder(Interface):
 
         self.dbg("Handling interface for message: {}", msg)
 
+        # Memoise the quest state while the dialog is chosen, so that the
+        # quest preconditions do not have to scan the player's inventory
+        # over and over. The dialog's handlers run outside of the snapshot,
+        # as they may create or destroy quest items.
+        if self.qm is not None and self.qm.quest is not None:
+            with self.qm.snapshot():
+                c = self._select_dialog(locals_dict, dialog_name)
+        else:
+            c = self._select_dialog(locals_dict, dialog_name)
+
+        if c is not None:
+            self._handle_dialog(c, msg)
+
+    def _select_dialog(self, locals_dict, dialog_name):
+        """
+        Chooses the interface dialog to use, checking the quest parts and
+        the preconditions. If the dialog's precondition fails, the dialog is
+        sent as is.
+
+        :param locals_dict: The locals() dictionary.
+        :type locals_dict: dict
+        :param dialog_name: Prefix of class names to look for.
+        :type dialog_name: str
+        :return: The dialog to handle the message with, None if there's
+                 nothing left to do.
+        :rtype: :class:`InterfaceBuilder` or None
+        """
+
         self.locals = locals_dict
         self.dialog_name = dialog_name
+        self.variants = self._get_variants()
         dialog = None
 
         # Do some quest handling.
@@ -684,34 +836,49 @@ class InterfaceBuilder(Interface):
                 if self.qm.quest is not None:
                     self._check_parts(self.qm.quest["parts"])
 
-        if dialog and self.dialog_name + "_" + dialog in self.locals:
-            self.dialog_name += "_" + dialog
+        if dialog and dialog in self.variants:
+            self.dialog_name = self.variants[dialog]
 
         if self.preconds is not None:
             # noinspection PyCallingNonCallable
             self.preconds(self)
 
         self.dbg("Handling with dialog: {}", self.dialog_name)
-        
-        if self.dialog_name in self.locals:
-            c = self.locals[self.dialog_name](self._activator, self._npc)
-            c.set_quest(self.qm)
-            c.part = self.part
-
-            if not c.precond():
-                Interface.send(c)
-                return
-
-            for expr, callback in c.matchers:
-                if re.match(expr, msg, re.I):
-                    callback(c)
-                    Interface.send(c)
-                    return
-
-            fnc = getattr(c, "dialog_" + msg.lower().replace(" ", "_"), None)
-            if fnc is None:
-                c.dialog(msg)
-            else:
-                fnc()
 
+        if self.dialog_name not in self.locals:
+            return None
+
+        c = self.locals[self.dialog_name](self._activator, self._npc)
+        c.set_quest(self.qm)
+        c.part = self.part
+
+        if not c.precond():
             Interface.send(c)
+            return None
+
+        return c
+
+    def _handle_dialog(self, c, msg):
+        """
+        Calls the dialog's handler for the message and sends the dialog.
+
+        :param c: The dialog chosen by :meth:`_select_dialog`.
+        :type c: :class:`InterfaceBuilder`
+        :param msg: Message that was spoken to the NPC.
+        :type msg: str
+        """
+
+        callback = c._match(msg)
+        if callback is not None:
+            callback(c)
+            Interface.send(c)
+            return
+
+        combined, matchers, handlers = c._get_dispatch()
+        name = handlers.get(msg.lower().replace(" ", "_"))
+        if name is None:
+            c.dialog(msg)
+        else:
+            getattr(c, name)()
+
+        Interface.send(c)
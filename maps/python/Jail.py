@@ -1,11 +1,11 @@
 ## @file
 ## The Jail class, used for scripts in jails.
 
-import json
 import random
 import datetime
 
 from Atrinik import *
+from Common import json_loads_cached
 
 
 ## Try to find a jail force inside player's inventory.
@@ -31,7 +31,7 @@ class Jail:
     ## @param me Object that is carrying the event.
     def __init__(self, me):
         # Load up the jails.
-        self.jails = json.loads(WhatIsEvent().msg)
+        self.jails = json_loads_cached(WhatIsEvent().msg)
         self.me = me
 
         if not self.jails:
@@ -2,11 +2,11 @@
 Implements merchant related classes (sellers, buyers, spell sellers, etc).
 """
 
-import json
 import random
 import re
 
 from Atrinik import *
+from Common import json_loads_cached
 from Interface import InterfaceBuilder
 from Language import int2english
 
@@ -52,7 +52,7 @@ class Seller(Merchant):
         # Message in event, create treasure.
         if event.msg:
             # Parse data, create the treasure.
-            for (treasure, num, a_chance) in json.loads(event.msg):
+            for (treasure, num, a_chance) in json_loads_cached(event.msg):
                 if treasure:
                     for i in range(num):
                         event.CreateTreasure(treasure, self._npc.level,
@@ -3,6 +3,7 @@ Quest manager related implementations.
 """
 
 import time
+from contextlib import contextmanager
 
 import Atrinik
 
@@ -21,6 +22,7 @@ class QuestManager:
     
     quest = None;
     quest_object = None;
+    _snapshot = None
     
     def __init__(self, activator, quest):
         """
@@ -38,6 +40,7 @@ class QuestManager:
         self.activator = activator
         self.quest = quest
         self.sound_last = None
+        self._snapshot = None
 
         self.quest_container = activator.Controller().quest_container
         self.quest_object = self.quest_container.FindObject(
@@ -80,6 +83,96 @@ class QuestManager:
 
         return obj
 
+    @contextmanager
+    def snapshot(self):
+        """
+        Context manager that memoises quest part objects and quest item counts
+        for the duration of a single interaction. Inside the context, the quest
+        object's inventory is walked at most once, and the activator's
+        inventory is searched at most once per distinct quest item. The
+        snapshot is invalidated by the methods that change the quest object
+        or the quest items, such as :meth:`start`, :meth:`complete` and
+        :meth:`remove_quest_items`.
+
+        Quest items created or destroyed by other means are not noticed, so
+        the snapshot is only meant for read-only condition checks.
+
+        Nested uses share the outermost snapshot.
+        """
+
+        if self._snapshot is not None:
+            yield self
+            return
+
+        self._snapshot = {}
+
+        try:
+            yield self
+        finally:
+            self._snapshot = None
+
+    def _invalidate_snapshot(self):
+        """
+        Drops any memoised state of the active snapshot, if any.
+        """
+
+        if self._snapshot is not None:
+            self._snapshot = {}
+
+    def _find_part_object(self, part):
+        """
+        Acquire the object that stores the specified quest part's information.
+
+        :param part: UID of the quest part.
+        :type part: str
+        :return: The quest part object, None if it doesn't exist.
+        :rtype: :class:`Atrinik.Object.Object` or None
+        """
+
+        if not self.quest_object:
+            return None
+
+        if self._snapshot is None:
+            return self.quest_object.FindObject(name=part)
+
+        parts = self._snapshot.get("parts")
+        if parts is None:
+            parts = {}
+
+            for obj in self.quest_object.inv:
+                parts.setdefault(obj.name, obj)
+
+            self._snapshot["parts"] = parts
+
+        return parts.get(part)
+
+    def _count_quest_items(self, item):
+        """
+        Count the quest items the activator has in their inventory.
+
+        :param item: Quest part item info.
+        :type item: dict
+        :return: Number of quest items.
+        :rtype: int
+        """
+
+        if self._snapshot is not None:
+            key = ("item", item["arch"], item["name"])
+            num = self._snapshot.get(key)
+            if num is not None:
+                return num
+
+        num = 0
+
+        for tmp in self.activator.FindObjects(Atrinik.INVENTORY_CONTAINERS,
+                                              item["arch"], item["name"]):
+            num += max(1, tmp.nrof)
+
+        if self._snapshot is not None:
+            self._snapshot[key] = num
+
+        return num
+
     def sound(self, sound):
         """
         Play the specified sound file. If called multiple times with the same
@@ -119,6 +212,7 @@ class QuestManager:
 
         self.quest_object.Destroy()
         self.quest_object = None
+        self._invalidate_snapshot()
 
     def get_qp_max(self):
         """
@@ -229,6 +323,8 @@ class QuestManager:
                 if removed == nrof:
                     break
 
+        self._invalidate_snapshot()
+
     def get_quest_item_num(self, quest):
         """
         Acquire the number of quest items the activator has found.
@@ -241,6 +337,9 @@ class QuestManager:
 
         # Just one item, easy.
         if quest["item"].get("nrof", 1) <= 1:
+            if self._snapshot is not None:
+                return min(1, self._count_quest_items(quest["item"]))
+
             quest_item = self.activator.FindObject(
                 Atrinik.INVENTORY_CONTAINERS, quest["item"]["arch"],
                 quest["item"]["name"]
@@ -250,15 +349,7 @@ class QuestManager:
                 return 1
         # Got to count the objects otherwise.
         else:
-            num = 0
-
-            # Find all matching objects, and count them.
-            for tmp in self.activator.FindObjects(
-                    Atrinik.INVENTORY_CONTAINERS, quest["item"]["arch"],
-                    quest["item"]["name"]):
-                num += max(1, tmp.nrof)
-
-            return num
+            return self._count_quest_items(quest["item"])
 
         return 0
 
@@ -279,10 +370,7 @@ class QuestManager:
         if "kill" in quest:
             nrof = quest["kill"].get("nrof", 1)
 
-            if not self.quest_object:
-                return nrof
-
-            obj = self.quest_object.FindObject(name=part)
+            obj = self._find_part_object(part)
             if not obj:
                 return nrof
 
@@ -308,7 +396,7 @@ class QuestManager:
             return self.quest_object.magic
 
         part, quest = self.get_part(part)
-        obj = self.quest_object.FindObject(name=part)
+        obj = self._find_part_object(part)
         if obj is None:
             return Atrinik.QUEST_STATUS_INVALID
 
@@ -456,6 +544,7 @@ class QuestManager:
         self.quest_object = self.create_quest_object(
             self.quest_container, self.quest, self.quest.get("uid")
         )
+        self._invalidate_snapshot()
 
     def start(self, part, sound="learnspell.ogg"):
         """
@@ -470,6 +559,7 @@ class QuestManager:
         self.ensure_quest_object()
         part, quest = self.get_part(part)
         self.create_quest_object(self.quest_object, quest, part)
+        self._invalidate_snapshot()
         self.sound(sound)
 
     def complete(self, part, sound="learnspell.ogg"):
@@ -487,7 +577,7 @@ class QuestManager:
         assert self.quest_object
 
         part, quest = self.get_part(part)
-        obj = self.quest_object.FindObject(name=part)
+        obj = self._find_part_object(part)
         if not obj:
             return False
 
@@ -495,6 +585,7 @@ class QuestManager:
         obj.magic = Atrinik.QUEST_STATUS_COMPLETED
         self.sound(sound)
         self.remove_quest_items(quest, obj)
+        self._invalidate_snapshot()
 
         # Check all quest parts. If all are completed, complete the
         # entire quest.
@@ -521,7 +612,7 @@ class QuestManager:
         assert self.quest_object
 
         part, quest = self.get_part(part)
-        obj = self.quest_object.FindObject(name=part)
+        obj = self._find_part_object(part)
         if not obj:
             return False
 
@@ -529,6 +620,7 @@ class QuestManager:
         obj.magic = Atrinik.QUEST_STATUS_FAILED
         self.sound(sound)
         self.remove_quest_items(quest, obj)
+        self._invalidate_snapshot()
 
         # Check all quest parts. If any are still started, no reason to fail
         # the entire quest just yet.
@@ -569,7 +661,7 @@ class QuestManager:
 
         if part is not None:
             part, quest = self.get_part(part)
-            return self.quest_object.FindObject(name=part) is not None
+            return self._find_part_object(part) is not None
 
         return True
 
@@ -1,7 +1,7 @@
-import json
 import random
 
 from Atrinik import *
+from Common import json_loads_cached
 
 
 def get_waypoints():
@@ -13,7 +13,7 @@ def main():
     event = WhatIsEvent()
 
     if event.msg:
-        opts = json.loads(event.msg)
+        opts = json_loads_cached(event.msg)
     else:
         opts = {}
 
@@ -454,6 +454,8 @@ except ReferenceError:
         self.assertIsNotNone(d)
         self.assertIsInstance(d, dict)
         self.assertIn("mapspath", d)
+        self.assertIn("python_precompile", d)
+        self.assertIsInstance(d["python_precompile"], bool)
 
     def test_Process(self):
         self.assertRaises(TypeError, Atrinik.Process, 1, 2)
@@ -470,6 +472,39 @@ except ReferenceError:
 
         self.assertEqual(Atrinik.GetTicks() - ticks, 10)
 
+    def test_GetScriptProfile(self):
+        self.assertRaises(TypeError, Atrinik.GetScriptProfile, 1, 2)
+        self.assertRaises(TypeError, Atrinik.GetScriptProfile, x=1)
+
+        profile = Atrinik.GetScriptProfile()
+        self.assertIsInstance(profile, dict)
+        # The unit tests themselves are run from an event script.
+        self.assertIn("/python/events/python_unit.py", profile)
+
+        for data in profile.values():
+            self.assertEqual(sorted(data.keys()),
+                             ["cache_hits", "cache_misses", "calls",
+                              "max_time", "timed", "total_time"])
+            self.assertEqual(data["calls"],
+                             data["cache_hits"] + data["cache_misses"])
+            self.assertLessEqual(data["timed"], data["calls"])
+            self.assertLessEqual(data["max_time"], data["total_time"])
+
+        Atrinik.GetScriptProfile(True)
+
+        for data in Atrinik.GetScriptProfile().values():
+            self.assertEqual(data["calls"], 0)
+            self.assertEqual(data["total_time"], 0.0)
+
+    def test_SetScriptProfiling(self):
+        self.assertRaises(TypeError, Atrinik.SetScriptProfiling)
+        self.assertRaises(TypeError, Atrinik.SetScriptProfiling, x=1)
+        self.assertRaises(ValueError, Atrinik.SetScriptProfiling, True, 0)
+
+        Atrinik.SetScriptProfiling(False)
+        Atrinik.SetScriptProfiling(True, 10)
+        Atrinik.SetScriptProfiling(True)
+
 
 activator = Atrinik.WhoIsActivator()
 me = Atrinik.WhoAmI()
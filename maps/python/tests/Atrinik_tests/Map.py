@@ -71,6 +71,28 @@ class MapMethodsSuite(TestSuite):
         self.assertEqual(self.map.GetLayer(0, 0, l[0].layer), l)
         self.assertEqual(self.map.GetLayer(0, 0, me.layer), [me, activator])
 
+    def test_GetLayers(self):
+        self.assertRaises(TypeError, self.map.GetLayers)
+        self.assertRaises(TypeError, self.map.GetLayers, 1)
+        self.assertRaises(TypeError, self.map.GetLayers, x=1)
+
+        self.assertRaises(Atrinik.AtrinikError, self.map.GetLayers, 50, 50)
+
+        layers = self.map.GetLayers(0, 0)
+        self.assertEqual(len(layers), Atrinik.NUM_LAYERS + 1)
+        self.assertTrue(all(layer == [] for layer in layers))
+
+        for _ in range(5):
+            self.map.CreateObject("sword", 0, 0)
+        sword = self.map.CreateObject("sword", 0, 0)
+        sword.sub_layer = 3
+        self.map.Insert(activator, 0, 0)
+        self.map.Insert(me, 0, 0)
+
+        layers = self.map.GetLayers(0, 0)
+        for layer in range(Atrinik.NUM_LAYERS + 1):
+            self.assertEqual(layers[layer], self.map.GetLayer(0, 0, layer))
+
     def test_GetMapFromCoord(self):
         self.assertRaises(TypeError, self.map.GetMapFromCoord)
         self.assertRaises(TypeError, self.map.GetMapFromCoord, 1, "2")
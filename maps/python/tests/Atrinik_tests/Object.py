@@ -1,4 +1,5 @@
 import random
+import timeit
 import unittest
 
 import Atrinik
@@ -1310,6 +1311,39 @@ class ObjectMethodsSuite(unittest.TestCase):
         self.assertIn(self.obj.GetName().encode(), data[1])
         self.assertIn(self.obj.glow.encode(), data[1])
 
+    def test_GetAttributes(self):
+        self.assertRaises(TypeError, self.obj.GetAttributes)
+        self.assertRaises(TypeError, self.obj.GetAttributes, 1)
+        self.assertRaises(TypeError, self.obj.GetAttributes, ("type", 1))
+        self.assertRaises(AttributeError, self.obj.GetAttributes, ("xxx",))
+
+        self.assertEqual(self.obj.GetAttributes(()), ())
+        self.obj.f_cursed = True
+        self.obj.z = 5
+        attrs = ("type", "sub_type", "layer", "f_cursed", "f_identified", "z",
+                 "name")
+        self.assertEqual(self.obj.GetAttributes(attrs),
+                         tuple(getattr(self.obj, attr) for attr in attrs))
+        self.assertEqual(self.obj.GetAttributes(list(attrs)),
+                         tuple(getattr(self.obj, attr) for attr in attrs))
+
+        num = 10000
+        separate = timeit.timeit(lambda: (self.obj.type, self.obj.sub_type,
+                                          self.obj.layer, self.obj.f_cursed,
+                                          self.obj.f_identified, self.obj.z,
+                                          self.obj.name), number=num)
+        batched = timeit.timeit(lambda: self.obj.GetAttributes(attrs),
+                                number=num)
+        Atrinik.print("Reading {} attributes {} times: {:.3f} ms separately, "
+                      "{:.3f} ms batched".format(len(attrs), num,
+                                                 separate * 1000,
+                                                 batched * 1000))
+
+        obj = self.obj
+        self.obj.Destroy()
+        self.assertRaises(ReferenceError, obj.GetAttributes, ("type",))
+        self.obj = Atrinik.CreateObject("sword")
+
 
 class ObjectFieldsSuite(TestSuite):
     def setUp(self):
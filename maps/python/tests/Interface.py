@@ -1,10 +1,11 @@
+import timeit
 import unittest
 from collections import OrderedDict
 
 import Atrinik
-from tests import TestSuite, ib_wrapper
+from tests import TestSuite, CApiCounter, ib_wrapper
 from QuestManager import QuestManager
-from Interface import InterfaceBuilder
+from Interface import Interface, InterfaceBuilder
 
 
 class InterfaceBuilderSuite(TestSuite):
@@ -471,6 +472,117 @@ class InterfaceBuilderSuite(TestSuite):
         ib.finish(locals(), "hello")
         self.IB_test("InterfaceDialog_completed.dialog_hello")
 
+    def test_08(self):
+        parts = OrderedDict()
+        for i in range(1, 6):
+            uid = "get_item{}".format(i)
+            parts[uid] = {
+                "info": "",
+                "uid": uid,
+                "name": "Get an item {}".format(i),
+                "item": {"arch": "sword", "name": "quest sword {}".format(i),
+                         "nrof": 2},
+            }
+
+        quest = {
+            "parts": parts,
+            "name": "Test Quest",
+            "uid": "test_quest",
+        }
+        qm = QuestManager(activator, quest)
+
+        for part in parts:
+            qm.start(part)
+
+        # noinspection PyPep8Naming
+        class InterfaceDialog_need_finish_get_item5(InterfaceBuilder):
+            @ib_wrapper
+            def dialog_hello(self):
+                pass
+
+        dialogs = locals()
+
+        def count_calls(finish):
+            qm.activator = CApiCounter(activator)
+            qm.quest_object = CApiCounter(qm.quest_object)
+
+            ib = InterfaceBuilder(activator, self.npc)
+            ib.set_quest(qm)
+            finish(ib)
+
+            calls = qm.activator.calls + qm.quest_object.calls
+            qm.activator = qm.activator._obj
+            qm.quest_object = qm.quest_object._obj
+            return calls
+
+        calls_uncached = count_calls(
+            lambda ib: ib._handle_dialog(
+                ib._select_dialog(dialogs, "InterfaceDialog"), "hello"
+            )
+        )
+        self.IB_test("InterfaceDialog_need_finish_get_item5.dialog_hello")
+        calls_cached = count_calls(lambda ib: ib.finish(dialogs, "hello"))
+        self.IB_test("InterfaceDialog_need_finish_get_item5.dialog_hello")
+
+        Atrinik.print("C API calls per dialogue: {} uncached, {} with "
+                      "snapshot".format(calls_uncached, calls_cached))
+        # One walk of the quest object's inventory, plus one search of the
+        # activator's inventory for the only quest item that gets checked.
+        self.assertEqual(calls_cached, 2)
+        self.assertLess(calls_cached, calls_uncached)
+
+        # The handlers run outside of the snapshot, so they see quest items
+        # they create themselves.
+        finished = []
+        swords = []
+
+        # noinspection PyPep8Naming
+        class InterfaceDialog_need_finish_get_item5(InterfaceBuilder):
+            @ib_wrapper
+            def dialog_hello(self):
+                for i in range(2):
+                    sword = activator.CreateObject("sword")
+                    sword.name = "quest sword 5"
+                    swords.append(sword)
+
+                finished.append(self.qm.finished("get_item5"))
+
+        ib = InterfaceBuilder(activator, self.npc)
+        ib.set_quest(qm)
+        ib.finish(locals(), "hello")
+        self.IB_test("InterfaceDialog_need_finish_get_item5.dialog_hello")
+        self.assertEqual(finished, [True])
+
+        for sword in swords:
+            sword.Destroy()
+
+    def test_09(self):
+        icon = self.npc.face[0]
+
+        def merchant_list():
+            inf = Interface(activator, self.npc)
+            inf.add_msg("I can offer you the following.")
+
+            for i in range(200):
+                name = "item {}".format(i)
+                inf.add_msg_icon(icon, "{} for {} copper".format(name, i))
+                inf.add_link(name.capitalize(), dest="buy " + name)
+
+            inf.send()
+            return inf
+
+        inf = merchant_list()
+        msg = "".join(inf._msg)
+        self.assertEqual(msg.count("[icon={} 50 50]".format(icon)), 200)
+        self.assertTrue(msg.endswith("item 199 for 199 copper"
+                                     "[/hcenter][/padding]"))
+        self.assertEqual(len(inf._links), 200)
+
+        num = 100
+        elapsed = timeit.timeit(merchant_list, number=num)
+        Atrinik.print("200-item merchant list: {:.3f} ms per dialog".format(
+            elapsed / num * 1000))
+
 
 activator = Atrinik.WhoIsActivator()
 me = Atrinik.WhoAmI()
@@ -141,6 +141,37 @@ def simulate_server(seconds=None, count=None, wait=True, before_cb=None,
     return i
 
 
+class CApiCounter:
+    """
+    Wraps an :class:`Atrinik.Object.Object` and counts how many times the
+    inventory-scanning parts of the C API are used through it.
+    """
+
+    methods = frozenset(["FindObject", "FindObjects", "inv"])
+
+    def __init__(self, obj):
+        self._obj = obj
+        self.calls = 0
+
+    def __getattr__(self, item):
+        if item in self.methods:
+            self.calls += 1
+
+        return getattr(self._obj, item)
+
+    def __bool__(self):
+        return bool(self._obj)
+
+    def __eq__(self, other):
+        if isinstance(other, CApiCounter):
+            other = other._obj
+
+        return self._obj == other
+
+    def __hash__(self):
+        return hash(self._obj)
+
+
 class TestSuite(unittest.TestCase):
     maxDiff = None
 
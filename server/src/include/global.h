@@ -417,6 +417,11 @@ typedef struct settings_struct {
      */
     uint8_t python_reload_modules;
 
+    /**
+     * Whether to compile Python scripts when the server starts.
+     */
+    uint8_t python_precompile;
+
     /**
      * Comma-delimited list of permission groups each player
      * automatically has.
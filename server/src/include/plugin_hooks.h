@@ -212,6 +212,7 @@ PLUGIN_HOOK_FUNCTION(char *, string_sub, const char *, ssize_t, ssize_t MEMORY_D
 PLUGIN_HOOK_FUNCTION(char *, path_join, const char *, const char *)
 PLUGIN_HOOK_FUNCTION(void , monster_enemy_signal, object *, object *)
 PLUGIN_HOOK_FUNCTION(void , map_redraw, mapstruct *, int, int, int, int)
+PLUGIN_HOOK_FUNCTION(void , path_ensure_directories, const char *)
 #ifndef NDEBUG
 PLUGIN_HOOK_FUNCTION(void *, memory_emalloc, size_t, const char *, uint32_t)
 PLUGIN_HOOK_FUNCTION(void , memory_efree, void *, const char *, uint32_t)
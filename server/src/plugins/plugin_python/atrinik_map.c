@@ -248,6 +248,75 @@ static PyObject *Atrinik_Map_GetLayer(Atrinik_Map *self, PyObject *args)
     return list;
 }
 
+/** Documentation for Atrinik_Map_GetLayers(). */
+static const char doc_Atrinik_Map_GetLayers[] =
+".. method:: GetLayers(x, y).\n\n"
+"Construct lists of objects on the specified square, one for each layer. This "
+"is equivalent to calling :meth:`~Atrinik.Map.Map.GetLayer` for every layer, "
+"but only walks the square once.\n\n"
+":param x: X coordinate on the map.\n"
+":type x: int\n"
+":param y: Y coordinate on the map.\n"
+":type y: int\n"
+":returns: A tuple of lists of objects, indexed by the layer ID (eg, "
+":attr:`~Atrinik.LAYER_WALL`).\n"
+":rtype: tuple of lists of :class:`Atrinik.Object.Object`\n"
+":raises Atrinik.AtrinikError: If there was an error trying to get the "
+"objects (invalid X/Y, or not on a nearby tiled map, for example).";
+
+/**
+ * Implements Atrinik.Map.Map.GetLayers() Python method.
+ * @copydoc PyMethod_VARARGS
+ */
+static PyObject *Atrinik_Map_GetLayers(Atrinik_Map *self, PyObject *args)
+{
+    int x, y;
+
+    if (!PyArg_ParseTuple(args, "ii", &x, &y)) {
+        return NULL;
+    }
+
+    mapstruct *m = hooks->get_map_from_coord(self->map, &x, &y);
+    if (m == NULL) {
+        RAISE("Unable to get map using get_map_from_coord().");
+    }
+
+    PyObject *tuple = PyTuple_New(NUM_LAYERS + 1);
+    if (tuple == NULL) {
+        return NULL;
+    }
+
+    for (int layer = 0; layer <= NUM_LAYERS; layer++) {
+        PyObject *list = PyList_New(0);
+        if (list == NULL) {
+            Py_DECREF(tuple);
+            return NULL;
+        }
+
+        PyTuple_SET_ITEM(tuple, layer, list);
+    }
+
+    /* Objects on a square are sorted by their layer and sub-layer, so a
+     * single pass keeps the same order as Atrinik_Map_GetLayer(). */
+    for (object *tmp = GET_MAP_OB(m, x, y); tmp != NULL; tmp = tmp->above) {
+        if (tmp->layer > NUM_LAYERS) {
+            continue;
+        }
+
+        PyObject *obj = wrap_object(tmp);
+        if (obj == NULL || PyList_Append(PyTuple_GET_ITEM(tuple, tmp->layer),
+                obj) == -1) {
+            Py_XDECREF(obj);
+            Py_DECREF(tuple);
+            return NULL;
+        }
+
+        Py_DECREF(obj);
+    }
+
+    return tuple;
+}
+
 /** Documentation for Atrinik_Map_GetMapFromCoord(). */
 static const char doc_Atrinik_Map_GetMapFromCoord[] =
 ".. method:: GetMapFromCoord(x, y).\n\n"
@@ -835,6 +904,8 @@ static PyMethodDef MapMethods[] = {
             doc_Atrinik_Map_ObjectsReversed},
     {"GetLayer", (PyCFunction) Atrinik_Map_GetLayer, METH_VARARGS,
             doc_Atrinik_Map_GetLayer},
+    {"GetLayers", (PyCFunction) Atrinik_Map_GetLayers, METH_VARARGS,
+            doc_Atrinik_Map_GetLayers},
     {"GetMapFromCoord", (PyCFunction) Atrinik_Map_GetMapFromCoord, METH_VARARGS,
             doc_Atrinik_Map_GetMapFromCoord},
     {"PlaySound", (PyCFunction) Atrinik_Map_PlaySound,
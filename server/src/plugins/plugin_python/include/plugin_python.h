@@ -495,10 +495,52 @@ typedef struct python_cache_entry {
     /** Last cached time. */
     time_t cached_time;
 
+    /** Tick when the script file was last stat()ed. */
+    long checked_ticks;
+
     /** Hash handle. */
     UT_hash_handle hh;
 } python_cache_entry;
 
+/** One loaded module from the Python scripts directory. */
+typedef struct python_module_entry {
+    /** Name of the module. */
+    char *name;
+
+    /** Modification time of the module file when it was last loaded. */
+    time_t mtime;
+
+    /** Hash handle. */
+    UT_hash_handle hh;
+} python_module_entry;
+
+/** Profiling data of one script. */
+typedef struct python_profile_entry {
+    /** The script file, relative to the maps directory. */
+    char *file;
+
+    /** How many times the script was executed. */
+    uint64_t calls;
+
+    /** How many of the executions were timed. */
+    uint64_t timed;
+
+    /** Total wall time of the timed executions, in seconds. */
+    double total_time;
+
+    /** Longest wall time of a single execution, in seconds. */
+    double peak_time;
+
+    /** How many times the compiled bytecode was found in the cache. */
+    uint64_t cache_hits;
+
+    /** How many times the script had to be (re-)compiled. */
+    uint64_t cache_misses;
+
+    /** Hash handle. */
+    UT_hash_handle hh;
+} python_profile_entry;
+
 /**
  * General structure for Python object fields.
  */
@@ -42,6 +42,8 @@
 
 #include <compile.h>
 #include <eval.h>
+#include <marshal.h>
+#include <dirent.h>
 #ifdef STR
 /* STR is redefined in node.h. Since this file doesn't use STR, we remove it */
 #undef STR
@@ -495,9 +497,37 @@ static const char *const constants_colors[][2] = {
     {NULL, NULL}
 };
 
+/**
+ * Number of ticks during which a cached script is not checked for changes
+ * again.
+ */
+#define PYTHON_CACHE_STAT_TICKS 8
+/**
+ * Directory in the data directory where the compiled bytecode of scripts is
+ * stored.
+ */
+#define PYTHON_CACHE_DIR "python_cache"
+
 /** The Python cache. */
 static python_cache_entry *python_cache = NULL;
 
+/** The loaded modules from the Python scripts directory. */
+static python_module_entry *python_modules = NULL;
+/** Tick when the loaded modules were last checked for changes. */
+static long python_modules_checked_ticks = -1;
+
+/** The script profiling data. */
+static python_profile_entry *python_profile = NULL;
+/** Whether to time the script executions. */
+static bool python_profile_enabled = true;
+/**
+ * Only time every Nth script execution; calls and cache hits/misses are
+ * always counted.
+ */
+static uint32_t python_profile_sample_rate = 1;
+/** Number of script executions since profiling was (re-)configured. */
+static uint32_t python_profile_sample_counter = 0;
+
 /**
  * Initialize the context stack.
  */
@@ -661,25 +691,184 @@ static void PyErr_LOG(void)
     Py_XDECREF(ptraceback);
 }
 
+/**
+ * Construct the path to the stored bytecode of the specified script.
+ * @param filename
+ * The script file.
+ * @param[out] buf
+ * Buffer to write the path into.
+ * @param len
+ * Size of the buffer.
+ * @return
+ * Whether the path was constructed; false if the script is not in the maps
+ * directory.
+ */
+static bool python_cache_path(const char *filename, char *buf, size_t len)
+{
+    size_t mapspath_len = strlen(hooks->settings->mapspath);
+
+    if (strncmp(filename, hooks->settings->mapspath, mapspath_len) != 0 ||
+            filename[mapspath_len] != '/') {
+        return false;
+    }
+
+    snprintf(buf, len, "%s/"PYTHON_CACHE_DIR"%sc", hooks->settings->datapath,
+            filename + mapspath_len);
+    return true;
+}
+
+/**
+ * Load the stored bytecode of the specified script.
+ * @param filename
+ * The script file.
+ * @param mtime
+ * Modification time of the script file; bytecode compiled from a different
+ * version of the script is ignored.
+ * @return
+ * The bytecode, NULL if there is no usable stored bytecode.
+ */
+static PyObject *python_cache_load(const char *filename, time_t mtime)
+{
+    char path[HUGE_BUF];
+
+    if (!python_cache_path(filename, VS(path))) {
+        return NULL;
+    }
+
+    FILE *fp = fopen(path, "rb");
+
+    if (fp == NULL) {
+        return NULL;
+    }
+
+    uint32_t magic;
+    int64_t cached_mtime;
+    PyObject *code = NULL;
+
+    if (fread(&magic, sizeof(magic), 1, fp) == 1 &&
+            fread(&cached_mtime, sizeof(cached_mtime), 1, fp) == 1 &&
+            magic == (uint32_t) PyImport_GetMagicNumber() &&
+            cached_mtime == (int64_t) mtime) {
+        long start = ftell(fp);
+        fseek(fp, 0, SEEK_END);
+        long size = ftell(fp) - start;
+        fseek(fp, start, SEEK_SET);
+
+        char *data = size > 0 ? malloc(size) : NULL;
+
+        if (data != NULL && fread(data, 1, size, fp) == (size_t) size) {
+            code = PyMarshal_ReadObjectFromString(data, size);
+
+            if (code != NULL && !PyCode_Check(code)) {
+                Py_DECREF(code);
+                code = NULL;
+            }
+
+            PyErr_Clear();
+        }
+
+        free(data);
+    }
+
+    fclose(fp);
+
+    return code;
+}
+
+/**
+ * Store the bytecode of the specified script in the data directory, so
+ * that it doesn't need to be compiled again after a restart.
+ * @param filename
+ * The script file.
+ * @param mtime
+ * Modification time of the script file.
+ * @param code
+ * The bytecode.
+ */
+static void python_cache_save(const char *filename, time_t mtime,
+        PyObject *code)
+{
+    char path[HUGE_BUF], path_tmp[HUGE_BUF];
+
+    if (!python_cache_path(filename, VS(path))) {
+        return;
+    }
+
+    PyObject *data = PyMarshal_WriteObjectToString(code, Py_MARSHAL_VERSION);
+
+    if (data == NULL) {
+        PyErr_Clear();
+        return;
+    }
+
+    snprintf(VS(path_tmp), "%s.tmp", path);
+    hooks->path_ensure_directories(path_tmp);
+
+    FILE *fp = fopen(path_tmp, "wb");
+
+    if (fp == NULL) {
+        LOG(ERROR, "Could not open %s for writing: %s", path_tmp,
+                strerror(errno));
+        Py_DECREF(data);
+        return;
+    }
+
+    uint32_t magic = (uint32_t) PyImport_GetMagicNumber();
+    int64_t cached_mtime = (int64_t) mtime;
+    bool success = fwrite(&magic, sizeof(magic), 1, fp) == 1 &&
+            fwrite(&cached_mtime, sizeof(cached_mtime), 1, fp) == 1 &&
+            fwrite(PyBytes_AS_STRING(data), 1, PyBytes_GET_SIZE(data),
+            fp) == (size_t) PyBytes_GET_SIZE(data);
+
+    if (fclose(fp) != 0) {
+        success = false;
+    }
+
+    /* Write to a temporary file first and then rename it, so that a
+     * partially written file is never loaded. */
+    if (!success || rename(path_tmp, path) != 0) {
+        LOG(ERROR, "Could not write %s: %s", path, strerror(errno));
+        unlink(path_tmp);
+    }
+
+    Py_DECREF(data);
+}
+
 /**
  * Outputs the compiled bytecode for a given python file, using in-memory
  * caching of bytecode.
+ *
+ * The script file is checked for modifications at most once every
+ * #PYTHON_CACHE_STAT_TICKS ticks. If the python_precompile setting is
+ * enabled, the compiled bytecode is also stored in the data directory.
+ * @param filename
+ * The script file.
+ * @param[out] cache_hit
+ * Will be set to whether the bytecode was found in the cache.
  */
-static PyObject *compilePython(char *filename)
+static PyObject *compilePython(char *filename, bool *cache_hit)
 {
     struct stat stat_buf;
     python_cache_entry *cache;
 
+    *cache_hit = false;
+
+    HASH_FIND_STR(python_cache, filename, cache);
+
+    if (cache != NULL &&
+            *hooks->pticks - cache->checked_ticks < PYTHON_CACHE_STAT_TICKS) {
+        *cache_hit = true;
+        return cache->code;
+    }
+
     if (stat(filename, &stat_buf)) {
         LOG(DEBUG, "Python: The script file %s can't be stat()ed.", filename);
         return NULL;
     }
 
-    HASH_FIND_STR(python_cache, filename, cache);
-
-    if (!cache || cache->cached_time < stat_buf.st_mtime) {
-        FILE *fp;
-        char *n;
+    if (cache && cache->cached_time >= stat_buf.st_mtime) {
+        *cache_hit = true;
+    } else {
         PyObject *code = NULL;
 
         if (cache) {
@@ -689,38 +878,51 @@ static PyObject *compilePython(char *filename)
             free(cache);
         }
 
-        fp = fopen(filename, "r");
-
-        if (!fp) {
-            LOG(BUG, "Python: The %s script file can't be opened.", filename);
-            return NULL;
+        if (hooks->settings->python_precompile) {
+            code = python_cache_load(filename, stat_buf.st_mtime);
         }
 
-        fseek(fp, 0, SEEK_END);
-        long filesize = ftell(fp);
-        rewind(fp);
-        
-        n = (char *) malloc(filesize + 1);
-        
-        if (n == NULL) {
-            LOG(BUG, "Python: Can not allocate memory for the %s script file.", filename);
-            
+        if (code == NULL) {
+            FILE *fp;
+            char *n;
+
+            fp = fopen(filename, "r");
+
+            if (!fp) {
+                LOG(BUG, "Python: The %s script file can't be opened.",
+                        filename);
+                return NULL;
+            }
+
+            fseek(fp, 0, SEEK_END);
+            long filesize = ftell(fp);
+            rewind(fp);
+
+            n = (char *) malloc(filesize + 1);
+
+            if (n == NULL) {
+                LOG(BUG, "Python: Can not allocate memory for the %s script "
+                        "file.", filename);
+
+                fclose(fp);
+                return NULL;
+            }
+
+            fread(n, 1, filesize, fp);
+            n[filesize] = '\0';
             fclose(fp);
-            return NULL;
-        }
-        
-        fread(n, 1, filesize, fp);
-        n[filesize] = '\0';
-        
-        if (n) {
+
             code = Py_CompileString(n, filename, Py_file_input);
-        }
+            free(n);
 
-        fclose(fp);
+            if (PyErr_Occurred()) {
+                PyErr_LOG();
+                return NULL;
+            }
 
-        if (PyErr_Occurred()) {
-            PyErr_LOG();
-            return NULL;
+            if (hooks->settings->python_precompile) {
+                python_cache_save(filename, stat_buf.st_mtime, code);
+            }
         }
 
         cache = malloc(sizeof(*cache));
@@ -731,9 +933,373 @@ static PyObject *compilePython(char *filename)
                 cache);
     }
 
+    cache->checked_ticks = *hooks->pticks;
+
     return cache->code;
 }
 
+/**
+ * Compile all the Python scripts in the specified directory and its
+ * sub-directories, filling the bytecode cache.
+ * @param path
+ * Directory to compile, relative to the maps directory.
+ * @return
+ * Number of compiled scripts.
+ */
+static uint32_t python_precompile_dir(const char *path)
+{
+    DIR *dir = opendir(hooks->create_pathname(path));
+
+    if (dir == NULL) {
+        LOG(ERROR, "Could not open directory %s: %s",
+                hooks->create_pathname(path), strerror(errno));
+        return 0;
+    }
+
+    uint32_t num = 0;
+    struct dirent *d;
+
+    while ((d = readdir(dir)) != NULL) {
+        if (d->d_name[0] == '.') {
+            continue;
+        }
+
+        char subpath[HUGE_BUF];
+        snprintf(VS(subpath), "%s/%s", path, d->d_name);
+
+        struct stat stat_buf;
+
+        if (stat(hooks->create_pathname(subpath), &stat_buf) != 0) {
+            continue;
+        }
+
+        if (S_ISDIR(stat_buf.st_mode)) {
+            num += python_precompile_dir(subpath);
+            continue;
+        }
+
+        size_t len = strlen(d->d_name);
+
+        if (!S_ISREG(stat_buf.st_mode) || len < 3 ||
+                strcmp(d->d_name + len - 3, ".py") != 0) {
+            continue;
+        }
+
+        bool cache_hit;
+
+        if (compilePython(hooks->create_pathname(subpath), &cache_hit) !=
+                NULL) {
+            num++;
+        }
+    }
+
+    closedir(dir);
+
+    return num;
+}
+
+/**
+ * Collect the names of the modules the specified module depends on, ie,
+ * modules it has imported, or imported objects from.
+ *
+ * Objects that know the module they were defined in (classes, functions,
+ * wrapped functions such as functools.lru_cache() wrappers, instances of
+ * classes) depend on that module. Other objects, such as imported
+ * constants, conservatively depend on every module that has the very same
+ * object under the same name.
+ * @param module
+ * The module.
+ * @param modules
+ * Dictionary of module names to consider.
+ * @return
+ * Set of the names of the modules in 'modules' that the module depends on,
+ * NULL on failure.
+ */
+static PyObject *python_module_dependencies(PyObject *module,
+        PyObject *modules)
+{
+    PyObject *deps = PySet_New(NULL);
+
+    if (deps == NULL) {
+        return NULL;
+    }
+
+    PyObject *dict = PyModule_GetDict(module), *key, *value;
+    Py_ssize_t pos = 0;
+
+    while (PyDict_Next(dict, &pos, &key, &value)) {
+        PyObject *name;
+
+        if (PyModule_Check(value)) {
+            name = PyModule_GetNameObject(value);
+        } else {
+            name = PyObject_GetAttrString(value, "__module__");
+        }
+
+        if (name != NULL && PyUnicode_Check(name)) {
+            if (PyDict_Contains(modules, name) == 1) {
+                PySet_Add(deps, name);
+            }
+
+            Py_DECREF(name);
+            continue;
+        }
+
+        Py_XDECREF(name);
+        PyErr_Clear();
+
+        /* Skip the module's special attributes, and objects that are
+         * never worth importing. */
+        const char *attr = PyUnicode_Check(key) ? PyUnicode_AsUTF8(key) :
+                NULL;
+
+        if (attr == NULL || strncmp(attr, "__", 2) == 0 || value == Py_None ||
+                PyBool_Check(value)) {
+            PyErr_Clear();
+            continue;
+        }
+
+        PyObject *m_key, *m_value;
+        Py_ssize_t m_pos = 0;
+
+        while (PyDict_Next(modules, &m_pos, &m_key, &m_value)) {
+            if (m_value != module &&
+                    PyDict_GetItem(PyModule_GetDict(m_value), key) == value) {
+                PySet_Add(deps, m_key);
+            }
+        }
+    }
+
+    /* A module's own classes and functions are not a dependency. */
+    PyObject *name = PyModule_GetNameObject(module);
+
+    if (name != NULL) {
+        PySet_Discard(deps, name);
+        Py_DECREF(name);
+    }
+
+    PyErr_Clear();
+
+    return deps;
+}
+
+/**
+ * Reload the modules from the Python scripts directory whose files have
+ * changed since they were loaded, along with the modules that depend on
+ * them. Modules are reloaded after the modules they depend on.
+ *
+ * The modules are checked at most once per tick.
+ */
+static void python_reload_changed_modules(void)
+{
+    if (python_modules_checked_ticks == *hooks->pticks) {
+        return;
+    }
+
+    python_modules_checked_ticks = *hooks->pticks;
+
+    char m_buf[MAX_BUF];
+    /* Create path name to the Python scripts directory. */
+    snprintf(VS(m_buf), "%s/", hooks->create_pathname("/python"));
+    size_t m_buf_len = strlen(m_buf);
+
+    PyObject *modules = PyDict_New();
+    PyObject *reload = PySet_New(NULL);
+    PyObject *key, *value;
+    Py_ssize_t pos = 0;
+
+    /* Go through the loaded modules, looking for modules that were loaded
+     * from one of our script files. */
+    while (PyDict_Next(PyImport_GetModuleDict(), &pos, &key, &value)) {
+        if (!PyModule_Check(value) || !PyUnicode_Check(key)) {
+            continue;
+        }
+
+        PyObject *filename = PyModule_GetFilenameObject(value);
+
+        if (filename == NULL) {
+            PyErr_Clear();
+            continue;
+        }
+
+        const char *m_filename = PyUnicode_AsUTF8(filename);
+        struct stat stat_buf;
+
+        if (m_filename == NULL || strncmp(m_filename, m_buf, m_buf_len) != 0 ||
+                stat(m_filename, &stat_buf) != 0) {
+            PyErr_Clear();
+            Py_DECREF(filename);
+            continue;
+        }
+
+        Py_DECREF(filename);
+        PyDict_SetItem(modules, key, value);
+
+        const char *name = PyUnicode_AsUTF8(key);
+        python_module_entry *entry;
+        HASH_FIND_STR(python_modules, name, entry);
+
+        if (entry == NULL) {
+            entry = malloc(sizeof(*entry));
+            entry->name = strdup(name);
+            entry->mtime = stat_buf.st_mtime;
+            HASH_ADD_KEYPTR(hh, python_modules, entry->name,
+                    strlen(entry->name), entry);
+        } else if (entry->mtime != stat_buf.st_mtime) {
+            entry->mtime = stat_buf.st_mtime;
+            PySet_Add(reload, key);
+        }
+    }
+
+    if (PySet_GET_SIZE(reload) == 0) {
+        Py_DECREF(modules);
+        Py_DECREF(reload);
+        return;
+    }
+
+    /* Collect the dependencies before reloading anything, as reloading
+     * replaces the objects the dependent modules refer to. */
+    PyObject *deps = PyDict_New();
+    pos = 0;
+
+    while (PyDict_Next(modules, &pos, &key, &value)) {
+        PyObject *module_deps = python_module_dependencies(value, modules);
+
+        if (module_deps != NULL) {
+            PyDict_SetItem(deps, key, module_deps);
+            Py_DECREF(module_deps);
+        }
+    }
+
+    /* Add the modules that depend on the changed modules. */
+    bool changed = true;
+
+    while (changed) {
+        changed = false;
+        pos = 0;
+
+        while (PyDict_Next(deps, &pos, &key, &value)) {
+            if (PySet_Contains(reload, key) == 1) {
+                continue;
+            }
+
+            PyObject *common = PyNumber_And(value, reload);
+
+            if (common != NULL && PySet_GET_SIZE(common) != 0) {
+                PySet_Add(reload, key);
+                changed = true;
+            }
+
+            Py_XDECREF(common);
+        }
+    }
+
+    /* Reload the modules, dependencies first. */
+    while (PySet_GET_SIZE(reload) != 0) {
+        PyObject *names = PySequence_List(reload);
+        PyObject *ready = PyList_New(0);
+
+        for (Py_ssize_t i = 0; i < PyList_GET_SIZE(names); i++) {
+            PyObject *name = PyList_GET_ITEM(names, i);
+            PyObject *module_deps = PyDict_GetItem(deps, name);
+            PyObject *common = module_deps != NULL ?
+                PyNumber_And(module_deps, reload) : NULL;
+
+            if (common == NULL || PySet_GET_SIZE(common) == 0) {
+                PyList_Append(ready, name);
+            }
+
+            Py_XDECREF(common);
+        }
+
+        /* Circular dependencies; reload the remaining modules as they
+         * are. */
+        if (PyList_GET_SIZE(ready) == 0) {
+            Py_DECREF(ready);
+            ready = names;
+        } else {
+            Py_DECREF(names);
+        }
+
+        PyList_Sort(ready);
+
+        for (Py_ssize_t i = 0; i < PyList_GET_SIZE(ready); i++) {
+            PyObject *name = PyList_GET_ITEM(ready, i);
+
+            LOG(DEBUG, "Python: Reloading module %s",
+                    PyUnicode_AsUTF8(name));
+            PyObject *module = PyImport_ReloadModule(PyDict_GetItem(modules,
+                    name));
+
+            if (module == NULL) {
+                PyErr_LOG();
+            } else {
+                Py_DECREF(module);
+            }
+
+            PySet_Discard(reload, name);
+        }
+
+        Py_DECREF(ready);
+    }
+
+    Py_DECREF(deps);
+    Py_DECREF(modules);
+    Py_DECREF(reload);
+}
+
+/**
+ * Acquire the profiling data entry of the specified script, creating it if
+ * necessary.
+ * @param filename
+ * The script file.
+ * @return
+ * The profiling data entry.
+ */
+static python_profile_entry *python_profile_get(const char *filename)
+{
+    python_profile_entry *entry;
+
+    HASH_FIND_STR(python_profile, filename, entry);
+
+    if (entry == NULL) {
+        entry = calloc(1, sizeof(*entry));
+        entry->file = strdup(filename);
+        HASH_ADD_KEYPTR(hh, python_profile, entry->file, strlen(entry->file),
+                entry);
+    }
+
+    return entry;
+}
+
+/**
+ * Free all the script profiling data.
+ */
+static void python_profile_free(void)
+{
+    python_profile_entry *entry, *tmp;
+
+    HASH_ITER(hh, python_profile, entry, tmp) {
+        HASH_DEL(python_profile, entry);
+        free(entry->file);
+        free(entry);
+    }
+}
+
+/**
+ * Free the tracked modules from the Python scripts directory.
+ */
+static void python_modules_free(void)
+{
+    python_module_entry *entry, *tmp;
+
+    HASH_ITER(hh, python_modules, entry, tmp) {
+        HASH_DEL(python_modules, entry);
+        free(entry->name);
+        free(entry);
+    }
+}
+
 static int do_script(PythonContext *context, const char *filename)
 {
     PyObject *pycode;
@@ -795,41 +1361,28 @@ static int do_script(PythonContext *context, const char *filename)
 
     gilstate = PyGILState_Ensure();
 
-    LOG(DEVEL, "Compile the Python script %s", 
-        hooks->create_pathname(context->event != NULL ? context->event->race : filename));
-    
-    pycode = compilePython(hooks->create_pathname(
-            context->event != NULL ? context->event->race : filename));
-    if (pycode != NULL) {
-        if (hooks->settings->python_reload_modules) {
-            PyObject *modules = PyImport_GetModuleDict(), *key, *value;
-            Py_ssize_t pos = 0;
-            const char *m_filename;
-            char m_buf[MAX_BUF];
-
-            /* Create path name to the Python scripts directory. */
-            strncpy(m_buf, hooks->create_pathname("/python"),
-                    sizeof(m_buf) - 1);
-
-            /* Go through the loaded modules. */
-            while (PyDict_Next(modules, &pos, &key, &value)) {
-                m_filename = PyModule_GetFilename(value);
-
-                if (!m_filename) {
-                    PyErr_Clear();
-                    continue;
-                }
+    const char *script = context->event != NULL ? context->event->race :
+            filename;
+    python_profile_entry *profile = python_profile_get(script);
+    bool timed = python_profile_enabled && python_profile_sample_counter++ %
+            python_profile_sample_rate == 0;
+    bool cache_hit;
+    TIMER_START(script);
 
-                /* If this module was loaded from one of our script files,
-                 * reload it. */
-                if (!strncmp(m_filename, m_buf, strlen(m_buf))) {
-                    PyImport_ReloadModule(value);
+    LOG(DEVEL, "Compile the Python script %s", hooks->create_pathname(script));
 
-                    if (PyErr_Occurred()) {
-                        PyErr_LOG();
-                    }
-                }
-            }
+    pycode = compilePython(hooks->create_pathname(script), &cache_hit);
+    profile->calls++;
+
+    if (cache_hit) {
+        profile->cache_hits++;
+    } else {
+        profile->cache_misses++;
+    }
+
+    if (pycode != NULL) {
+        if (hooks->settings->python_reload_modules) {
+            python_reload_changed_modules();
         }
 
         pushContext(context);
@@ -861,6 +1414,15 @@ static int do_script(PythonContext *context, const char *filename)
         
         Py_XDECREF(ret);
         Py_DECREF(dict);
+
+        if (timed) {
+            TIMER_UPDATE(script);
+            double elapsed = TIMER_GET(script);
+            profile->timed++;
+            profile->total_time += elapsed;
+            profile->peak_time = MAX(profile->peak_time, elapsed);
+        }
+
         PyGILState_Release(gilstate);
         
         return 1;
@@ -1961,6 +2523,8 @@ static PyObject *Atrinik_GetSettings(PyObject *self)
             hooks->settings->item_power_factor));
     PyDict_SetItemString(dict, "python_reload_modules", Py_BuildBoolean(
             hooks->settings->python_reload_modules));
+    PyDict_SetItemString(dict, "python_precompile", Py_BuildBoolean(
+            hooks->settings->python_precompile));
     PyDict_SetItemString(dict, "default_permission_groups", Py_BuildValue("s",
             hooks->settings->default_permission_groups));
 
@@ -1988,6 +2552,107 @@ static PyObject *Atrinik_GetSettings(PyObject *self)
     return dict;
 }
 
+/** Documentation for Atrinik_GetScriptProfile(). */
+static const char doc_Atrinik_GetScriptProfile[] =
+".. function:: GetScriptProfile(reset=False).\n\n"
+"Acquire the profiling data of the executed scripts.\n\n"
+":param reset: If True, the profiling data is cleared after it is acquired.\n"
+":type reset: bool\n"
+":returns: Dictionary with the script paths as keys and dictionaries with "
+"the profiling data as values. The profiling data contains the number of "
+"script executions (*calls*), how many of them were timed (*timed*), the "
+"total and maximum wall time of the timed executions in seconds "
+"(*total_time* and *max_time*), and the number of bytecode cache hits and "
+"misses (*cache_hits* and *cache_misses*).\n"
+":rtype: dict";
+
+/**
+ * Implements Atrinik.GetScriptProfile() Python method.
+ * @copydoc PyMethod_VARARGS
+ */
+static PyObject *Atrinik_GetScriptProfile(PyObject *self, PyObject *args)
+{
+    int reset = 0;
+
+    if (!PyArg_ParseTuple(args, "|i", &reset)) {
+        return NULL;
+    }
+
+    PyObject *dict = PyDict_New();
+    if (dict == NULL) {
+        return NULL;
+    }
+
+    python_profile_entry *entry, *tmp;
+    HASH_ITER(hh, python_profile, entry, tmp) {
+        PyObject *value = Py_BuildValue("{s:K,s:K,s:d,s:d,s:K,s:K}",
+                "calls", (unsigned PY_LONG_LONG) entry->calls,
+                "timed", (unsigned PY_LONG_LONG) entry->timed,
+                "total_time", entry->total_time,
+                "max_time", entry->peak_time,
+                "cache_hits", (unsigned PY_LONG_LONG) entry->cache_hits,
+                "cache_misses", (unsigned PY_LONG_LONG) entry->cache_misses);
+        if (value == NULL || PyDict_SetItemString(dict, entry->file,
+                value) == -1) {
+            Py_XDECREF(value);
+            Py_DECREF(dict);
+            return NULL;
+        }
+
+        Py_DECREF(value);
+    }
+
+    /* Only clear the collected data, as the entries of scripts that are
+     * currently executing are still referenced by do_script(). */
+    if (reset) {
+        HASH_ITER(hh, python_profile, entry, tmp) {
+            entry->calls = entry->timed = 0;
+            entry->cache_hits = entry->cache_misses = 0;
+            entry->total_time = entry->peak_time = 0.0;
+        }
+    }
+
+    return dict;
+}
+
+/** Documentation for Atrinik_SetScriptProfiling(). */
+static const char doc_Atrinik_SetScriptProfiling[] =
+".. function:: SetScriptProfiling(enabled, sample_rate=1).\n\n"
+"Configure timing of the script executions. Execution counts and bytecode "
+"cache hits/misses are always collected.\n\n"
+":param enabled: Whether to time the script executions.\n"
+":type enabled: bool\n"
+":param sample_rate: Only time every Nth script execution, to reduce the "
+"profiling overhead.\n"
+":type sample_rate: int\n"
+":raises ValueError: If *sample_rate* is lower than 1.";
+
+/**
+ * Implements Atrinik.SetScriptProfiling() Python method.
+ * @copydoc PyMethod_VARARGS
+ */
+static PyObject *Atrinik_SetScriptProfiling(PyObject *self, PyObject *args)
+{
+    int enabled;
+    unsigned int sample_rate = 1;
+
+    if (!PyArg_ParseTuple(args, "i|I", &enabled, &sample_rate)) {
+        return NULL;
+    }
+
+    if (sample_rate < 1) {
+        PyErr_SetString(PyExc_ValueError, "Invalid sample rate.");
+        return NULL;
+    }
+
+    python_profile_enabled = enabled;
+    python_profile_sample_rate = sample_rate;
+    python_profile_sample_counter = 0;
+
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
 /** Documentation for Atrinik_Process(). */
 static const char doc_Atrinik_Process[] =
 ".. function:: Process().\n\n"
@@ -2084,6 +2749,10 @@ static PyMethodDef AtrinikMethods[] = {
             doc_Atrinik_GetSettings},
     {"Process", (PyCFunction) Atrinik_Process, METH_NOARGS,
             doc_Atrinik_Process},
+    {"GetScriptProfile", (PyCFunction) Atrinik_GetScriptProfile,
+            METH_VARARGS, doc_Atrinik_GetScriptProfile},
+    {"SetScriptProfiling", (PyCFunction) Atrinik_SetScriptProfiling,
+            METH_VARARGS, doc_Atrinik_SetScriptProfiling},
     {NULL, NULL, 0, 0}
 };
 
@@ -2396,6 +3065,15 @@ MODULEAPI void postinitPlugin(void)
     initContextStack();
 
     gilstate = PyGILState_Ensure();
+
+    if (hooks->settings->python_precompile) {
+        TIMER_START(1);
+        uint32_t num = python_precompile_dir("");
+        TIMER_UPDATE(1);
+        LOG(INFO, "Python: Precompiled %" PRIu32 " scripts in %f seconds.",
+                num, TIMER_GET(1));
+    }
+
     py_runfile_simple("/python/events/python_init.py", NULL);
 
     if (PyErr_Occurred()) {
@@ -2623,6 +3301,8 @@ MODULEAPI void initPlugin(struct plugin_hooklist *hooklist)
 MODULEAPI void closePlugin(void)
 {
     hooks->cache_remove_by_flags(CACHE_FLAG_GEVENT);
+    python_profile_free();
+    python_modules_free();
     PyGILState_Ensure();
     Py_Finalize();
 }
@@ -587,6 +587,31 @@ clioptions_option_python_reload_modules (const char *arg,
     return true;
 }
 
+/**
+ * Description of the --python_precompile command.
+ */
+static const char *clioptions_option_python_precompile_desc =
+"Whether to compile all the Python scripts in the maps directory when the "
+"server starts, instead of when they are first executed. The compiled "
+"bytecode is also stored in the data directory, so that the scripts do "
+"not need to be compiled again after a restart unless they have changed.";
+/** @copydoc clioptions_handler_func */
+static bool
+clioptions_option_python_precompile (const char *arg,
+                                     char      **errmsg)
+{
+    if (KEYWORD_IS_TRUE(arg)) {
+        settings.python_precompile = 1;
+    } else if (KEYWORD_IS_FALSE(arg)) {
+        settings.python_precompile = 0;
+    } else {
+        string_fmt(*errmsg, "Invalid value: %s", arg);
+        return false;
+    }
+
+    return true;
+}
+
 /**
  * Description of the --default_permission_groups command.
  */
@@ -971,6 +996,9 @@ static void init_library(int argc, char *argv[])
     CLIOPTIONS_CREATE_ARGUMENT(cli, server_cert, "Server certificate");
     CLIOPTIONS_CREATE_ARGUMENT(cli, server_cert_sig, "Certificate signature");
     CLIOPTIONS_CREATE_ARGUMENT(cli, allowed_chars, "Limits for accounts/names");
+    CLIOPTIONS_CREATE_ARGUMENT(cli,
+                               python_precompile,
+                               "Whether to precompile Python scripts");
 
     /* Changeable options */
     CLIOPTIONS_CREATE_ARGUMENT(cli, magic_devices_level, "Magic devices level");
@@ -0,0 +1,160 @@
+#!/usr/bin/python3
+
+"""
+Load test for the HTTP resource server.
+
+Requests the given URLs from several concurrent clients and reports the
+number of requests handled per second. Run it against the old and the new
+server to compare them, for example::
+
+    ./http_load_test.py -c 16 -n 2000 http://localhost:8080/resources/foo
+
+Responses whose body is shorter than their Content-Length count as errors.
+To check that large files are not truncated when the clients read slower
+than the server sends, request a large file with a read delay::
+
+    ./http_load_test.py -c 4 -n 8 --read-delay 0.01 \\
+        http://localhost:8080/big.bin
+"""
+
+import argparse
+import threading
+import time
+from http.client import HTTPConnection
+from urllib.parse import urlparse
+
+
+# Size of the chunks responses are read in.
+READ_SIZE = 64 * 1024
+
+
+def read_body(response, read_delay):
+    """
+    Read the body of a response.
+
+    :param response: The response.
+    :param read_delay: Seconds to sleep after each chunk, to simulate a
+                       slow client.
+    :returns: Number of bytes read.
+    """
+
+    received = 0
+
+    while True:
+        buf = response.read(READ_SIZE)
+
+        if not buf:
+            return received
+
+        received += len(buf)
+
+        if read_delay:
+            time.sleep(read_delay)
+
+
+def worker(urls, num, keep_alive, read_delay, results):
+    """
+    Perform requests, recording their latencies.
+
+    :param urls: URLs to request, in a round-robin fashion.
+    :param num: Number of requests to perform.
+    :param keep_alive: Whether to reuse the connection between requests.
+    :param read_delay: Seconds to sleep after reading each chunk of a
+                       response.
+    :param results: List to append the latencies and the number of
+                    received bytes to.
+    """
+
+    conn = None
+    latencies = []
+    received = 0
+    errors = 0
+
+    for i in range(num):
+        o = urls[i % len(urls)]
+
+        if conn is None:
+            conn = HTTPConnection(o.hostname, o.port or 80, timeout=60)
+
+        start = time.perf_counter()
+
+        try:
+            conn.request("GET", o.path or "/",
+                         headers={} if keep_alive else {"Connection": "close"})
+            response = conn.getresponse()
+            length = response.getheader("Content-Length")
+            size = read_body(response, read_delay)
+            received += size
+
+            if response.status >= 400 or \
+                    (length is not None and size != int(length)):
+                errors += 1
+        except OSError:
+            errors += 1
+            conn.close()
+            conn = None
+            continue
+
+        latencies.append(time.perf_counter() - start)
+
+        if not keep_alive or response.will_close:
+            conn.close()
+            conn = None
+
+    if conn is not None:
+        conn.close()
+
+    results.append((latencies, received, errors))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP server load test.")
+    parser.add_argument("urls", nargs="+", help="URLs to request.")
+    parser.add_argument("-c", "--concurrency", type=int, default=8,
+                        help="Number of concurrent clients.")
+    parser.add_argument("-n", "--requests", type=int, default=1000,
+                        help="Total number of requests.")
+    parser.add_argument("--no-keep-alive", action="store_true",
+                        help="Open a new connection for every request.")
+    parser.add_argument("--read-delay", type=float, default=0.0,
+                        help="Seconds to sleep after reading each 64 KB of "
+                        "a response, to simulate slow clients.")
+    args = parser.parse_args()
+
+    urls = [urlparse(url) for url in args.urls]
+    per_client = max(1, args.requests // args.concurrency)
+    results = []
+    threads = [threading.Thread(target=worker,
+                                args=(urls, per_client,
+                                      not args.no_keep_alive,
+                                      args.read_delay, results))
+               for _ in range(args.concurrency)]
+
+    start = time.perf_counter()
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for result in results for latency in result[0])
+    received = sum(result[1] for result in results)
+    errors = sum(result[2] for result in results)
+
+    print("Requests:      {}".format(len(latencies)))
+    print("Errors:        {}".format(errors))
+    print("Time:          {:.3f} s".format(elapsed))
+    print("Requests/sec:  {:.1f}".format(len(latencies) / elapsed))
+    print("Transfer rate: {:.1f} KB/s".format(received / 1024 / elapsed))
+
+    if latencies:
+        print("Latency:       median {:.2f} ms, 95% {:.2f} ms, max {:.2f} ms"
+              .format(latencies[len(latencies) // 2] * 1000,
+                      latencies[int(len(latencies) * 0.95)] * 1000,
+                      latencies[-1] * 1000))
+
+
+if __name__ == '__main__':
+    main()
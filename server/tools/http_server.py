@@ -1,6 +1,6 @@
 #!/usr/bin/python3
 
-import os, sys, hashlib, platform, io
+import os, sys, hashlib, io, threading, gzip, shutil
 from lockfile import LockFile
 
 # py3k
@@ -24,11 +24,6 @@ except:
 
     config = configparser.ConfigParser()
 
-if any(platform.win32_ver()):
-    SocketServerMixIn = socketserver.ThreadingMixIn
-else:
-    SocketServerMixIn = socketserver.ForkingMixIn
-
 os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 config.read_file(open("server.cfg"))
@@ -39,7 +34,217 @@ path_translations = {
 }
 path_default = config.get("general", "httppath")
 
+## Maximum number of entries in the ETag cache.
+ETAG_CACHE_SIZE = 4096
+## Size of the blocks used to hash files and to copy them if sendfile() is
+## not available.
+BLOCK_SIZE = 64 * 1024
+
+## ETag cache; maps file paths to tuples of the file's (inode, size, mtime)
+## and the ETag.
+etag_cache = {}
+etag_cache_lock = threading.Lock()
+
+def get_etag(path, fs):
+    """
+    Acquire the ETag (SHA1 hex digest) of a file. The ETag is only
+    recalculated if the file's inode, size or modification time changed.
+
+    :param path: Path to the file.
+    :param fs: Result of stat() on the file.
+    :return: The ETag.
+    """
+
+    key = (fs.st_ino, fs.st_size, fs.st_mtime)
+
+    with etag_cache_lock:
+        cached = etag_cache.get(path)
+
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    sha1 = hashlib.sha1()
+
+    with open(path, "rb") as f:
+        while True:
+            buf = f.read(BLOCK_SIZE)
+            if not buf:
+                break
+
+            sha1.update(buf)
+
+    etag = sha1.hexdigest()
+
+    with etag_cache_lock:
+        if len(etag_cache) >= ETAG_CACHE_SIZE:
+            etag_cache.clear()
+
+        etag_cache[path] = (key, etag)
+
+    return etag
+
+## Files smaller than this are not compressed.
+GZIP_MIN_SIZE = 512
+## Compressed files are only used if they are at most this fraction of the
+## original size.
+GZIP_MAX_RATIO = 0.9
+
+## Directory listing cache; maps tuples of the directory path and the
+## requested path to tuples of the directory's modification time and the
+## rendered listing.
+listing_cache = {}
+listing_cache_lock = threading.Lock()
+
+def get_gzip(path, fs):
+    """
+    Acquire the path to the pre-compressed sibling of a file, creating it if
+    it doesn't exist or is out of date. The sibling has the same
+    modification time as the file it was created from.
+
+    :param path: Path to the file.
+    :param fs: Result of stat() on the file.
+    :return: Path to the compressed file, None if it should not be used.
+    """
+
+    if fs.st_size < GZIP_MIN_SIZE:
+        return None
+
+    gz_path = path + ".gz"
+
+    try:
+        gz_fs = os.stat(gz_path)
+    except OSError:
+        gz_fs = None
+
+    if gz_fs is None or gz_fs.st_mtime != fs.st_mtime:
+        tmp_path = "{}.{}.tmp".format(gz_path, threading.get_ident())
+
+        try:
+            with open(path, "rb") as f, open(tmp_path, "wb") as gz_f:
+                with gzip.GzipFile(filename="", mode="wb", fileobj=gz_f,
+                                   mtime=int(fs.st_mtime)) as gz:
+                    shutil.copyfileobj(f, gz, BLOCK_SIZE)
+
+            os.utime(tmp_path, (fs.st_atime, fs.st_mtime))
+            os.replace(tmp_path, gz_path)
+            gz_fs = os.stat(gz_path)
+        except OSError:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+            return None
+
+    # Not worth it for already compressed files.
+    if gz_fs.st_size > fs.st_size * GZIP_MAX_RATIO:
+        return None
+
+    return gz_path
+
+def warmup(paths):
+    """
+    Create the pre-compressed siblings of all the files in the specified
+    directories.
+
+    :param paths: Directories to process.
+    :return: Number of compressed files that are in use.
+    """
+
+    num = 0
+
+    for path in paths:
+        for root, dirs, files in os.walk(path):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+
+            for name in files:
+                if name.startswith(".") or name.endswith(".gz"):
+                    continue
+
+                fullname = os.path.join(root, name)
+
+                try:
+                    fs = os.stat(fullname)
+                except OSError:
+                    continue
+
+                if get_gzip(fullname, fs) is not None:
+                    num += 1
+
+    return num
+
+def accepts_gzip(header):
+    """
+    Check whether an Accept-Encoding header allows gzip.
+
+    :param header: Value of the header.
+    :return: True if gzip is accepted, False otherwise.
+    """
+
+    for coding in header.split(","):
+        name, _, params = coding.partition(";")
+
+        if name.strip().lower() not in ("gzip", "x-gzip"):
+            continue
+
+        params = params.replace(" ", "")
+
+        if params.startswith("q="):
+            try:
+                return float(params[2:]) > 0
+            except ValueError:
+                return False
+
+        return True
+
+    return False
+
+def parse_range(header, size):
+    """
+    Parse a Range header.
+
+    :param header: Value of the header.
+    :param size: Size of the requested file.
+    :return: Tuple of the first and last byte position to send, None if the
+             header should be ignored, False if the range is not
+             satisfiable.
+    """
+
+    if not header.startswith("bytes=") or "," in header:
+        return None
+
+    start, sep, end = header[6:].strip().partition("-")
+    if not sep:
+        return None
+
+    try:
+        if not start:
+            # Suffix range; the last N bytes.
+            length = int(end)
+            if length <= 0:
+                return False
+
+            return max(0, size - length), size - 1
+
+        start = int(start)
+        end = int(end) if end else size - 1
+    except ValueError:
+        return None
+
+    if start >= size:
+        return False
+
+    if start > end:
+        return None
+
+    return start, min(end, size - 1)
+
 class HTTPRequestHandler(SimpleHTTPRequestHandler):
+    # Keep connections alive between requests.
+    protocol_version = "HTTP/1.1"
+    # Headers and body are sent separately; don't delay the body.
+    disable_nagle_algorithm = True
+
     def log_message(self, fmt, *args):
         sys.stdout.write(fmt % args)
         sys.stdout.write("\0")
@@ -61,13 +266,49 @@ class HTTPRequestHandler(SimpleHTTPRequestHandler):
         return path_default + "/" + path
 
     def list_directory(self, path):
+        try:
+            mtime = os.stat(path).st_mtime
+        except os.error:
+            self.send_error(404, "No permission to list directory")
+            return None
+
+        key = (path, self.path)
+
+        with listing_cache_lock:
+            cached = listing_cache.get(key)
+
+        if cached is None or cached[0] != mtime:
+            encoded = self.render_directory(path)
+            if encoded is None:
+                return None
+
+            with listing_cache_lock:
+                if len(listing_cache) >= ETAG_CACHE_SIZE:
+                    listing_cache.clear()
+
+                listing_cache[key] = (mtime, encoded)
+        else:
+            encoded = cached[1]
+
+        f = io.BytesIO(encoded)
+        self.send_response(200)
+        self.send_header("Content-type", "text/html; charset=%s" %
+                         sys.getfilesystemencoding())
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        return f
+
+    def render_directory(self, path):
         try:
             l = os.listdir(path)
         except os.error:
             self.send_error(404, "No permission to list directory")
             return None
 
-        l = [entry for entry in l if not entry.startswith(".")]
+        # Hide the pre-compressed siblings of files.
+        names = set(l)
+        l = [entry for entry in l if not entry.startswith(".") and
+             not (entry.endswith(".gz") and entry[:-3] in names)]
         l.sort(key=lambda a: a.lower())
         r = []
         displaypath = escape(unquote(self.path))
@@ -92,19 +333,12 @@ class HTTPRequestHandler(SimpleHTTPRequestHandler):
             r.append('<li><a href="%s">%s</a></li>'
                     % (quote(linkname), escape(displayname)))
         r.append('</ul>\n<hr>\n</body>\n</html>\n')
-        encoded = '\n'.join(r).encode(enc)
-        f = io.BytesIO()
-        f.write(encoded)
-        f.seek(0)
-        self.send_response(200)
-        self.send_header("Content-type", "text/html; charset=%s" % enc)
-        self.send_header("Content-Length", str(len(encoded)))
-        self.end_headers()
-        return f
+        return '\n'.join(r).encode(enc)
 
     def send_head(self):
         path = self.translate_path(self.path)
         f = None
+        self.range = None
 
         if os.path.basename(path).startswith("."):
             self.send_error(403, "Access denied")
@@ -114,6 +348,7 @@ class HTTPRequestHandler(SimpleHTTPRequestHandler):
             if not self.path.endswith('/'):
                 self.send_response(301)
                 self.send_header("Location", self.path + "/")
+                self.send_header("Content-Length", "0")
                 self.end_headers()
                 return None
 
@@ -133,24 +368,69 @@ class HTTPRequestHandler(SimpleHTTPRequestHandler):
             self.send_error(404, "File not found")
             return None
 
-        if_none_match = self.headers.get("If-None-Match")
-        sha1 = hashlib.sha1(f.read()).hexdigest()
+        try:
+            fs = os.fstat(f.fileno())
+            etag = get_etag(path, fs)
+            encoding = None
 
-        if if_none_match == sha1:
-            self.send_response(304)
-            self.end_headers()
-            f.close()
-            return None
+            if not path.endswith(".gz") and accepts_gzip(
+                    self.headers.get("Accept-Encoding", "")):
+                gz_path = get_gzip(path, fs)
 
-        f.seek(0)
+                if gz_path is not None:
+                    try:
+                        gz_f = open(gz_path, 'rb')
+                    except IOError:
+                        pass
+                    else:
+                        f.close()
+                        f = gz_f
+                        fs = os.fstat(f.fileno())
+                        etag += "-gzip"
+                        encoding = "gzip"
+
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                f.close()
+                return None
+
+            byte_range = None
+            range_header = self.headers.get("Range")
+            if_range = self.headers.get("If-Range")
+
+            if range_header and (if_range is None or if_range == etag):
+                byte_range = parse_range(range_header, fs.st_size)
+
+            if byte_range is False:
+                self.send_response(416)
+                self.send_header("Content-Range", "bytes */%d" % fs.st_size)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                f.close()
+                return None
+
+            if byte_range is not None:
+                start, end = byte_range
+                self.send_response(206)
+                self.send_header("Content-Range", "bytes %d-%d/%d" % (
+                    start, end, fs.st_size))
+                self.range = (start, end - start + 1)
+            else:
+                self.send_response(200)
+                self.range = (0, fs.st_size)
 
-        try:
-            self.send_response(200)
             self.send_header("Content-type", ctype)
-            fs = os.fstat(f.fileno())
-            self.send_header("Content-Length", str(fs[6]))
+            self.send_header("Content-Length", str(self.range[1]))
             self.send_header("Last-Modified", self.date_time_string(fs.st_mtime))
-            self.send_header("ETag", sha1)
+            self.send_header("ETag", etag)
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Vary", "Accept-Encoding")
+
+            if encoding is not None:
+                self.send_header("Content-Encoding", encoding)
+
             self.end_headers()
             return f
         except:
@@ -158,31 +438,44 @@ class HTTPRequestHandler(SimpleHTTPRequestHandler):
             raise
 
     def copyfile(self, source, outputfile):
-        if isinstance(source, io.BytesIO):
+        if isinstance(source, io.BytesIO) or self.range is None:
             return SimpleHTTPRequestHandler.copyfile(self, source, outputfile)
 
-        block_size = 16 * 1024
-        while True:
-            buf = source.read(block_size)
+        offset, count = self.range
+        # socket.sendfile() uses os.sendfile() where possible and falls back
+        # to send(). Unlike a bare os.sendfile() call, it waits for the
+        # socket to become writable, so the timeout set by the server's
+        # threads is respected and slow clients don't cause EAGAIN errors.
+        if hasattr(self.connection, "sendfile"):
+            if count > 0:
+                self.connection.sendfile(source, offset, count)
+
+            return
+
+        source.seek(offset)
+
+        while count > 0:
+            buf = source.read(min(BLOCK_SIZE, count))
             if not buf:
                 break
 
-            total = len(buf)
-            pos = 0
-            while pos < total:
-                ret = outputfile.write(buf[pos:])
-                if ret is None:
-                    break
+            outputfile.write(buf)
+            count -= len(buf)
 
-                pos += ret
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
 
-class ForkingHTTPServer(SocketServerMixIn, HTTPServer):
     def finish_request(self, request, client_address):
         request.settimeout(60)
         HTTPServer.finish_request(self, request, client_address)
 
 if __name__ == '__main__':
+    if "--warmup" in sys.argv[1:]:
+        num = warmup([path_default] + list(path_translations.values()))
+        print("Pre-compressed {} files.".format(num))
+        sys.exit(0)
+
     with LockFile(__file__) as _:
         o = urlparse(config.get("general", "http_url"))
-        server = ForkingHTTPServer(("", o.port), HTTPRequestHandler)
+        server = ThreadingHTTPServer(("", o.port), HTTPRequestHandler)
         server.serve_forever()
@@ -1,102 +1,566 @@
 ## @file
-## Implements the statistics server. Requires Python 3.0 or later.
+## Implements the statistics server. Requires Python 3.2 or later.
+##
+## The game server sends a UDP datagram for every statistic update. The
+## datagrams are drained from the socket in batches and the updates are
+## accumulated in memory. A writer thread periodically flushes the
+## accumulated counters to an SQLite database, so that disk access never
+## holds up receiving.
+##
+## The counters are rolled up into all-time, monthly and daily periods, and
+## can be queried as JSON over HTTP on #QUERY_PORT:
+##
+## - /leaderboard?type=exp&period=all&limit=10 - the players with the
+##   highest value of a statistic. Use type=kills&key=<monster> for the
+##   kills of a particular monster, and type=kills for the total kills. The
+##   response includes a "next" cursor to pass as the "after" parameter to
+##   get the next page.
+## - /player/<name>?period=all - all the statistics of a player.
+##
+## The period is "all", "month", "day", or an explicit month (YYYY_MM) or
+## day (YYYY_MM_DD). Queries only see the flushed counters.
 
-import socket, shelve, sys, time
+import argparse, json, queue, shelve, socket, sqlite3, struct, sys, threading
+import time, traceback
 from datetime import datetime
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs, unquote
 
-## Get 64-bit integer from data.
-## @param data Data.
-## @return The integer.
-def SockList_GetInt64(data):
-    return ((data[0] << 56) + (data[1] << 48) + (data[2] << 40) + (data[3] << 32) + (data[4] << 24) + (data[5] << 16) + (data[6] << 8) + data[7])
-
-## Handle a statistic update.
-## @param database Database to update.
-## @param type Type of the statistic to update.
-## @param name Player's name.
-## @param i Integer data.
-## @param buf String data.
-def handle_stat(database, type, name, i, buf):
-    # Not yet in the database, initialize the player.
-    if not name in database:
-        database[name] = {
+## Port to listen on.
+PORT = 13324
+## Path to the statistics database.
+DB_PATH = "../data/statistics.sqlite"
+## How often to flush the accumulated updates to the database, in seconds.
+FLUSH_INTERVAL = 10
+## Flush early if this many distinct counters have been updated.
+FLUSH_MAX_PENDING = 50000
+## Maximum number of flushes waiting for the writer. While the writer is
+## behind, updates keep accumulating in the aggregator instead.
+WRITER_QUEUE_SIZE = 16
+## Seconds to wait before retrying a flush that failed because the database
+## was locked, busy or full; doubled after each failure.
+WRITER_RETRY_DELAY = 1
+## Maximum number of seconds to wait before retrying a failed flush.
+WRITER_RETRY_MAX_DELAY = 60
+## Maximum number of seconds to wait for the writer on shutdown.
+WRITER_SHUTDOWN_TIMEOUT = 30
+## Maximum number of datagrams to read before checking whether to flush.
+BATCH_SIZE = 1024
+## Size of the socket's receive buffer; absorbs bursts while the receive
+## loop is busy.
+RECV_BUFFER_SIZE = 8 * 1024 * 1024
+## Port of the query interface; it only listens on the loopback interface.
+QUERY_PORT = 13325
+## Maximum number of entries in a leaderboard page.
+LEADERBOARD_MAX_LIMIT = 100
+## Period name of the all-time statistics.
+PERIOD_ALL = "all"
+
+## Parses the 64-bit integer of an update.
+_int64 = struct.Struct("!q")
+
+## Parse a statistic update.
+##
+## The update consists of the NUL-terminated type and player name, a 64-bit
+## integer and an optional NUL-terminated string.
+## @param data Buffer with the datagram.
+## @param size Size of the datagram.
+## @return Tuple of the type, player name, integer and string.
+## @throws ValueError If the datagram is malformed.
+def parse_update(data, size):
+    view = memoryview(data)
+
+    end = data.index(0, 0, size)
+    type = str(view[:end], "utf-8")
+    pos = end + 1
+
+    end = data.index(0, pos, size)
+    name = str(view[pos:end], "utf-8")
+    pos = end + 1
+
+    if pos + _int64.size > size:
+        raise ValueError("truncated update")
+
+    i, = _int64.unpack_from(data, pos)
+    pos += _int64.size
+
+    end = data.find(0, pos, size)
+    buf = str(view[pos:size if end == -1 else end], "utf-8")
+
+    return type, name, i, buf
+
+## The statistics database.
+##
+## Counters are stored per period (#PERIOD_ALL, months and days), player,
+## type and key. The key is the killed monster's name for the "kills" type,
+## and empty for other types and the total kills.
+##
+## Leaderboards are read in order from an index, so a page costs the same
+## no matter how many players there are.
+class StatisticsStore:
+    def __init__(self, path, read_only = False):
+        if read_only:
+            self.conn = sqlite3.connect("file:{}?mode=ro".format(path),
+                                        uri = True)
+            return
+
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS stats (
+                period TEXT NOT NULL,
+                name TEXT NOT NULL,
+                type TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value INTEGER NOT NULL,
+                PRIMARY KEY (period, name, type, key)
+            ) WITHOUT ROWID""")
+        self.conn.execute("""
+            CREATE INDEX IF NOT EXISTS stats_rank
+            ON stats (period, type, key, value DESC, name)""")
+        self.conn.commit()
+
+    ## Add counters to the database in a single transaction.
+    ## @param updates Iterable of tuples of the period, player name, type,
+    ## key and the value to add.
+    def add(self, updates):
+        with self.conn:
+            self.conn.executemany("""
+                INSERT INTO stats (period, name, type, key, value)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (period, name, type, key)
+                DO UPDATE SET value = value + excluded.value""", updates)
+
+    ## Get the statistics of a player.
+    ## @param name Player's name.
+    ## @param period Period to get the statistics of.
+    ## @return Dictionary with the "stats" and "kills" dictionaries.
+    def get_player(self, name, period = PERIOD_ALL):
+        player = {
             "stats": {},
             "kills": {},
         }
 
-    # Particular monster has been killed.
-    if type == "kills":
-        if not buf in database[name]["kills"]:
-            database[name]["kills"][buf] = 0
+        for type, key, value in self.conn.execute(
+                "SELECT type, key, value FROM stats "
+                "WHERE period = ? AND name = ?", (period, name)):
+            if type == "kills" and key:
+                player["kills"][key] = value
+            else:
+                player["stats"][type] = value
+
+        return player
+
+    ## Get a page of a leaderboard.
+    ## @param type Type of the statistic.
+    ## @param key The monster's name for kills of a particular monster,
+    ## empty otherwise.
+    ## @param period Period of the leaderboard.
+    ## @param limit Maximum number of entries to return.
+    ## @param after Tuple of the value and the player name of the last entry
+    ## of the previous page, None for the first page.
+    ## @return List of tuples of player names and values, highest value
+    ## first.
+    def get_leaderboard(self, type, key = "", period = PERIOD_ALL,
+                        limit = 10, after = None):
+        if after is None:
+            return self.conn.execute(
+                "SELECT name, value FROM stats "
+                "WHERE period = ? AND type = ? AND key = ? "
+                "ORDER BY value DESC, name LIMIT ?",
+                (period, type, key, limit)).fetchall()
+
+        value, name = after
+        return self.conn.execute(
+            "SELECT name, value FROM stats "
+            "WHERE period = ? AND type = ? AND key = ? AND "
+            "(value < ? OR (value = ? AND name > ?)) "
+            "ORDER BY value DESC, name LIMIT ?",
+            (period, type, key, value, value, name, limit)).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+## Accumulates statistic updates in memory.
+class Aggregator:
+    def __init__(self):
+        ## Maps tuples of the day, player name, type and key to the
+        ## accumulated value.
+        self.pending = {}
+
+    ## Add a statistic update.
+    ## @param day Day the update was received on (YYYY_MM_DD).
+    ## @param type Type of the statistic.
+    ## @param name Player's name.
+    ## @param i Integer data.
+    ## @param buf String data; the monster's name for kills.
+    def add(self, day, type, name, i, buf):
+        pending = self.pending
+
+        if type == "kills":
+            key = (day, name, type, buf)
+            pending[key] = pending.get(key, 0) + i
+
+        key = (day, name, type, "")
+        pending[key] = pending.get(key, 0) + i
+
+    ## Take the accumulated updates, resetting the aggregator.
+    ## @return List of tuples of the period, player name, type, key and
+    ## value, suitable for StatisticsStore.add(). The updates are rolled up
+    ## into the daily, monthly and all-time periods.
+    def take(self):
+        pending, self.pending = self.pending, {}
+        rollups = {}
+
+        for (day, name, type, key), value in pending.items():
+            for period in (day, day[:7], PERIOD_ALL):
+                rollup_key = (period, name, type, key)
+                rollups[rollup_key] = rollups.get(rollup_key, 0) + value
+
+        return [key + (value,) for key, value in rollups.items()]
+
+## Writes the updates handed over by the receive loop to the database.
+class Writer(threading.Thread):
+    ## Initialize.
+    ## @param path Path to the database.
+    ## @param verbose Whether to print how long each flush took.
+    def __init__(self, path, verbose = False):
+        threading.Thread.__init__(self, name = "statistics-writer")
+        self.path = path
+        self.verbose = verbose
+        self.queue = queue.Queue(WRITER_QUEUE_SIZE)
+        self.stopping = threading.Event()
+
+    def run(self):
+        store = StatisticsStore(self.path)
+
+        try:
+            while True:
+                updates = self.queue.get()
+
+                if updates is None:
+                    break
+
+                self.write(store, updates)
+        finally:
+            store.close()
+
+    ## Write a batch of updates to the database.
+    ##
+    ## If the database is locked, busy or full, the batch is retried with
+    ## an increasing delay until it succeeds or the writer is stopped.
+    ## Batches that fail for other reasons, such as an invalid update, are
+    ## dropped, so that later batches still get written.
+    ## @param store StatisticsStore to write to.
+    ## @param updates The updates.
+    def write(self, store, updates):
+        delay = WRITER_RETRY_DELAY
+
+        while True:
+            start = time.time()
+
+            try:
+                store.add(updates)
+            except sqlite3.OperationalError as err:
+                if self.stopping.is_set():
+                    print("Failed to flush {} counters, giving up: {}".format(
+                        len(updates), err))
+                    sys.stdout.flush()
+                    return
+
+                print("Failed to flush {} counters, retrying in {} s: "
+                      "{}".format(len(updates), delay, err))
+                sys.stdout.flush()
+                self.stopping.wait(delay)
+                delay = min(delay * 2, WRITER_RETRY_MAX_DELAY)
+                continue
+            except Exception:
+                print("Failed to flush {} counters:".format(len(updates)))
+                traceback.print_exc()
+                sys.stdout.flush()
+                return
+
+            if self.verbose:
+                print("Flushed {} counters in {:.3f} s.".format(
+                    len(updates), time.time() - start))
+                sys.stdout.flush()
+
+            return
+
+    ## Hand a batch of updates over to the writer.
+    ## @param updates The updates, None to stop the writer.
+    ## @param timeout Maximum number of seconds to wait if the queue is
+    ## full, None to wait forever.
+    ## @return True if the batch was handed over, False if the writer is
+    ## not running or the queue stayed full.
+    def put(self, updates, timeout = None):
+        if not self.is_alive():
+            return False
+
+        try:
+            self.queue.put(updates, timeout = timeout)
+        except queue.Full:
+            return False
 
-        database[name]["kills"][buf] += i
-    # Regular integer-based statistic.
-    else:
-        if not type in database[name]["stats"]:
-            database[name]["stats"][type] = 0
+        return True
 
-        database[name]["stats"][type] += i
+    ## Stop the writer once it has written the batches already handed over.
+    ## Failing batches are only retried once more.
+    ## @param timeout Maximum number of seconds to wait for the writer.
+    def stop(self, timeout):
+        self.stopping.set()
+        self.put(None, timeout)
+        self.join(timeout)
 
-## Open the monthly database.
-def open_monthly_db():
-    global db_monthly, last_month
+## Import a database created by the previous versions of the statistics
+## server.
+## @param store StatisticsStore to import into.
+## @param path Path to the shelve database.
+## @param period Period of the database, #PERIOD_ALL or the month.
+def import_shelve(store, path, period):
+    updates = []
 
-    db_monthly = shelve.open("../data/statistics_monthly_{}.db".format(datetime.now().strftime("%Y_%m")), writeback = True)
-    last_month = datetime.now().month
+    with shelve.open(path, flag = "r") as db:
+        for name in db:
+            player = db[name]
 
-## Check if it's time to create a new monthly database.
-def check_monthly_db():
-    if datetime.now().month != last_month:
-        db_monthly.close()
-        open_monthly_db()
+            for type, value in player["stats"].items():
+                updates.append((period, name, type, "", value))
+
+            total = 0
+
+            for monster, value in player["kills"].items():
+                updates.append((period, name, "kills", monster, value))
+                total += value
+
+            if total:
+                updates.append((period, name, "kills", "", total))
+
+    store.add(updates)
+    return len(updates)
+
+## Handles the statistics queries.
+class QueryRequestHandler(BaseHTTPRequestHandler):
+    ## Path to the statistics database.
+    database = DB_PATH
+    ## Per-thread read-only StatisticsStore.
+    local = threading.local()
+
+    def log_message(self, fmt, *args):
+        pass
+
+    ## Acquire the StatisticsStore of the current thread.
+    def get_store(self):
+        store = getattr(self.local, "store", None)
+
+        if store is None:
+            store = self.local.store = StatisticsStore(self.database,
+                                                       read_only = True)
+
+        return store
+
+    ## Send a JSON response.
+    ## @param code HTTP status code.
+    ## @param obj Object to send.
+    def send_json(self, code, obj):
+        data = json.dumps(obj).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        o = urlparse(self.path)
+        params = {key: value[-1] for key, value in parse_qs(o.query).items()}
+
+        try:
+            period = parse_period(params.get("period", PERIOD_ALL))
+
+            if o.path == "/leaderboard":
+                result = self.leaderboard(period, params)
+            elif o.path.startswith("/player/"):
+                result = self.get_store().get_player(
+                    unquote(o.path[len("/player/"):]), period)
+            else:
+                self.send_json(404, {"error": "Unknown query."})
+                return
+        except ValueError as err:
+            self.send_json(400, {"error": str(err)})
+            return
+        except sqlite3.Error as err:
+            self.send_json(503, {"error": str(err)})
+            return
+
+        self.send_json(200, result)
+
+    ## Handle a leaderboard query.
+    ## @param period Period of the leaderboard.
+    ## @param params Query parameters.
+    ## @return The response object.
+    def leaderboard(self, period, params):
+        if "type" not in params:
+            raise ValueError("Missing type.")
+
+        limit = min(int(params.get("limit", 10)), LEADERBOARD_MAX_LIMIT)
+
+        if limit < 1:
+            raise ValueError("Invalid limit.")
+
+        after = params.get("after")
+
+        if after is not None:
+            value, sep, name = after.partition(":")
+
+            if not sep:
+                raise ValueError("Invalid cursor.")
+
+            after = (int(value), name)
+
+        entries = self.get_store().get_leaderboard(params["type"],
+                                                   params.get("key", ""),
+                                                   period, limit, after)
+        result = {
+            "period": period,
+            "entries": [{"name": name, "value": value}
+                        for name, value in entries],
+            "next": None,
+        }
+
+        if len(entries) == limit:
+            result["next"] = "{}:{}".format(entries[-1][1], entries[-1][0])
+
+        return result
+
+## Resolve a period name used in queries.
+## @param period "all", "month", "day", or an explicit period.
+## @return The period.
+def parse_period(period):
+    if period == "month":
+        return datetime.now().strftime("%Y_%m")
+    elif period == "day":
+        return datetime.now().strftime("%Y_%m_%d")
+
+    return period
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+## Start the query interface in a background thread.
+## @param port Port to listen on.
+## @param database Path to the statistics database.
+## @return The HTTP server.
+def start_query_server(port, database):
+    handler = type("QueryRequestHandler", (QueryRequestHandler,), {
+        "database": database,
+        "local": threading.local(),
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    thread = threading.Thread(target = server.serve_forever,
+                              name = "statistics-query")
+    thread.daemon = True
+    thread.start()
+    return server
 
 ## The main loop.
-def main():
-    last_time = time.time()
+## @param s The server's socket.
+## @param writer Writer to hand the accumulated updates to.
+def main(s, writer):
+    aggregator = Aggregator()
+    data = bytearray(65536)
+    last_flush = time.time()
+    s.settimeout(FLUSH_INTERVAL)
+
+    try:
+        while True:
+            try:
+                # Wait for the first datagram of a batch.
+                size = s.recv_into(data)
+            except socket.timeout:
+                size = None
+
+            day = datetime.now().strftime("%Y_%m_%d")
+            s.setblocking(False)
 
-    while True:
-        data, address = s.recvfrom(65565)
-        check_monthly_db()
+            try:
+                # Drain whatever else is already queued in the socket.
+                for _ in range(BATCH_SIZE):
+                    if size is None:
+                        break
 
-        # Get the data.
-        type = data[:data.find(b"\0")].decode()
-        data = data[len(type) + 1:]
+                    try:
+                        aggregator.add(day, *parse_update(data, size))
+                    except ValueError as err:
+                        print("Invalid update: {}".format(err))
 
-        name = data[:data.find(b"\0")].decode()
-        data = data[len(name) + 1:]
+                    try:
+                        size = s.recv_into(data)
+                    except BlockingIOError:
+                        size = None
+            finally:
+                s.settimeout(FLUSH_INTERVAL)
 
-        i = SockList_GetInt64(data)
-        data = data[8:]
+            now = time.time()
 
-        buf = data[:data.find(b"\0")].decode()
-        data = data[len(buf) + 1:]
+            # The receive loop is the only producer, so the put cannot block
+            # if the queue is not full.
+            if aggregator.pending and not writer.queue.full() and \
+                    (now >= last_flush + FLUSH_INTERVAL or
+                     len(aggregator.pending) >= FLUSH_MAX_PENDING):
+                writer.queue.put(aggregator.take())
+                last_flush = now
+    finally:
+        if aggregator.pending:
+            updates = aggregator.take()
 
-        # Store the data.
-        handle_stat(db, type, name, i, buf)
-        handle_stat(db_monthly, type, name, i, buf)
+            if not writer.put(updates, WRITER_SHUTDOWN_TIMEOUT):
+                print("Writer not running, lost {} counters.".format(
+                    len(updates)))
 
-        # Flush cache every hour.
-        if time.time() >= last_time + 60 * 60:
-            db.sync()
-            db_monthly.sync()
-            last_time = time.time()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Statistics server.")
+    parser.add_argument("--port", type = int, default = PORT,
+                        help = "Port to listen on.")
+    parser.add_argument("--database", default = DB_PATH,
+                        help = "Path to the statistics database.")
+    parser.add_argument("--query-port", type = int, default = QUERY_PORT,
+                        help = "Port of the query interface, 0 to disable.")
+    parser.add_argument("--import-shelve", nargs = 2,
+                        metavar = ("PATH", "PERIOD"),
+                        help = "Import a statistics shelve database of the "
+                        "given period ('all' or YYYY_MM) and exit.")
+    parser.add_argument("-v", "--verbose", action = "store_true",
+                        help = "Print how long each flush to the database "
+                        "took.")
+    args = parser.parse_args()
 
-# Need at least Python 3.0.
-if sys.version_info < (3, 0):
-    raise StandardError("Must use Python 3.0 or better.")
+    if args.import_shelve:
+        store = StatisticsStore(args.database)
+        num = import_shelve(store, *args.import_shelve)
+        store.close()
+        print("Imported {} counters.".format(num))
+        sys.exit(0)
 
-try:
     # Create the server's socket.
-    port = 13324
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    s.bind(("", port))
-
-    # Open the databases.
-    db = shelve.open("../data/statistics.db", writeback = True)
-    open_monthly_db()
-    main()
-finally:
-# Cleanup.
-    s.close()
-    db.close()
-    db_monthly.close()
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER_SIZE)
+    s.bind(("", args.port))
+
+    # Make sure the database exists before the writer and the query
+    # interface open it.
+    StatisticsStore(args.database).close()
+
+    writer = Writer(args.database, args.verbose)
+    writer.start()
+
+    if args.query_port:
+        start_query_server(args.query_port, args.database)
+
+    try:
+        main(s, writer)
+    finally:
+        # Cleanup.
+        s.close()
+        writer.stop(WRITER_SHUTDOWN_TIMEOUT)
@@ -1,4 +1,4 @@
-import os, shutil
+import os, shutil, time, types
 
 # Check whether the passed string is an integer.
 # @param s String.
@@ -234,47 +234,212 @@ class MapObjectParser:
 
         return None
 
-# The actual object upgrader.
-class ObjectUpgrader:
+# Apply upgrade functions to an already loaded object. This function is
+# recursive; the object's inventory is upgraded first, the same as when the
+# functions are applied while loading.
+# @param arch Object.
+# @param funcs Upgrade functions to call on the object, in order.
+# @return The upgraded object, None if it should be removed.
+def arch_apply_upgrades(arch, funcs):
+    inv = []
+
+    for arch_inv in arch["inv"]:
+        arch_inv = arch_apply_upgrades(arch_inv, funcs)
+
+        if arch_inv:
+            inv.append(arch_inv)
+
+    arch["inv"] = inv
+
+    for func in funcs:
+        arch = func(arch)
+
+        if not arch:
+            return None
+
+    return arch
+
+# Runs several upgrades over the data files in a single pass. Each file is
+# loaded and saved only once, and the upgrades are applied in the order they
+# were added.
+class UpgradePipeline:
     # Initialize.
     # @param files The files we're going to upgrade.
-    # @param upgrade_func Function we'll call for each object.
-    def __init__(self, files, upgrade_func = None):
+    def __init__(self, files):
         self.files = files
-        self.upgrade_func = upgrade_func
-        self.player_upgrade_func = None
+        # List of the upgrade names and their object and player upgrade
+        # functions.
+        self.upgrades = []
+        # Time spent in each upgrade's functions, in seconds.
+        self.timings = {}
+
+    # Add an upgrade.
+    # @param name Name of the upgrade.
+    # @param upgrade_func Function to call for each object, or None.
+    # @param player_upgrade_func Function to call for each player file,
+    # or None.
+    def add(self, name, upgrade_func = None, player_upgrade_func = None):
+        self.upgrades.append((name, self.timed(name, upgrade_func),
+                              self.timed(name, player_upgrade_func)))
+        self.timings[name] = 0.0
+
+    # Wrap a function to record the time spent in it.
+    # @param name Name of the upgrade the function belongs to.
+    # @param func The function.
+    # @return The wrapped function.
+    def timed(self, name, func):
+        if func is None:
+            return None
+
+        def wrapper(*args):
+            start = time.time()
+
+            try:
+                return func(*args)
+            finally:
+                self.timings[name] += time.time() - start
+
+        return wrapper
+
+    # Create a module to run an upgrade script with. It is the same as this
+    # module, except that ObjectUpgrader adds the script's upgrade to this
+    # pipeline instead of running it immediately.
+    # @param name Name of the upgrade.
+    # @return The module.
+    def script_module(self, name):
+        import Upgrader
+
+        module = types.ModuleType(Upgrader.__name__)
+        module.__dict__.update(Upgrader.__dict__)
+        pipeline = self
+
+        class PipelineObjectUpgrader(ObjectUpgrader):
+            def upgrade(self):
+                pipeline.add(name, self.upgrade_func,
+                             self.player_upgrade_func)
+
+        module.ObjectUpgrader = PipelineObjectUpgrader
+        return module
+
+    # Split the upgrades into stages. Each stage consists of a player
+    # upgrade function (None for the first stage) and the object upgrade
+    # functions of the upgrades up to the next player upgrade function.
+    # An upgrade's object upgrade function goes before its own player
+    # upgrade function, as objects were upgraded while loading the file
+    # and the player upgrade function was called afterwards. This
+    # preserves the order in which the upgrades would be applied if they
+    # were run one after another.
+    # @return List of the stages.
+    def get_stages(self):
+        stages = [(None, [])]
+
+        for name, upgrade_func, player_upgrade_func in self.upgrades:
+            if upgrade_func:
+                stages[-1][1].append(upgrade_func)
+
+            if player_upgrade_func:
+                stages.append((player_upgrade_func, []))
+
+        return stages
+
+    # Upgrade a single file.
+    # @param file The file.
+    # @param stages Stages returned by get_stages().
+    def upgrade_file(self, file, stages):
+        if not os.path.exists(file):
+            return
 
-    def set_player_upgrade_func(self, upgrade_func):
-        self.player_upgrade_func = upgrade_func
+        # The object upgrade functions of the first stage are applied while
+        # loading.
+        first_funcs = stages[0][1]
+        upgrade_func = None
 
-    # Do the actual upgrading.
-    def upgrade(self):
-        for file in self.files:
-            if not os.path.exists(file):
-                continue
+        if first_funcs:
+            upgrade_func = lambda arch: self.apply_funcs(arch, first_funcs)
 
-            fp = open(file, "r")
+        with open(file, "r") as fp:
             # Load object parser.
-            parser = MapObjectParser(fp, self.upgrade_func)
+            parser = MapObjectParser(fp, upgrade_func)
 
             # Ensure this is a data file.
             if not parser.is_data_file():
-                continue
+                return
 
             # Parse the objects.
             arches = parser.load()
-            fp.close()
 
-            # If we found anything, save the objects.
-            if arches:
-                if parser.player and self.player_upgrade_func:
-                    (parser.player, arches) = self.player_upgrade_func(parser.player, arches)
+        # If we found anything, save the objects.
+        if not arches:
+            return
+
+        for player_upgrade_func, funcs in stages[1:]:
+            # All the objects were removed, so there is nothing to save.
+            if not arches:
+                return
+
+            if parser.player:
+                (parser.player, arches) = player_upgrade_func(parser.player,
+                                                              arches)
+
+                if not parser.player:
+                    shutil.rmtree(os.path.dirname(file))
+                    return
+
+            if funcs:
+                arches = [arch for arch in (arch_apply_upgrades(arch, funcs)
+                                            for arch in arches) if arch]
+
+        if not arches:
+            return
+
+        parser.arches = arches
+        tmp_file = file + ".tmp"
+
+        with open(tmp_file, "w") as fp:
+            parser.set_fp(fp)
+            parser.save()
+
+        os.rename(tmp_file, file)
+
+    # Call upgrade functions on an object, without recursing into its
+    # inventory.
+    # @param arch Object.
+    # @param funcs The functions.
+    # @return The upgraded object, None if it should be removed.
+    def apply_funcs(self, arch, funcs):
+        for func in funcs:
+            arch = func(arch)
+
+            if not arch:
+                return None
+
+        return arch
+
+    # Do the actual upgrading.
+    def upgrade(self):
+        if not self.upgrades:
+            return
+
+        stages = self.get_stages()
+
+        for file in self.files:
+            self.upgrade_file(file, stages)
 
-                    if not parser.player:
-                        shutil.rmtree(os.path.dirname(file))
-                        continue
+# The actual object upgrader.
+class ObjectUpgrader:
+    # Initialize.
+    # @param files The files we're going to upgrade.
+    # @param upgrade_func Function we'll call for each object.
+    def __init__(self, files, upgrade_func = None):
+        self.files = files
+        self.upgrade_func = upgrade_func
+        self.player_upgrade_func = None
 
-                fp = open(file, "w")
-                parser.set_fp(fp)
-                parser.save()
-                fp.close()
+    def set_player_upgrade_func(self, upgrade_func):
+        self.player_upgrade_func = upgrade_func
+
+    # Do the actual upgrading.
+    def upgrade(self):
+        pipeline = UpgradePipeline(self.files)
+        pipeline.add(None, self.upgrade_func, self.player_upgrade_func)
+        pipeline.upgrade()
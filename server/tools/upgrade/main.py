@@ -4,10 +4,14 @@
 # more than once, since all upgrades will be done only once, as long as
 # you keep the config.cfg file in the same directory as the script.
 #
-# It will also make a gzipped backup of your whole directory when being
-# ran, just in case anything goes wrong.
+# All the pending upgrade scripts are run together, in a single pass over
+# the data files.
+#
+# It will also make a backup of your whole data directory when being ran,
+# just in case anything goes wrong. Files that haven't changed since the
+# previous backup are hard-linked to it instead of being copied.
 
-import Upgrader, sys, os, tarfile
+import Upgrader, sys, os, shutil, time
 from datetime import datetime
 
 try:
@@ -16,6 +20,59 @@ try:
 except:
     from configparser import ConfigParser
 
+# Prefix of the backup directories.
+BACKUP_PREFIX = "data_backup_"
+
+# Find the most recent backup directory.
+# @param path Directory with the backups.
+# @return Path to the backup, None if there are no backups.
+def find_last_backup(path):
+    backups = sorted(item for item in os.listdir(path)
+                     if item.startswith(BACKUP_PREFIX) and
+                     os.path.isdir(os.path.join(path, item)))
+
+    if not backups:
+        return None
+
+    return os.path.join(path, backups[-1])
+
+# Make a backup of a directory. Files that are the same (size and
+# modification time) as in the previous backup are hard-linked to it.
+# @param src Directory to back up.
+# @param dst Directory to create the backup in.
+# @param previous Previous backup, or None.
+# @return Tuple of the number of copied and hard-linked files.
+def make_backup(src, dst, previous):
+    copied = linked = 0
+
+    for root, dirs, files in os.walk(src):
+        rel = os.path.relpath(root, src)
+        os.makedirs(os.path.join(dst, rel))
+
+        for item in files:
+            src_file = os.path.join(root, item)
+            dst_file = os.path.join(dst, rel, item)
+
+            if previous is not None:
+                prev_file = os.path.join(previous, rel, item)
+
+                try:
+                    st = os.stat(src_file)
+                    prev_st = os.stat(prev_file)
+
+                    if st.st_size == prev_st.st_size and \
+                            int(st.st_mtime) == int(prev_st.st_mtime):
+                        os.link(prev_file, dst_file)
+                        linked += 1
+                        continue
+                except (OSError, AttributeError):
+                    pass
+
+            shutil.copy2(src_file, dst_file)
+            copied += 1
+
+    return (copied, linked)
+
 print("Starting Atrinik server data upgrader...")
 
 # We will need some recursion.
@@ -26,11 +83,6 @@ server_data_path = "../../data"
 # Server dir path.
 server_path = "../.."
 
-print("Making a backup of data directory...")
-tar = tarfile.open(server_path + "/data_backup_" + datetime.now().strftime("%Y%m%d_%H-%M-%S") + ".tar.gz", "w:gz")
-tar.add(server_data_path, os.path.basename(server_data_path))
-tar.close()
-
 print("Reading configuration...")
 config = ConfigParser()
 config.read(['config.cfg'])
@@ -38,14 +90,8 @@ config.read(['config.cfg'])
 if not config.has_section("Upgrades"):
     config.add_section("Upgrades")
 
-print("Traversing files that will be considered for upgrade...")
-# Load the traverser, and get our files.
-traverser = Upgrader.Traverser(server_data_path)
-files = traverser.get_files()
-
 upgrades_path = "upgrades"
-
-print("Running upgrade scripts...")
+pending = []
 
 # Go through upgrade scripts.
 for item in sorted(os.listdir(upgrades_path)):
@@ -57,13 +103,45 @@ for item in sorted(os.listdir(upgrades_path)):
         if dot_pos != -1:
             # Have we ran this script before? If not, run it now.
             if not config.has_option("Upgrades", item[:dot_pos]) or not config.getboolean("Upgrades", item[:dot_pos]):
-                print("\tRunning script: {0}".format(file))
-                execfile(file)
-                config.set("Upgrades", item[:dot_pos], "true")
+                pending.append((item[:dot_pos], file))
+
+if not pending:
+    print("... No pending upgrades.")
+    sys.exit(0)
+
+print("Making a backup of data directory...")
+start = time.time()
+(copied, linked) = make_backup(server_data_path, server_path + "/" + BACKUP_PREFIX + datetime.now().strftime("%Y%m%d_%H-%M-%S"), find_last_backup(server_path))
+print("\tCopied {0} and linked {1} files in {2:.2f} seconds.".format(copied, linked, time.time() - start))
+
+print("Traversing files that will be considered for upgrade...")
+# Load the traverser, and get our files.
+traverser = Upgrader.Traverser(server_data_path)
+files = traverser.get_files()
+pipeline = Upgrader.UpgradePipeline(files)
+
+print("Loading upgrade scripts...")
+
+for (name, file) in pending:
+    print("\tLoading script: {0}".format(file))
+    namespace = dict(globals())
+    namespace["Upgrader"] = pipeline.script_module(name)
+
+    with open(file) as fp:
+        exec(compile(fp.read(), file, "exec"), namespace)
+
+print("Running upgrade scripts...")
+start = time.time()
+pipeline.upgrade()
+print("\tUpgraded {0} files in {1:.2f} seconds.".format(len(files), time.time() - start))
+
+for (name, file) in pending:
+    print("\t{0}: {1:.2f} seconds".format(file, pipeline.timings.get(name, 0.0)))
+    config.set("Upgrades", name, "true")
 
 print("Saving configuration...")
 # Save the config.
-with open("config.cfg", "wb") as configfile:
+with open("config.cfg", "w") as configfile:
     config.write(configfile)
 
 print("... Finished upgrading!")
@@ -0,0 +1,80 @@
+#!/usr/bin/python
+#
+# Tests for the data file upgrader.
+
+import os, shutil, tempfile, unittest
+
+import Upgrader
+
+# A player data file with a single object.
+PLAYER_FILE = "password foo\nendplst\narch sword\nname old\nend\n"
+
+class UpgradePipelineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.dir, "foo"))
+        self.file = os.path.join(self.dir, "foo", "foo.pl")
+
+        with open(self.file, "w") as fp:
+            fp.write(PLAYER_FILE)
+
+        self.calls = []
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def upgrade_func(self, name):
+        def func(arch):
+            self.calls.append((name, "object"))
+            return arch
+
+        return func
+
+    def player_upgrade_func(self, name):
+        def func(player, arches):
+            self.calls.append((name, "player"))
+            return (player, arches)
+
+        return func
+
+    def read(self):
+        with open(self.file, "r") as fp:
+            return fp.read()
+
+    def test_object_before_player(self):
+        upgrader = Upgrader.ObjectUpgrader([self.file],
+                                           self.upgrade_func("a"))
+        upgrader.set_player_upgrade_func(self.player_upgrade_func("a"))
+        upgrader.upgrade()
+        self.assertEqual(self.calls, [("a", "object"), ("a", "player")])
+
+    def test_pipeline_order(self):
+        pipeline = Upgrader.UpgradePipeline([self.file])
+        pipeline.add("a", self.upgrade_func("a"), self.player_upgrade_func("a"))
+        pipeline.add("b", self.upgrade_func("b"))
+        pipeline.add("c", self.upgrade_func("c"), self.player_upgrade_func("c"))
+        pipeline.upgrade()
+        self.assertEqual(self.calls, [("a", "object"), ("a", "player"),
+                                      ("b", "object"), ("c", "object"),
+                                      ("c", "player")])
+
+    def test_empty_not_saved(self):
+        pipeline = Upgrader.UpgradePipeline([self.file])
+        pipeline.add("a", None, self.player_upgrade_func("a"))
+        pipeline.add("b", lambda arch: None)
+        pipeline.upgrade()
+        self.assertEqual(self.read(), PLAYER_FILE)
+
+    def test_upgrade_saved(self):
+        def upgrade_func(arch):
+            arch["attrs"] = [["name", "new"]]
+            return arch
+
+        pipeline = Upgrader.UpgradePipeline([self.file])
+        pipeline.add("a", None, self.player_upgrade_func("a"))
+        pipeline.add("b", upgrade_func)
+        pipeline.upgrade()
+        self.assertEqual(self.read(), PLAYER_FILE.replace("old", "new"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,19 +2,154 @@
 Implementation for the 'Pathfinding Visualizer' dialog.
 """
 
+import functools
 import json
 import math
 import os
 
 from PyQt5 import QtWidgets, QtGui
-from PyQt5.QtCore import QTimer, Qt
-from PyQt5.QtWidgets import QDialog, QGraphicsScene
+from PyQt5.QtCore import QTimer, Qt, QLineF, QRectF
+from PyQt5.QtWidgets import QDialog, QGraphicsScene, QGraphicsItem
 
 from ui.ui_dialog_pathfinding_visualizer import Ui_DialogPathfindingVisualizer
 from ui.model import Model
 import system.utils
 
 
+@functools.lru_cache()
+def grid_lines(tile_size, map_size):
+    """
+    Construct the lines of a map's tile grid.
+
+    :param tile_size: Size of a tile in pixels.
+    :param map_size: Number of tiles on each side of the map.
+    :returns: List of the lines.
+    """
+
+    size = tile_size * map_size
+    lines = []
+
+    for i in range(map_size + 1):
+        lines.append(QLineF(i * tile_size, 0, i * tile_size, size))
+        lines.append(QLineF(0, i * tile_size, size, i * tile_size))
+
+    return lines
+
+
+class MapTileLayer(QGraphicsItem):
+    """
+    Draws the tiles of one map of a pathfinding trace.
+
+    The tile colours are kept in an image with one pixel per tile, which is
+    scaled up when painting, so colouring a tile only changes one pixel
+    instead of needing a scene item for every tile. Tooltips are constructed
+    from the nodes of the hovered tile.
+    """
+
+    def __init__(self, path, level, tile_size, map_size):
+        super(MapTileLayer, self).__init__()
+
+        self.path = path
+        self.tile_size = tile_size
+        self.map_size = map_size
+        self.atrinik_level = level
+        self.atrinik_z_adjust = 0
+        self.nodes = {}
+        self.exits = []
+
+        self.image = QtGui.QImage(map_size, map_size,
+                                  QtGui.QImage.Format_ARGB32)
+        self.image.fill(Qt.transparent)
+
+        self.setZValue(level)
+        self.setToolTip(path)
+        self.setAcceptHoverEvents(True)
+
+    def boundingRect(self):
+        size = self.tile_size * self.map_size
+        # Leave room for the grid lines on the edges.
+        return QRectF(-1, -1, size + 2, size + 2)
+
+    def paint(self, painter, option, widget=None):
+        size = self.tile_size * self.map_size
+        painter.drawImage(QRectF(0, 0, size, size), self.image)
+        painter.setPen(QtGui.QPen())
+        painter.drawLines(grid_lines(self.tile_size, self.map_size))
+
+        if self.exits:
+            painter.setBrush(QtGui.QBrush(QtGui.QColor(170, 60, 255)))
+
+            for x, y in self.exits:
+                painter.drawEllipse(QRectF(x * self.tile_size + 5,
+                                           y * self.tile_size + 5,
+                                           self.tile_size - 5 * 2,
+                                           self.tile_size - 5 * 2))
+
+    def add_node(self, node):
+        """
+        Add a walked node, for the tooltip of its tile.
+
+        :param node: The node.
+        """
+
+        self.nodes.setdefault((node["x"], node["y"]), []).append(node)
+
+        if node["exit"]:
+            self.exits.append((node["x"], node["y"]))
+
+    def set_tile_color(self, x, y, color):
+        """
+        Change the colour of a tile.
+
+        :param x: X coordinate of the tile.
+        :param y: Y coordinate of the tile.
+        :param color: The colour, None to clear the tile.
+        """
+
+        if color is None:
+            color = QtGui.QColor(Qt.transparent)
+
+        self.image.setPixelColor(x, y, color)
+        self.update(QRectF(x * self.tile_size, y * self.tile_size,
+                           self.tile_size, self.tile_size))
+
+    def tile_tooltip(self, x, y):
+        """
+        Construct the tooltip of a tile.
+
+        :param x: X coordinate of the tile.
+        :param y: Y coordinate of the tile.
+        :returns: The tooltip.
+        """
+
+        tooltips = []
+
+        for node in self.nodes.get((x, y), []):
+            tooltip = "Map: {}\nCoordinates: {},{} ({})".format(
+                self.path, node["x"], node["y"],
+                "closed" if node["closed"] else "visited")
+
+            if not math.isnan(node["cost"]):
+                tooltip += "\nCost: {}\nHeuristic: {}\nSum: {}".format(
+                    node["cost"], node["heuristic"], node["sum"])
+
+            tooltips.append(tooltip)
+
+        if not tooltips:
+            return self.path
+
+        return "\n-----\n".join(tooltips)
+
+    def hoverMoveEvent(self, event):
+        x = int(event.pos().x() // self.tile_size)
+        y = int(event.pos().y() // self.tile_size)
+
+        if 0 <= x < self.map_size and 0 <= y < self.map_size:
+            self.setToolTip(self.tile_tooltip(x, y))
+        else:
+            self.setToolTip(self.path)
+
+
 class DialogPathfindingVisualizer(Model, QDialog,
                                   Ui_DialogPathfindingVisualizer):
     TILE_SIZE = 20
@@ -49,8 +184,8 @@ class DialogPathfindingVisualizer(Model, QDialog,
 
         return False
 
-    def getNodeRect(self, node):
-        return self.maps[node["map"]][(node["x"], node["y"])]
+    def setNodeColor(self, node, color):
+        self.maps[node["map"]].set_tile_color(node["x"], node["y"], color)
 
     def pathfindingVisualizeTimerCallback(self):
         if not self.buttonPause.isEnabled():
@@ -104,11 +239,11 @@ class DialogPathfindingVisualizer(Model, QDialog,
             return
 
         if node["closed"]:
-            brush = QtGui.QBrush(QtGui.QColor(175, 238, 238))
+            color = QtGui.QColor(175, 238, 238)
         else:
-            brush = QtGui.QBrush(QtGui.QColor(152, 251, 152))
+            color = QtGui.QColor(152, 251, 152)
 
-        self.maps[node["map"]][(node["x"], node["y"])].setBrush(brush)
+        self.setNodeColor(node, color)
 
         if self.checkBoxAutoAdvance.isChecked():
             coords = system.utils.MapCoords(os.path.basename(node["map"]))
@@ -126,15 +261,14 @@ class DialogPathfindingVisualizer(Model, QDialog,
         self.level = None
         self.scene.clear()
         self.nodes = []
+        self.maps = {}
         self.coords = {}
         self.nodes_idx = 0
-        self.ellipses = []
         self.lines = []
-        self.rects = []
 
         num_visited = 0
         num_closed = 0
-        nodes_unique = []
+        nodes_unique = set()
         levels = {}
 
         for path in self.data["nodes"]:
@@ -144,76 +278,32 @@ class DialogPathfindingVisualizer(Model, QDialog,
             x *= self.MAP_SIZE * self.TILE_SIZE
             y = coords.pos[1]
             y *= self.MAP_SIZE * self.TILE_SIZE
-            self.maps[path] = {}
             self.coords[path] = (x, y)
-            rect = self.scene.addRect(x, y, self.MAP_SIZE * self.TILE_SIZE,
-                                      self.MAP_SIZE * self.TILE_SIZE)
-            rect.setZValue(coords.pos[2])
-            rect.setToolTip(path)
-            rect.atrinik_level = coords.pos[2]
-            rect.atrinik_z_adjust = 0
-            self.rects.append(rect)
-
-            for xt in range(self.MAP_SIZE):
-                for yt in range(self.MAP_SIZE):
-                    self.maps[path][(xt, yt)] = self.scene.addRect(
-                        x + xt * self.TILE_SIZE, y + yt * self.TILE_SIZE,
-                        self.TILE_SIZE, self.TILE_SIZE)
-                    self.maps[path][(xt, yt)].setZValue(coords.pos[2] + 0.01)
-                    self.maps[path][(xt, yt)].atrinik_level = coords.pos[2]
-                    self.maps[path][(xt, yt)].atrinik_z_adjust = 0.01
+
+            layer = MapTileLayer(path, coords.pos[2], self.TILE_SIZE,
+                                 self.MAP_SIZE)
+            layer.setPos(x, y)
+            self.scene.addItem(layer)
+            self.maps[path] = layer
 
             for node in self.data["nodes"][path]["walls"]:
                 node["map"] = path
-                self.getNodeRect(node).setBrush(
-                    QtGui.QBrush(QtGui.QColor(128, 128, 128)))
+                self.setNodeColor(node, QtGui.QColor(128, 128, 128))
 
             for node in self.data["nodes"][path]["walked"]:
                 node["map"] = path
                 self.nodes.append(node)
+                layer.add_node(node)
 
-                nodes_unique.append((path, node["x"], node["y"]))
+                nodes_unique.add((path, node["x"], node["y"]))
 
                 if node["closed"]:
                     num_closed += 1
                 else:
                     num_visited += 1
 
-                if node["exit"]:
-                    brush = QtGui.QBrush(QtGui.QColor(170, 60, 255))
-                    e = self.scene.addEllipse(x + node["x"] * self.TILE_SIZE + 5,
-                                              y + node["y"] * self.TILE_SIZE + 5,
-                                              self.TILE_SIZE - 5 * 2,
-                                              self.TILE_SIZE - 5 * 2,
-                                              brush=brush)
-                    e.setZValue(coords.pos[2] + 0.05)
-                    e.atrinik_level = coords.pos[2]
-                    e.atrinik_z_adjust = 0.05
-                    self.ellipses.append(e)
-
-                rect = self.getNodeRect(node)
-                tooltip = rect.toolTip()
-
-                if tooltip:
-                    tooltip += "\n-----\n"
-
-                tooltip += "Map: {}\nCoordinates: {},{} ({})".format(path,
-                                                                     node["x"],
-                                                                     node["y"],
-                                                                     "closed" if
-                                                                     node[
-                                                                         "closed"] else "visited")
-
-                if not math.isnan(node["cost"]):
-                    tooltip += "\nCost: {}\nHeuristic: {}\nSum: {}".format(
-                        node["cost"], node["heuristic"], node["sum"])
-
-                rect.setToolTip(tooltip)
-
-        self.getNodeRect(self.data["start"]).setBrush(
-            QtGui.QBrush(QtGui.QColor(0, 221, 0)))
-        self.getNodeRect(self.data["goal"]).setBrush(
-            QtGui.QBrush(QtGui.QColor(238, 68, 0)))
+        self.setNodeColor(self.data["start"], QtGui.QColor(0, 221, 0))
+        self.setNodeColor(self.data["goal"], QtGui.QColor(238, 68, 0))
 
         self.nodes.sort(key=lambda node: node["id"])
 
@@ -234,7 +324,7 @@ class DialogPathfindingVisualizer(Model, QDialog,
                                    "unique nodes <b>{}</b>, path length is <b>{}</b>".format(
                 self.data["time_taken"], self.data["num_searched"],
                 num_visited + num_closed, num_visited, num_closed,
-                len(set(nodes_unique)), len(self.data["path"])))
+                len(nodes_unique), len(self.data["path"])))
         else:
             self.timeTaken.setText("")
 
@@ -251,7 +341,7 @@ class DialogPathfindingVisualizer(Model, QDialog,
         self.nodes_idx -= 1
 
         node = self.nodes[self.nodes_idx]
-        self.maps[node["map"]][(node["x"], node["y"])].setBrush(QtGui.QBrush())
+        self.setNodeColor(node, None)
 
     def buttonPauseTrigger(self):
         if self.timer.isActive():
@@ -303,15 +393,8 @@ class DialogPathfindingVisualizer(Model, QDialog,
         except ValueError:
             self.level = None
 
-        for path in self.maps:
-            for pos in self.maps[path]:
-                self.adjust_item_z(self.maps[path][pos])
-
-        for ellipse in self.ellipses:
-            self.adjust_item_z(ellipse)
+        for layer in self.maps.values():
+            self.adjust_item_z(layer)
 
         for line in self.lines:
             self.adjust_item_z(line)
-
-        for rect in self.rects:
-            self.adjust_item_z(rect)
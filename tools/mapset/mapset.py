@@ -26,7 +26,7 @@
 ## @file
 ## Script to generate tiled mapsets, or extend an already existing mapset.
 
-import os, sys, re, shutil, time, random, getopt
+import os, sys, re, shutil, time, random, getopt, multiprocessing
 
 ## Similar to C/C++ getline, waits for the provided stream to finish
 ## a line (or anything else delimited by 'delimiter').
@@ -209,134 +209,258 @@ def coordinate_int(s):
     # Transform the letters into an integer.
     return -(((ord(s[:1]) - 97) * 26) + ((ord(s[1:]) - 97))) - 1
 
+## Width and height of the generated maps.
+MAP_SIZE = 24
+
+## Regex matching the map_name_xxyy file name format, capturing the base
+## name (with the trailing underscore) and the two coordinates.
+re_map_name = re.compile(r"^(.+_)([0-9a-z]{2})([0-9a-z]{2})$")
+
+## The X/Y lines that follow the archetype line of each tile of a
+## generated map, in the order the tiles are written out.
+tile_suffixes = []
+
+for arch_x in range(MAP_SIZE):
+    for arch_y in range(MAP_SIZE):
+        tile_suffixes.append("".join([
+            "x {0}\n".format(arch_x) if arch_x else "",
+            "y {0}\n".format(arch_y) if arch_y else "",
+            "end\n",
+        ]))
+
+## Construct the header of a generated map from the options.
+## @return The header, including its closing 'end' line.
+def map_header():
+    lines = [
+        "arch map\n",
+        "name {0}\n".format(options["name"]),
+        "msg\n",
+        "Created:  {0} {1}\n".format(time.strftime("%Y-%m-%d"), options["author"]),
+        "endmsg\n",
+        "width {0}\n".format(MAP_SIZE),
+        "height {0}\n".format(MAP_SIZE),
+        "difficulty {0}\n".format(options["difficulty"]),
+    ]
+
+    # Region...
+    if options["region"] != "none":
+        lines.append("region {0}\n".format(options["region"]))
+
+    # Outdoor?
+    if options["outdoor"][:1] == "y":
+        lines.append("outdoor 1\n")
+
+    # Darkness.
+    if options["darkness"] != "-1":
+        lines.append("darkness {0}\n".format(options["darkness"]))
+
+    # Background music.
+    if options["bg_music"] != "none":
+        lines.append("bg_music {0}\n".format(options["bg_music"]))
+
+    # Weather.
+    if options["weather"] != "none":
+        lines.append("weather {0}\n".format(options["weather"]))
+
+    lines.append("end\n")
+    return "".join(lines)
+
+## Write out a single generated map.
+##
+## Runs in the worker processes of generate_maps(), so it only uses its
+## arguments and not the global options.
+## @param job Tuple of the path, the map header, the list of archetype
+## lines to tile the map with and the random seed to use.
+## @return The path.
+def generate_map(job):
+    (path, header, archetypes, seed) = job
+    parts = [header]
+
+    # If list of archetypes was provided, tile the map. Each worker
+    # gets its own seed, as forked workers would otherwise all share the
+    # parent's random state and generate identical maps.
+    if archetypes:
+        choice = random.Random(seed).choice
+
+        for suffix in tile_suffixes:
+            parts.append(choice(archetypes))
+            parts.append(suffix)
+
+    # Write out the whole map at once.
+    f = open(path, "w")
+    f.write("".join(parts))
+    f.close()
+
+    return path
+
 ## Generate maps.
 ## @param directory What directory we're working in.
 ## @param start X/Y coordinate modifier.
-def generate_maps(directory, start):
+## @param jobs Number of processes to generate the maps with, None to
+## use the number of CPUs.
+## @return Number of generated maps.
+def generate_maps(directory, start, jobs = None):
     # Get the size.
     (width, height) = options["size"]
-    # List of archetypes we can use.
-    archetypes = [] if options["archetype"] == "nothing" else options["archetype"].split(",")
+    # List of archetype lines we can use.
+    archetypes = [] if options["archetype"] == "nothing" else ["arch {0}\n".format(arch.strip()) for arch in options["archetype"].split(",")]
+    header = map_header()
+    # Files in the directory, so we don't need to check every map separately.
+    existing = set(os.listdir(directory))
+    todo = []
 
     for xt in range(width):
         for yt in range(height):
             x = xt + start[0]
             y = yt + start[1]
             # Construct the new path.
-            path = "{0}/{1}_{2}{3}".format(directory, options["filename"], coordinate_str(x), coordinate_str(y))
+            name = "{0}_{1}{2}".format(options["filename"], coordinate_str(x), coordinate_str(y))
+            path = os.path.join(directory, name)
 
             # Exists already?
-            if os.path.exists(path):
+            if name in existing:
                 print("Warning: map {0} already exists, not creating.".format(path))
                 continue
 
-            # Write out the map information.
-            f = open(path, "wb")
-            f.write("arch map\n")
-            f.write("name {0}\n".format(options["name"]))
-            f.write("msg\n")
-            f.write("Created:  {0} {1}\n".format(time.strftime("%Y-%m-%d"), options["author"]))
-            f.write("endmsg\n")
-            f.write("width 24\n")
-            f.write("height 24\n")
-            f.write("difficulty {0}\n".format(options["difficulty"]))
+            todo.append((path, header, archetypes, random.getrandbits(32)))
 
-            # Region...
-            if options["region"] != "none":
-                f.write("region {0}\n".format(options["region"]))
+    # Not worth starting the worker processes for a few maps.
+    if jobs == 1 or len(todo) < 2:
+        for job in todo:
+            generate_map(job)
+    else:
+        jobs = jobs or multiprocessing.cpu_count()
+        pool = multiprocessing.Pool(jobs)
 
-            # Outdoor?
-            if options["outdoor"][:1] == "y":
-                f.write("outdoor 1\n")
+        try:
+            pool.map(generate_map, todo, chunksize = max(1, len(todo) // (jobs * 4)))
+        finally:
+            pool.close()
+            pool.join()
+
+    return len(todo)
+
+## Build an index of the maps inside directory.
+##
+## Only the map headers are read; a file is a map if its name matches the
+## map_name_xxyy format and it starts with a map header.
+## @param directory The directory to index.
+## @return Dictionary mapping tuples of the base name and the X/Y
+## coordinates to tuples of the file name and the lines of the header.
+def index_maps(directory):
+    maps = {}
 
-            # Darkness.
-            if options["darkness"] != "-1":
-                f.write("darkness {0}\n".format(options["darkness"]))
+    for f in os.listdir(directory):
+        # Hidden file.
+        if f.startswith("."):
+            continue
 
-            # Background music.
-            if options["bg_music"] != "none":
-                f.write("bg_music {0}\n".format(options["bg_music"]))
+        # Must match map_name_xxyy format.
+        match = re_map_name.match(f)
 
-            # Weather.
-            if options["weather"] != "none":
-                f.write("weather {0}\n".format(options["weather"]))
+        if not match:
+            continue
 
-            f.write("end\n")
+        # Get the integer coordinates, and make sure they are in the
+        # canonical form, so that each coordinate maps to one file name.
+        coord_x = coordinate_int(match.group(2))
+        coord_y = coordinate_int(match.group(3))
 
-            # If list of archetypes was provided, tile the map.
-            if archetypes:
-                for arch_x in range(24):
-                    for arch_y in range(24):
-                        f.write("arch {0}\n".format(random.choice(archetypes).strip()))
+        if coordinate_str(coord_x) != match.group(2) or coordinate_str(coord_y) != match.group(3):
+            continue
 
-                        if arch_x:
-                            f.write("x {0}\n".format(arch_x))
+        path = os.path.join(directory, f)
 
-                        if arch_y:
-                            f.write("y {0}\n".format(arch_y))
+        # Not a file.
+        if not os.path.isfile(path):
+            continue
 
-                        f.write("end\n")
+        # Read the header, up to and including its 'end' line.
+        header = []
+        fp = open(path, "r")
 
-            f.close()
+        for line in fp:
+            # Not a map file, go on.
+            if not header and line != "arch map\n":
+                break
 
-## Connect all maps inside directory.
-## @param directory The directory to work in.
-def connect_maps(directory):
-    for f in os.listdir(directory):
-        path = os.path.join(directory, f)
+            header.append(line)
 
-        # Hidden file or not a file.
-        if f.startswith(".") or not os.path.isfile(path):
-            continue
+            if line == "end\n":
+                break
 
-        # Must match map_name_xxyy format.
-        if not re.match("(.+)_(.+){4}", f):
+        fp.close()
+
+        # Not a map file, or the header is incomplete.
+        if not header or header[-1] != "end\n":
             continue
 
-        # Store the file's base name without coordinates.
-        fname = f[:-4]
-        # Read the file and store the lines in memory.
-        f = open(path, "rb")
-        lines = f.readlines()
-        f.close()
+        maps[(match.group(1), coord_x, coord_y)] = (f, header)
 
-        # Not a map file, go on.
-        if lines[0] != "arch map\n":
-            continue
+    return maps
 
-        # Get the integer coordinates.
-        coords = path[-4:]
-        coord_x = coordinate_int(coords[:2])
-        coord_y = coordinate_int(coords[2:])
-        # Marks that we have written out the tile path information.
-        tile_written = False
+## Construct the header of a map with the tile paths to its neighbours.
+## @param maps The index of the maps, as returned by index_maps().
+## @param key The map's key in the index.
+## @return List of the header lines.
+def connected_header(maps, key):
+    (fname, coord_x, coord_y) = key
+    tile_paths = []
+
+    for tile in range(1, len(tiles)):
+        tiled = maps.get((fname, coord_x + tiles[tile][0], coord_y + tiles[tile][1]))
+
+        # The neighbour exists, so we have a valid tiled map.
+        if tiled:
+            tile_paths.append("tile_path_{0} {1}\n".format(tile, tiled[0]))
+
+    lines = []
+    tile_written = False
+
+    for line in maps[key][1]:
+        # Not written yet and this is either the end of the map header
+        # or we found a tile_path line.
+        if not tile_written and (line == "end\n" or line.startswith("tile_path_")):
+            # So we don't write them out twice.
+            tile_written = True
+            lines += tile_paths
 
-        # Open the file and truncate it.
-        f = open(path, "wb")
+        # Ignore tile_path lines.
+        if not line.startswith("tile_path_"):
+            lines.append(line)
 
-        # Write out the lines.
-        for line in lines:
-            # Not written yet and this is either the end of the map header
-            # or we found a tile_path line.
-            if not tile_written and (line == "end\n" or line.startswith("tile_path_")):
-                # So we don't write them out twice.
-                tile_written = True
+    return lines
 
-                # Write out the tile paths.
-                for tile in range(1, len(tiles)):
-                    # Construct the base map file name.
-                    tiled_map = "{0}{1}{2}".format(fname, coordinate_str(coord_x + tiles[tile][0]), coordinate_str(coord_y + tiles[tile][1]))
-                    tiled_path = os.path.join(directory, tiled_map)
+## Connect all maps inside directory.
+##
+## The tile paths are computed from an index of the directory, and only
+## the maps whose header changes are rewritten.
+## @param directory The directory to work in.
+## @return Tuple of the number of rewritten maps and the number of maps.
+def connect_maps(directory):
+    maps = index_maps(directory)
+    changed = 0
 
-                    # The map exists and is a file, so we have a valid tiled map.
-                    if os.path.exists(tiled_path) and os.path.isfile(tiled_path):
-                        f.write("tile_path_{0} {1}\n".format(tile, tiled_map))
+    for key in sorted(maps):
+        (f, header) = maps[key]
+        lines = connected_header(maps, key)
 
-            # Ignore tile_path lines.
-            if not line.startswith("tile_path_"):
-                f.write(line)
+        if lines == header:
+            continue
+
+        path = os.path.join(directory, f)
+        # Read the whole file and replace its header.
+        fp = open(path, "r")
+        contents = fp.readlines()
+        fp.close()
+        contents[:len(header)] = lines
 
-        f.close()
+        fp = open(path, "w")
+        fp.write("".join(contents))
+        fp.close()
+        changed += 1
+
+    return (changed, len(maps))
 
 ## Print usage.
 def usage():
@@ -344,59 +468,8 @@ def usage():
     print("\t-h, --help: Show this help.")
     print("\t-e, --extend: Extend mode.")
     print("\t-r path, --reconnect=path: Specify a directory of which to reconnect tiled paths.")
+    print("\t-j num, --jobs=num: Number of processes to generate maps with (default: number of CPUs).")
 
-# Try to parse our command line options.
-try:
-    opts, args = getopt.getopt(sys.argv[1:], "her:", ["help", "extend", "reconnect="])
-except getopt.GetoptError as err:
-    # Invalid option, show the error, print usage, and exit.
-    print(err)
-    usage()
-    sys.exit(2)
-
-# The default options.
-extend = False
-reconnect = None
-
-# Parse options.
-for o, a in opts:
-    if o in ("-h", "--help"):
-        usage()
-        sys.exit()
-    elif o in ("-e", "--extend"):
-        extend = True
-    elif o in ("-r", "--reconnect"):
-        reconnect = a
-
-## Default questions asked in both modes (extending and creating).
-def_questions = [
-    ["size", "", "Enter the size of the mapset (for example, '10x5' [10 = width, 5 = height]):"],
-    ["author", "", "Enter the author (name that appears in the map's message in /mapinfo):"],
-    ["archetype", "nothing", "Enter the (comma delimited) archetype(s) with which to fill the created maps (default: '{0}'):"],
-    ["difficulty", "1", "Enter the difficulty used across all created maps (default: '{0}'):"],
-    ["darkness", "-1", "Enter the darkness used across all created maps ('-1' = '7' = full light, '0' = full darkness, default: '{0}'):"],
-    ["outdoor", "no", "Is the mapset outdoor ('yes'/'no', default: '{0}')?:"],
-    ["region", "world", "Enter the region the mapset is in ('world', 'none', default: '{0}'):"],
-    ["bg_music", "none", "Enter the background music used across all created maps ('cave.xm', 'none', default: '{0}'):"],
-    ["weather", "none", "Enter the weather used across all created maps ('snow', 'none', default: '{0}'):"],
-]
-
-# Not extending, so ask questions related to the map creating.
-if not extend:
-    questions = [
-        ["name", "", "Enter the name of the mapset (map name for the created maps, for example, 'Ancient Forest'):"],
-        ["filename", "", "Enter the base file name (for example, 'world'; default: '{0}'):"],
-    ]
-# Extending, we need to know where to start extending and the direction.
-else:
-    questions = [
-        ["name", "", "Enter the name of the mapset (map name for the created maps, for example, 'Ancient Forest'):"],
-        ["extend_start", "", "Enter the file name where to start extending (for example, '../../maps/shattered_islands/world_0101'):"],
-        ["direction", "", "Direction which to extend into (for example, 'south', 'west', 'northeast', etc):"],
-    ]
-
-# Initialize Options.
-options = Options(questions + def_questions)
 # Initialize Tiles.
 tiles = Tiles()
 
@@ -408,7 +481,9 @@ def main():
             print("Error: Directory {0} doesn't exist or is not a directory.".format(reconnect))
             return
 
-        connect_maps(reconnect)
+        print("Connecting maps...")
+        (changed, total) = connect_maps(reconnect)
+        print("Rewrote {0} of {1} maps.".format(changed, total))
         return
 
     # Ask the user some questions...
@@ -452,10 +527,70 @@ def main():
         start = (coord_x + tile_x, coord_y + tile_y)
 
     print("Generating maps...")
-    generate_maps(directory, start)
-    print("Maps saved to {0}.".format(directory))
-#    print("Connecting maps...")
-#    connect_maps(directory)
-#    print("Done!")
+    generated = generate_maps(directory, start, jobs)
+    print("{0} maps saved to {1}.".format(generated, directory))
+    print("Connecting maps...")
+    (changed, total) = connect_maps(directory)
+    print("Rewrote {0} of {1} maps.".format(changed, total))
+    print("Done!")
+
+# Only run when executed as a script, not when the map generating worker
+# processes import this module.
+if __name__ == "__main__":
+    # Try to parse our command line options.
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "her:j:", ["help", "extend", "reconnect=", "jobs="])
+    except getopt.GetoptError as err:
+        # Invalid option, show the error, print usage, and exit.
+        print(err)
+        usage()
+        sys.exit(2)
+
+    # The default options.
+    extend = False
+    reconnect = None
+    jobs = None
+
+    # Parse options.
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            usage()
+            sys.exit()
+        elif o in ("-e", "--extend"):
+            extend = True
+        elif o in ("-r", "--reconnect"):
+            reconnect = a
+        elif o in ("-j", "--jobs"):
+            jobs = int(a)
+
+    ## Default questions asked in both modes (extending and creating).
+    def_questions = [
+        ["size", "", "Enter the size of the mapset (for example, '10x5' [10 = width, 5 = height]):"],
+        ["author", "", "Enter the author (name that appears in the map's message in /mapinfo):"],
+        ["archetype", "nothing", "Enter the (comma delimited) archetype(s) with which to fill the created maps (default: '{0}'):"],
+        ["difficulty", "1", "Enter the difficulty used across all created maps (default: '{0}'):"],
+        ["darkness", "-1", "Enter the darkness used across all created maps ('-1' = '7' = full light, '0' = full darkness, default: '{0}'):"],
+        ["outdoor", "no", "Is the mapset outdoor ('yes'/'no', default: '{0}')?:"],
+        ["region", "world", "Enter the region the mapset is in ('world', 'none', default: '{0}'):"],
+        ["bg_music", "none", "Enter the background music used across all created maps ('cave.xm', 'none', default: '{0}'):"],
+        ["weather", "none", "Enter the weather used across all created maps ('snow', 'none', default: '{0}'):"],
+    ]
+
+    # Not extending, so ask questions related to the map creating.
+    if not extend:
+        questions = [
+            ["name", "", "Enter the name of the mapset (map name for the created maps, for example, 'Ancient Forest'):"],
+            ["filename", "", "Enter the base file name (for example, 'world'; default: '{0}'):"],
+        ]
+    # Extending, we need to know where to start extending and the direction.
+    else:
+        questions = [
+            ["name", "", "Enter the name of the mapset (map name for the created maps, for example, 'Ancient Forest'):"],
+            ["extend_start", "", "Enter the file name where to start extending (for example, '../../maps/shattered_islands/world_0101'):"],
+            ["direction", "", "Direction which to extend into (for example, 'south', 'west', 'northeast', etc):"],
+        ]
+
+    # Initialize Options.
+    options = Options(questions + def_questions)
 
-main()
+    main()
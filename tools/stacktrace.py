@@ -1,34 +1,233 @@
 #!/usr/bin/python
-import sys, re, subprocess
+"""
+Symbolises crash stacktraces using addr2line.
 
-def main ():
-    if len(sys.argv) < 3:
-        print("Usage: ./stacktrace.py <executable> <stacktrace file>")
-        return
+All the addresses of the given stacktrace files are resolved up front, with
+a handful of addr2line processes running in parallel. Resolved addresses are
+cached, so addresses shared between stacktraces are only resolved once.
 
-    with open(sys.argv[2], "r") as f:
-        for line in f:
-            line = line.strip()
-            address = None
+Usage::
 
-            if line.endswith("]"):
-                address = line.split()[-1][1:-1]
-            else:
-                match = re.match(r"\d+:\s*(.+)\s*", line, re.I)
+    ./stacktrace.py <executable> <stacktrace file or directory>...
+    ./stacktrace.py --group <executable> <directory>
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Maximum number of addresses to pass to one addr2line process.
+ADDR2LINE_CHUNK_SIZE = 1000
+
+_RE_FRAME = re.compile(r"\d+:\s*(.+)\s*")
+
+
+def parse_address(line):
+    """
+    Extract the address from a line of a stacktrace.
+
+    :param line: The line, with whitespace stripped.
+    :type line: str
+    :returns: The address, None if the line doesn't have one.
+    :rtype: str or None
+    """
+
+    if line.endswith("]"):
+        return line.split()[-1][1:-1]
+
+    match = _RE_FRAME.match(line)
+
+    if match:
+        return match.group(1)
+
+    return None
+
+
+class Symboliser(object):
+    """
+    Resolves addresses of an executable, caching the results.
+    """
+
+    def __init__(self, executable, jobs=None):
+        """
+        :param executable: Path to the executable.
+        :type executable: str
+        :param jobs: Maximum number of addr2line processes to run at once.
+        :type jobs: int or None
+        """
+
+        self.executable = executable
+        self.jobs = jobs or os.cpu_count() or 1
+        self.cache = {}
+
+    def _addr2line(self, addresses):
+        output = subprocess.check_output(["addr2line", "-e", self.executable,
+                                          "-f", "-p"] + addresses)
+        lines = output.decode("ascii", "replace").splitlines()
+
+        if len(lines) != len(addresses):
+            raise RuntimeError("addr2line returned {} lines for {} "
+                               "addresses".format(len(lines), len(addresses)))
+
+        return zip(addresses, lines)
+
+    def resolve(self, addresses):
+        """
+        Resolve addresses that are not in the cache yet.
+
+        :param addresses: The addresses.
+        :type addresses: iterable
+        """
+
+        missing = list(OrderedDict.fromkeys(
+            address for address in addresses if address not in self.cache))
+
+        if not missing:
+            return
+
+        # Spread the addresses over the workers, but don't exceed the chunk
+        # size for one process.
+        size = max(1, min(ADDR2LINE_CHUNK_SIZE,
+                          -(-len(missing) // self.jobs)))
+        chunks = [missing[i:i + size] for i in range(0, len(missing), size)]
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            for results in executor.map(self._addr2line, chunks):
+                self.cache.update(results)
+
+    def symbolise(self, address):
+        """
+        Acquire the symbolised form of an address.
+
+        :param address: The address.
+        :type address: str
+        :returns: Function name and source location of the address.
+        :rtype: str
+        """
+
+        if address not in self.cache:
+            self.resolve([address])
+
+        return self.cache[address]
 
-                if match:
-                    address = match.group(1)
 
-            if address == None:
+def read_stacktrace(path):
+    """
+    Read a stacktrace file.
+
+    :param path: Path to the file.
+    :type path: str
+    :returns: List of tuples of the lines and their addresses.
+    :rtype: list
+    """
+
+    with open(path, "r") as f:
+        return [(line, parse_address(line))
+                for line in (line.strip() for line in f)]
+
+
+def find_stacktraces(paths):
+    """
+    Find the stacktrace files to process.
+
+    :param paths: Files and directories to process.
+    :type paths: list
+    :returns: List of paths to the files.
+    :rtype: list
+    """
+
+    files = []
+
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+
+        for root, dirs, names in os.walk(path):
+            dirs.sort()
+            files.extend(os.path.join(root, name) for name in sorted(names)
+                         if not name.startswith("."))
+
+    return files
+
+
+def group_crashes(stacktraces, symboliser):
+    """
+    Group stacktraces with an identical symbolised backtrace.
+
+    Only the function names and source locations are compared, so the same
+    crash is grouped together even if it happened at different addresses.
+
+    :param stacktraces: Dictionary of file paths and their parsed
+                        stacktraces.
+    :type stacktraces: dict
+    :param symboliser: Symboliser to use.
+    :type symboliser: Symboliser
+    :returns: List of tuples of the backtrace and the paths of the files
+              with that backtrace, most frequent crash first.
+    :rtype: list
+    """
+
+    groups = OrderedDict()
+
+    for path, lines in stacktraces.items():
+        backtrace = tuple(symboliser.symbolise(address)
+                          for _, address in lines if address is not None)
+        groups.setdefault(backtrace, []).append(path)
+
+    return sorted(groups.items(), key=lambda group: -len(group[1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Symbolise stacktraces.")
+    parser.add_argument("executable", help="The crashed executable.")
+    parser.add_argument("paths", nargs="+",
+                        help="Stacktrace files or directories of them.")
+    parser.add_argument("-j", "--jobs", type=int,
+                        help="Number of addr2line processes to run at once.")
+    parser.add_argument("-g", "--group", action="store_true",
+                        help="Group identical crashes instead of printing "
+                        "every stacktrace.")
+    args = parser.parse_args()
+
+    files = find_stacktraces(args.paths)
+    stacktraces = OrderedDict((path, read_stacktrace(path)) for path in files)
+
+    symboliser = Symboliser(args.executable, args.jobs)
+    symboliser.resolve(address for lines in stacktraces.values()
+                       for _, address in lines if address is not None)
+
+    if args.group:
+        for backtrace, paths in group_crashes(stacktraces, symboliser):
+            print("{} crash(es):".format(len(paths)))
+
+            for path in paths:
+                print("    {}".format(path))
+
+            for frame in backtrace:
+                print("  {}".format(frame))
+
+            print("")
+
+        return
+
+    for path, lines in stacktraces.items():
+        if len(files) > 1:
+            print("==> {} <==".format(path))
+
+        for line, address in lines:
+            if address is None:
                 print(line)
-                continue
+            else:
+                print(symboliser.symbolise(address))
 
-            process = subprocess.Popen(["addr2line", "-e", sys.argv[1], "-f",
-                    "-p", address], stdout = subprocess.PIPE)
-            (output, err) = process.communicate()
-            exit_code = process.wait()
+        if len(files) > 1:
+            print("")
 
-            print(output.strip().decode("ascii"))
 
 if __name__ == "__main__":
     main()